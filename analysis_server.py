@@ -0,0 +1,100 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Position analysis server for the Connect 4 game.
+
+Answers "best move and score" queries for positions sent as lines of JSON over
+a local TCP or Unix socket (see upo.connect4.analysis), e.g.:
+
+    $ echo '{"id": 1, "position": "3342", "time": 0.5}' | nc localhost 7654
+"""
+
+
+import argparse
+import asyncio
+import os
+import sys
+import upo.connect4.analysis
+import upo.connect4.notation
+import upo.utils
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Position analysis server")
+
+    parser.add_argument('--book', dest='book', type=str,
+                        help='A file of JSON lines with the analysis results to load at start-up and to save at shutdown.', default=None)
+    parser.add_argument('--evalfunc', dest='eval_func', type=str,
+                        help='The fully qualified name of the evaluation function to use (defaults to a linear evaluation function, see upo.connect4.evalbuilder).', default=None)
+    parser.add_argument('--host', dest='host', type=str,
+                        help='The address where to listen for TCP connections.', default='127.0.0.1')
+    parser.add_argument('-l', '--layout', dest='layout', type=int, nargs=2,
+                        help='A pair of two numbers specifying the width and height (in number of tiles) of the game board.', default=[7, 6])
+    parser.add_argument('--max-time', dest='max_time', type=float,
+                        help='The maximum time budget (in seconds) a request can ask for.', default=upo.connect4.analysis.MAX_TIME_BUDGET)
+    parser.add_argument('-n', '--num-agents', dest='num_agents', type=int,
+                        help='The number of agents of the game.', default=2)
+    parser.add_argument('-p', '--port', dest='port', type=int,
+                        help='The TCP port where to listen.', default=7654)
+    parser.add_argument('-t', '--time', dest='time', type=float,
+                        help='The time budget (in seconds) of requests that do not specify one.', default=upo.connect4.analysis.DEFAULT_TIME_BUDGET)
+    parser.add_argument('--tt-size', dest='tt_size', type=int,
+                        help='The maximum number of entries of the transposition table of each agent.', default=upo.connect4.analysis.DEFAULT_TT_SIZE)
+    parser.add_argument('-u', '--unix', dest='unix', type=str,
+                        help='The path of a Unix socket where to listen (instead of a TCP port).', default=None)
+
+    args = parser.parse_args()
+
+    # Check arguments consistency
+    if args.num_agents < 2:
+        parser.error('Number of agents must be at least 2')
+    if min(args.layout) < 4:
+        parser.error('Board must be at least 4x4 large')
+    if args.layout[0] > upo.connect4.notation.MAX_WIDTH:
+        parser.error('Board must be at most ' + str(upo.connect4.notation.MAX_WIDTH) + ' columns wide')
+    if args.time <= 0 or args.max_time <= 0:
+        parser.error('Time budgets must be positive numbers')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    eval_func = None
+    if args.eval_func is not None:
+        eval_func = upo.utils.import_lib(args.eval_func)
+    analyzer = upo.connect4.analysis.Analyzer(args.layout, args.num_agents, eval_func, args.tt_size)
+    if args.book is not None and os.path.exists(args.book):
+        sys.stderr.write('Loaded ' + str(analyzer.load_book(args.book)) + ' book entries\n')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = upo.connect4.analysis.AnalysisServer(analyzer, args.time, args.max_time)
+    if args.unix is not None:
+        loop.run_until_complete(server.start_unix(args.unix))
+        sys.stderr.write('Listening on ' + args.unix + '\n')
+    else:
+        loop.run_until_complete(server.start_tcp(args.host, args.port))
+        sys.stderr.write('Listening on ' + args.host + ':' + str(args.port) + '\n')
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+        if args.book is not None:
+            analyzer.save_book(args.book)
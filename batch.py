@@ -0,0 +1,190 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Headless batch runner for the Connect 4 game.
+
+Plays a number of games between computer agents without any user interface,
+possibly in parallel, and streams the outcome of each game as a line of JSON.
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import upo.connect4.factory
+import upo.connect4.game
+import upo.connect4.lines
+import upo.connect4.records
+import upo.connect4.tablebase
+
+
+def play_game(task):
+    """
+    Plays a single game as described by the given task (a dictionary) and
+    returns a dictionary with its outcome.
+    """
+    random.seed(task['seed'])
+    agent_factory = upo.connect4.factory.AgentFactory()
+    agents = agent_factory.make_agents(task['agents'], task['agent_args'], task['difficulty'])
+    tablebase = None
+    if task['tablebase'] is not None:
+        tablebase = upo.connect4.tablebase.Tablebase(task['tablebase'])
+        upo.connect4.tablebase.attach_tablebase(agents, tablebase)
+    game = upo.connect4.game.Game(agents, task['layout'], task['k'])
+    opening = upo.connect4.game.make_random_opening(game, task['opening'])
+    game.play_opening(opening)
+    stats = game.get_stats()
+    moves = []
+    while not game.is_over():
+        agent_index = game.get_current_agent().get_index()
+        num_states = stats.get_tot_expanded_states(agent_index)
+        elapsed_time = stats.get_tot_elapsed_time(agent_index)
+        num_search_stats = len(stats.get_search_stats(agent_index))
+        column = game.make_move()
+        move = {'agent': agent_index,
+                'column': column,
+                'time': stats.get_tot_elapsed_time(agent_index)-elapsed_time,
+                'nstates': stats.get_tot_expanded_states(agent_index)-num_states}
+        if len(stats.get_search_stats(agent_index)) > num_search_stats:
+            move['search'] = stats.get_search_stats(agent_index)[-1].to_dict()
+        moves.append(move)
+    if tablebase is not None:
+        tablebase.close()
+    winner = None
+    result = 'tie'
+    if game.get_forfeiting_agent() is not None:
+        result = 'forfeit'
+    elif game.get_state().is_win():
+        winner = game.get_state().get_winner()
+        result = 'win'
+    return {'game': task['game'],
+            'seed': task['seed'],
+            'layout': list(game.get_layout()),
+            'k': game.get_k(),
+            'agents': [agent.get_name() for agent in agents],
+            'agent_ids': task['agents'],
+            'opening': opening,
+            'moves': moves,
+            'result': result,
+            'winner': winner}
+
+
+def make_tasks(args):
+    """
+    Generates the description of each game to play.
+    """
+    for i in range(args.num_games):
+        agent_ids = list(args.agents)
+        agent_args = list(args.agent_args)
+        if args.alternate:
+            # Rotates agents so that each one starts the same number of games
+            shift = i % len(agent_ids)
+            agent_ids = agent_ids[shift:] + agent_ids[:shift]
+            num_customs = upo.connect4.factory.AgentFactory.count_agent_args(args.agents[:shift])
+            agent_args = agent_args[num_customs:] + agent_args[:num_customs]
+        yield {'game': i,
+               'seed': args.seed + i,
+               'agents': agent_ids,
+               'agent_args': agent_args,
+               'difficulty': args.difficulty,
+               'layout': tuple(args.layout),
+               'k': args.k,
+               'opening': args.opening,
+               'tablebase': args.tablebase}
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Headless batch runner")
+
+    parser.add_argument('-a', '--agent', action='append', dest='agents',
+                        choices=[x for x in upo.connect4.factory.AgentFactory.get_available_agents() if x != 'human'],
+                        help='The type of a player agent.', default=[])
+    parser.add_argument('--agentargs', action='append', dest='agent_args', type=str, nargs="*",
+                        help='The arguments to pass to the associated "custom" or "engine" agent (see connect4.py).', default=[])
+    parser.add_argument('--alternate', dest='alternate', action='store_true',
+                        help='Rotate agents from game to game, so that each agent starts the same number of games.')
+    parser.add_argument('--connect', dest='k', type=int,
+                        help='The number of tokens in a row needed to win.', default=upo.connect4.lines.DEFAULT_K)
+    parser.add_argument('-d', '--difficulty', dest='difficulty', type=str,
+                        help='The level of difficulty of the game (valid only for intelligent computer agents.', default=str(upo.connect4.factory.GameDifficulty.default_difficulty()))
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of games to play in parallel (defaults to the number of CPUs).', default=multiprocessing.cpu_count())
+    parser.add_argument('-l', '--layout', dest='layout', type=int, nargs=2,
+                        help='A pair of two numbers specifying the width and height (in number of tiles) of the game board.', default=[7, 6])
+    parser.add_argument('-n', '--num-games', dest='num_games', type=int,
+                        help='Number of games to play.', default=1)
+    parser.add_argument('--opening', dest='opening', type=int,
+                        help='Number of random moves played at the beginning of each game.', default=0)
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The file where to write results (one JSON object per line); defaults to the standard output.', default='-')
+    parser.add_argument('--records', dest='records', type=str,
+                        help='A file where to append the binary record of each game (see upo.connect4.records).', default=None)
+    parser.add_argument('--seed', dest='seed', type=int,
+                        help='The seed of the random number generator (game i uses seed+i).', default=5489)
+    parser.add_argument('--tablebase', dest='tablebase', type=str,
+                        help='An endgame table (see tablebase.py) probed by search agents.', default=None)
+
+    args = parser.parse_args()
+
+    # We need at least two agents
+    while len(args.agents) <= 1:
+        args.agents.append('random')
+
+    # Check arguments consistency
+    if upo.connect4.factory.AgentFactory.count_agent_args(args.agents) != len(args.agent_args):
+        parser.error('Agent arguments not found for "custom" or "engine" agent')
+    if args.jobs <= 0:
+        parser.error('Number of jobs must be a positive number')
+    if args.num_games < 0:
+        parser.error('Number of games must be a nonnegative number')
+    if args.opening < 0:
+        parser.error('Number of opening moves must be a nonnegative number')
+    if min(args.layout) < 4:
+        parser.error('Board must be at least 4x4 large')
+    if args.k < 2 or args.k > max(args.layout):
+        parser.error('Number of tokens in a row must be at least 2 and fit in the board')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    records = None
+    if args.records is not None:
+        records = upo.connect4.records.GameRecordWriter(args.records, args.layout[0], args.layout[1], len(args.agents), k=args.k)
+    tasks = make_tasks(args)
+    pool = None
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap_unordered(play_game, tasks)
+    else:
+        results = map(play_game, tasks)
+    for result in results:
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        if records is not None:
+            records.write(upo.connect4.records.GameRecord.from_dict(result))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if out is not sys.stdout:
+        out.close()
+    if records is not None:
+        records.close()
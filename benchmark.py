@@ -0,0 +1,294 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark suite for the Connect 4 engine.
+
+Measures the throughput of successor generation, terminal detection, leaf
+evaluation and search (nodes/second and time to depth) on fixed sets of
+positions, and writes the results as JSON so that they can be compared
+across commits (see the --compare option).
+"""
+
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import upo.connect4.agents
+import upo.connect4.notation
+import upo.utils
+
+
+# Fixed position sets, given as move sequences (see upo.connect4.notation),
+# i.e., sequences of (0-based) columns played in turn by agents 0 and 1.
+# Never change an existing position, otherwise results are no longer
+# comparable with older runs.
+POSITIONS = {
+    (7, 6): {
+        'opening': ['', '3', '332', '3324'],
+        'midgame': ['154602113666', '33141111602534', '2142322323133260', '044460002131255623'],
+        'endgame': ['335420313501056116450056434221', '61162360064003356632413300241554', '6212343633300034624564162101252005', '41246566505214523100001501452644136'],
+    },
+    (9, 7): {
+        'opening': ['', '4', '443', '4435'],
+        'midgame': ['315337536883', '66323321468817', '0142474465637640', '010043634460548161'],
+        'endgame': ['43604584438811860033838824047221225714652237', '1855734670861866678751233506413870271780652053', '228702688681508268117337280624434337460471431256', '51380304511307766312344718408881447487353821705056'],
+    },
+}
+
+DEFAULT_EVALUATION_FUNCTIONS = ['upo.connect4.agents.basic_evaluation_function',
+                                'upo.connect4.agents.improved_evaluation_function',
+                                'myagents_instructor.score4_evaluation_function',
+                                'myagents_instructor.token_patterns_evaluation_function']
+
+
+def make_position(layout, moves, num_agents=2):
+    """
+    Creates the game state obtained by playing the given sequence of columns.
+    """
+    return upo.connect4.notation.parse_moves(moves, layout, num_agents)
+
+
+def get_search_agent_classes():
+    """
+    Returns the search agents defined in upo.connect4.agents, that is the
+    computer agents whose constructor accepts a depth (the abstract
+    SearchComputerAgent base class excluded).
+    """
+    klasses = []
+    for (name, klass) in inspect.getmembers(upo.connect4.agents, inspect.isclass):
+        if (klass.__module__ == upo.connect4.agents.__name__
+            and issubclass(klass, upo.connect4.agents.ComputerAgent)
+            and klass is not upo.connect4.agents.SearchComputerAgent
+            and 'depth' in inspect.signature(klass.__init__).parameters):
+            klasses.append(klass)
+    return klasses
+
+
+def measure(func, min_time):
+    """
+    Calls func repeatedly for at least min_time seconds.
+    func must return the number of operations it performed.
+    Returns the pair (number of operations, elapsed seconds).
+    """
+    num_ops = 0
+    elapsed = 0.0
+    start = time.perf_counter()
+    while elapsed < min_time or num_ops == 0:
+        num_ops += func()
+        elapsed = time.perf_counter()-start
+    return (num_ops, elapsed)
+
+
+def bench_successors(positions, min_time):
+    def run():
+        n = 0
+        for (moves, game_state) in positions:
+            agent_index = len(moves) % game_state.num_agents()
+            for action in game_state.get_legal_actions():
+                game_state.generate_successor(agent_index, action).release()
+                n += 1
+        return n
+    return measure(run, min_time)
+
+
+def bench_terminal(states, min_time):
+    def run():
+        for game_state in states:
+            game_state.is_final()
+            game_state.is_win()
+        return len(states)
+    return measure(run, min_time)
+
+
+def bench_evaluation(states, eval_func, min_time):
+    agents = [upo.connect4.agents.ComputerAgent(i) for i in range(2)]
+    def run():
+        for game_state in states:
+            for agent in agents:
+                eval_func(game_state, agent, depth=1)
+        return len(states)*len(agents)
+    return measure(run, min_time)
+
+
+def bench_search(states, klass, depth):
+    """
+    Runs a search to the given depth from each of the given states.
+    Returns the triple (number of searches, expanded nodes, elapsed seconds);
+    the number of expanded nodes is None if the agent does not count them.
+    """
+    num_nodes = 0
+    elapsed = 0.0
+    num_searches = 0
+    for (moves, game_state) in states:
+        if game_state.is_final():
+            continue
+        agent = klass(len(moves) % game_state.num_agents(), depth, upo.connect4.agents.basic_evaluation_function)
+        start = time.perf_counter()
+        agent.get_action(game_state)
+        elapsed += time.perf_counter()-start
+        num_searches += 1
+        if num_nodes is not None and 'num_expanded_states' in dir(agent):
+            num_nodes += agent.num_expanded_states()
+        else:
+            num_nodes = None
+    return (num_searches, num_nodes, elapsed)
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    results = []
+
+    def report(result):
+        results.append(result)
+        if args.verbose > 0:
+            print(json.dumps(result), file=sys.stderr)
+
+    eval_funcs = [(name, upo.utils.import_lib(name)) for name in args.evalfuncs]
+    agent_klasses = [klass for klass in get_search_agent_classes() if not args.agents or klass.__name__ in args.agents]
+
+    for layout in sorted(POSITIONS):
+        layout_str = str(layout[0]) + 'x' + str(layout[1])
+        for phase in ['opening', 'midgame', 'endgame']:
+            positions = [(moves, make_position(layout, moves)) for moves in POSITIONS[layout][phase]]
+            states = [game_state for (moves, game_state) in positions]
+            key = {'layout': layout_str, 'phase': phase}
+
+            (n, t) = bench_successors(positions, args.min_time)
+            report(dict(key, benchmark='successors', ops=n, seconds=t, rate=n/t))
+
+            (n, t) = bench_terminal(states, args.min_time)
+            report(dict(key, benchmark='terminal', ops=n, seconds=t, rate=n/t))
+
+            for (name, eval_func) in eval_funcs:
+                # Some evaluation functions are very chatty: silence them
+                with contextlib.redirect_stdout(io.StringIO()):
+                    (n, t) = bench_evaluation(states, eval_func, args.min_time)
+                report(dict(key, benchmark='evaluation', target=name, ops=n, seconds=t, rate=n/t))
+
+            for klass in agent_klasses:
+                for depth in range(1, args.max_depth+1):
+                    random.seed(args.seed)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        (n, nodes, t) = bench_search(positions, klass, depth)
+                    result = dict(key, benchmark='search', target=klass.__name__, depth=depth, ops=n, seconds=t, nodes=nodes)
+                    result['time_to_depth'] = t/n if n > 0 else None
+                    result['rate'] = nodes/t if nodes is not None and t > 0 else None
+                    report(result)
+
+    return {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'revision': get_git_revision(),
+                     'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'machine': platform.machine(),
+                     'min_time': args.min_time,
+                     'max_depth': args.max_depth},
+            'results': results}
+
+
+def result_key(result):
+    return (result['benchmark'], result['layout'], result['phase'], result.get('target'), result.get('depth'))
+
+
+def compare(old, new):
+    """
+    Prints a table comparing the rates of two benchmark runs (higher is
+    better, except for time to depth).
+    """
+    old_results = dict((result_key(r), r) for r in old['results'])
+    print('{:<11} {:<5} {:<8} {:<55} {:>5} {:<13} {:>14} {:>14} {:>8}'.format('benchmark', 'board', 'phase', 'target', 'depth', 'metric', 'old', 'new', 'speedup'))
+    for r in new['results']:
+        k = result_key(r)
+        if k not in old_results:
+            continue
+        metric = 'time_to_depth' if r['benchmark'] == 'search' and r.get('rate') is None else 'rate'
+        (o, n) = (old_results[k].get(metric), r.get(metric))
+        if o is None or n is None or o == 0 or n == 0:
+            continue
+        speedup = o/n if metric == 'time_to_depth' else n/o
+        print('{:<11} {:<5} {:<8} {:<55} {:>5} {:<13} {:>14.6g} {:>14.6g} {:>7.2f}x'.format(r['benchmark'], r['layout'], r['phase'], str(r.get('target') or ''), str(r.get('depth') or ''), metric, o, n, speedup))
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Benchmark suite")
+
+    parser.add_argument('--agent', action='append', dest='agents', type=str,
+                        help='The class name of a search agent of upo.connect4.agents to benchmark (defaults to all of them).', default=[])
+    parser.add_argument('--compare', dest='compare', type=str, nargs='+',
+                        help='Compare two result files (OLD NEW), or a result file with a fresh run (OLD), instead of only running the benchmarks.', default=None)
+    parser.add_argument('--evalfunc', action='append', dest='evalfuncs', type=str,
+                        help='The fully qualified name of an evaluation function to benchmark (defaults to the ones of upo.connect4.agents and myagents_instructor).', default=[])
+    parser.add_argument('--max-depth', dest='max_depth', type=int,
+                        help='The maximum search depth (in plies).', default=4)
+    parser.add_argument('--min-time', dest='min_time', type=float,
+                        help='The minimum number of seconds each throughput benchmark runs for.', default=0.2)
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The file where to write results as JSON; defaults to the standard output.', default='-')
+    parser.add_argument('--seed', dest='seed', type=int,
+                        help='The seed of the random number generator.', default=5489)
+    parser.add_argument('--verbose', '-v', action='count',
+                        help='Increase output verbosity', default=0)
+
+    args = parser.parse_args()
+
+    if len(args.evalfuncs) == 0:
+        args.evalfuncs = DEFAULT_EVALUATION_FUNCTIONS
+    if args.max_depth < 1:
+        parser.error('Maximum depth must be a positive number')
+    if args.min_time <= 0:
+        parser.error('Minimum time must be a positive number')
+    if args.compare is not None and len(args.compare) > 2:
+        parser.error('At most two result files can be compared')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    if args.compare is not None and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        compare(old, new)
+        sys.exit(0)
+    random.seed(args.seed)
+    new = run_benchmarks(args)
+    if args.output == '-':
+        if args.compare is None:
+            json.dump(new, sys.stdout, indent=1)
+            print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(new, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        compare(old, new)
@@ -16,80 +16,17 @@
 
 
 import argparse
-import enum
-import inspect
 import random
-import upo.connect4.agents
+import upo.connect4.factory
 import upo.connect4.game
+import upo.connect4.lines
+import upo.connect4.sandbox
+import upo.connect4.tablebase
 import upo.connect4.ui
-import upo.utils
 
 
-class GameDifficulty(enum.IntEnum):
-    """
-    Enumeration for predefined difficulty levels.
-    """
-    very_easy = 1
-    easy = 2
-    medium = 3
-    hard = 4
-    very_hard = 5
-    no_hope = -1 # Actually, this leads to the full exploration of the game tree (may take a huge amount of time)
-
-    def __str__(self):
-        return self.name
-
-    @classmethod
-    def default_difficulty(cls):
-        return cls.easy
-
-    @classmethod
-    def str2int(cls, s):
-        ls = s.lower()
-        if ls == 'veryeasy':
-            return cls.very_easy
-        if ls == 'easy':
-            return cls.easy
-        if ls == 'medium':
-            return cls.medium
-        if ls == 'hard':
-            return cls.hard
-        if ls == 'veryhard':
-            return cls.very_hard
-        if ls == 'nohope':
-            return cls.no_hope
-        if s.isdigit():
-            return int(s)
-        return cls.default_difficulty()
-
-
-class AgentFactory:
-    ids = ['alphabeta', 'custom', 'expectimax', 'firstfitleft', 'human', 'minimax', 'random']
-
-    def make_agent(self, agent_id, agent_index, args):
-        #if agent_id not in self.ids:
-        #    raise Exception('Unknown agent identifier "' + agent_id + '"')
-        if agent_id == 'alphabeta':
-            return upo.connect4.agents.AlphaBetaMinimaxComputerAgent(agent_index, args['depth'])
-        if agent_id == 'custom':
-            klass = upo.utils.import_lib(args['class'])
-            if len(inspect.signature(klass.__init__).parameters) <= 2:
-                return klass(agent_index)
-            return klass(agent_index, **args)
-        if agent_id == 'firstfitleft':
-            return upo.connect4.agents.FirstFitLeftComputerAgent(agent_index)
-        if agent_id == 'expectimax':
-            return upo.connect4.agents.ExpectimaxComputerAgent(agent_index, args['depth'])
-        if agent_id == 'human':
-            return upo.connect4.agents.HumanAgent(agent_index)
-        if agent_id == 'minimax':
-            return upo.connect4.agents.MinimaxComputerAgent(agent_index, args['depth'])
-        if agent_id == 'random':
-            return upo.connect4.agents.RandomComputerAgent(agent_index)
-
-    @classmethod
-    def get_available_agents(cls):
-        return cls.ids
+GameDifficulty = upo.connect4.factory.GameDifficulty
+AgentFactory = upo.connect4.factory.AgentFactory
 
 
 def parse_options():
@@ -101,7 +38,7 @@ def parse_options():
     #parser.add_argument('--agentclass', action='append', dest='agent_classes', type=str,
     #                    help='The fully qualified class name of the custom agent (e.g., upo.connect4.agents.MyAgent); only used when the agent type is "custom" (see option "--agent").', default=[])
     parser.add_argument('--agentargs', action='append', dest='agent_args', type=str, nargs="*",
-                        help='The arguments to pass to the associated "custom" agent.'
+                        help='The arguments to pass to the associated "custom" or "engine" agent.'
                             +'Specify as many parameters you need in the form of a space-separated sequence of "key=value" elements; for instance, "--agentargs key1=value1 key2=value2 ... keyN=valueN".'
                             +'The following keys are available:'
                             +'"class": the value is the fully qualified class name of the custom agent (e.g., upo.connect4.agents.MyAgent);'
@@ -109,7 +46,14 @@ def parse_options():
                             +'"evalfunc": the fully qualified function name of the evaluation function to use for evaluating nodes of the game tree.'
                             +'There must be at least one parameter whose key is "class"'
                             +'Only used when the agent type is "custom" (see option "--agent").'
-                            +'Repeat this option for each "custom" agent.', default=[])
+                            +'For "engine" agents, the following keys are available:'
+                            +'"command": the command line that runs the engine process (e.g., "python engine.py -a alphabeta -d hard"; see upo/connect4/engine.py), which is mandatory;'
+                            +'"plies": the search depth (in plies) the engine is asked for at every move;'
+                            +'"movetime": the time (in milliseconds) the engine is asked to search at every move;'
+                            +'"timeout": the number of seconds after which the engine is asked to stop and the agent forfeits the game.'
+                            +'Repeat this option for each "custom" or "engine" agent.', default=[])
+    parser.add_argument('--connect', dest='k', type=int,
+                        help='The number of tokens in a row needed to win.', default=upo.connect4.lines.DEFAULT_K)
     parser.add_argument('-d', '--difficulty', dest='difficulty', type=str,
                         help='The level of difficulty of the game (valid only for intelligent computer agents.', default=str(GameDifficulty.default_difficulty))
     parser.add_argument('--fps', dest='fps', type=int,
@@ -118,6 +62,12 @@ def parse_options():
                         help='A pair of two numbers specifying the width and height (in pixels) of the whole window.', default=[640, 480])
     parser.add_argument('-l', '--layout', dest='layout', type=int, nargs=2,
                         help='A pair of two numbers specifying the width and height (in number of tiles) of the game board.', default=[7, 6])
+    parser.add_argument('--ponder', dest='ponder', action='store_true',
+                        help='Let computer agents think in the background while waiting for their turn (only in games with a human agent, since pondering distorts the timing of the other computer agents).', default=False)
+    parser.add_argument('--render-mode', dest='render_mode', type=str, choices=upo.connect4.ui.PyGameUI.RENDER_MODES,
+                        help='How the window is redrawn: "full" redraws it at every frame, "dirty" only redraws what changed.', default=upo.connect4.ui.PyGameUI.DEFAULT_RENDER_MODE)
+    parser.add_argument('--tablebase', dest='tablebase', type=str,
+                        help='An endgame table (see tablebase.py) probed by search agents.', default=None)
     parser.add_argument('--timeout', dest='timeout', type=int,
                         help='Number of seconds to wait for a player\'s move before timing out. Setting it to zero disables the timeout', default=0)
     parser.add_argument('--verbose', '-v', action='count',
@@ -130,8 +80,8 @@ def parse_options():
         args.agents.append('random')
 
     # Check arguments consistency
-    if args.agents.count('custom') != len(args.agent_args):
-        parser.error('Agent arguments not found for "custom" agent')
+    if AgentFactory.count_agent_args(args.agents) != len(args.agent_args):
+        parser.error('Agent arguments not found for "custom" or "engine" agent')
     if args.fps <= 0:
         parser.error('Frame rate must be a positive number')
     if any(args.geometry) <= 0:
@@ -140,6 +90,8 @@ def parse_options():
         parser.error('Board layout must be a pair of positive numbers')
     if args.timeout < 0:
         parser.error('Timeout value must be a nonnegative number')
+    if args.k < 2 or args.k > max(args.layout):
+        parser.error('Number of tokens in a row must be at least 2 and fit in the board')
 
     return args
 
@@ -152,25 +104,16 @@ if __name__ == '__main__':
     #rng_state = random.getstate()
     #print "Random State: ", rng_state
     agent_factory = AgentFactory()
-    agents = []
-    agent_idx = 0
-    for agent_type in args.agents:
-        xargs = {}
-        #xargs['depth'] = GameDifficulty.str2int(args.difficulty)
-        xargs['depth'] = args.difficulty
-        if agent_type == 'custom':
-            agent_args = args.agent_args.pop(0)
-            for arg in agent_args:
-                (key, value) = arg.split('=', 1) # Retrieves the key and the value
-                xargs[key.lower()] = value
-            if 'class' not in xargs:
-                raise Exception('Class name not specified for custom agent')
-        xargs['depth'] = int(GameDifficulty.str2int(xargs['depth']))*len(args.agents)
-        agent = agent_factory.make_agent(agent_type, agent_idx, xargs)
-        agent.set_verbosity_level(args.verbose)
-        agents.append(agent)
-        agent_idx += 1
-    game = upo.connect4.game.Game(agents, args.layout)
+    agents = agent_factory.make_agents(args.agents, args.agent_args, args.difficulty, args.verbose)
+    if args.tablebase is not None:
+        upo.connect4.tablebase.attach_tablebase(agents, upo.connect4.tablebase.Tablebase(args.tablebase))
+    if args.timeout > 0:
+        # Enforces the timeout even if an agent never returns
+        agents = [upo.connect4.sandbox.SandboxedAgent(agent, args.timeout) if not agent.is_interactive() else agent for agent in agents]
+    game = upo.connect4.game.Game(agents, args.layout, args.k)
     game.set_verbosity_level(args.verbose)
-    ui = upo.connect4.ui.PyGameUI(game, args.geometry, args.fps, args.timeout)
+    # Computer agents pondering in this process would slow down the other
+    # computer agents, so they only ponder on the time of human agents
+    game.set_pondering(args.ponder and any(agent.is_interactive() for agent in agents))
+    ui = upo.connect4.ui.PyGameUI(game, args.geometry, args.fps, args.timeout, args.render_mode)
     ui.show()
@@ -0,0 +1,76 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Engine process for the Connect 4 game.
+
+Hosts an agent per agent index and drives it with the line-based engine
+protocol read from the standard input (see upo.connect4.engine), e.g.:
+
+    $ python engine.py -a alphabeta -d medium
+    engine
+    id name alphabeta
+    engineok
+    position startpos moves 3 3 4
+    go movetime 500
+    ...
+    bestmove 2
+"""
+
+
+import argparse
+import sys
+import upo.connect4.engine
+import upo.connect4.factory
+import upo.connect4.tablebase
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Engine")
+
+    parser.add_argument('-a', '--agent', dest='agent',
+                        choices=[x for x in upo.connect4.factory.AgentFactory.get_available_agents() if x not in ('human', 'engine')],
+                        help='The type of the agent.', default='alphabeta')
+    parser.add_argument('--agentargs', dest='agent_args', type=str, nargs="*",
+                        help='The arguments to pass to the "custom" agent (see connect4.py).', default=None)
+    parser.add_argument('-d', '--difficulty', dest='difficulty', type=str,
+                        help='The level of difficulty of the agent, that is its search depth when "go" has no arguments (valid only for intelligent computer agents).', default=str(upo.connect4.factory.GameDifficulty.default_difficulty()))
+    parser.add_argument('--name', dest='name', type=str,
+                        help='The name the engine replies to the handshake with (defaults to the agent type).', default=None)
+    parser.add_argument('--tablebase', dest='tablebase', type=str,
+                        help='An endgame table (see tablebase.py) probed by the agent.', default=None)
+
+    args = parser.parse_args()
+
+    # Check arguments consistency
+    if args.agent == 'custom' and args.agent_args is None:
+        parser.error('Agent arguments not found for "custom" agent')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    agent_factory = upo.connect4.factory.AgentFactory()
+    agent_args = [args.agent_args] if args.agent == 'custom' else []
+    tablebase = upo.connect4.tablebase.Tablebase(args.tablebase) if args.tablebase is not None else None
+    def make_agents(num_agents):
+        agents = agent_factory.make_agents([args.agent]*num_agents, agent_args*num_agents, args.difficulty)
+        if tablebase is not None:
+            upo.connect4.tablebase.attach_tablebase(agents, tablebase)
+        return agents
+    engine = upo.connect4.engine.Engine(make_agents, args.name if args.name is not None else args.agent)
+    engine.run(sys.stdin)
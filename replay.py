@@ -0,0 +1,84 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Renders the games recorded by batch.py as animated GIFs or PNG sequences,
+without opening any window.
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import sys
+import upo.connect4.records
+import upo.connect4.replay
+
+
+def read_records(args):
+    """
+    Reads the game records (one JSON object per line) to render.
+    """
+    if args.input != '-' and upo.connect4.records.is_record_file(args.input):
+        with upo.connect4.records.GameRecordReader(args.input) as reader:
+            for record in reader:
+                if len(args.games) == 0 or record.game in args.games:
+                    yield record.to_dict()
+        return
+    inp = sys.stdin if args.input == '-' else open(args.input, 'r')
+    for line in inp:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        record = json.loads(line)
+        if len(args.games) == 0 or record.get('game') in args.games:
+            yield record
+    if inp is not sys.stdin:
+        inp.close()
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Replay renderer")
+
+    parser.add_argument('input', type=str,
+                        help='The file with the game records, either one JSON object per line (as written by batch.py; "-" reads the standard input) or a binary record file (see upo.connect4.records).')
+    parser.add_argument('-f', '--format', dest='format', type=str, choices=upo.connect4.replay.FORMATS,
+                        help='The output format: an animated GIF (needs the Pillow library) or a sequence of PNG images per game.', default=upo.connect4.replay.DEFAULT_FORMAT)
+    parser.add_argument('--frame-duration', dest='frame_duration', type=int,
+                        help='Number of milliseconds each frame of a GIF is shown.', default=upo.connect4.replay.DEFAULT_FRAME_DURATION)
+    parser.add_argument('--final-duration', dest='final_duration', type=int,
+                        help='Number of milliseconds the final frame of a GIF is shown.', default=upo.connect4.replay.DEFAULT_FINAL_DURATION)
+    parser.add_argument('-g', '--geometry', dest='geometry', type=int, nargs=2,
+                        help='A pair of two numbers specifying the width and height (in pixels) of each frame.', default=list(upo.connect4.replay.DEFAULT_GEOMETRY))
+    parser.add_argument('--game', action='append', dest='games', type=int,
+                        help='Only render the game with the given number (repeat this option for more games).', default=[])
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of games to render in parallel (defaults to the number of CPUs).', default=multiprocessing.cpu_count())
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The directory where to write the rendered games.', default='replays')
+
+    args = parser.parse_args()
+
+    if args.jobs <= 0:
+        parser.error('Number of jobs must be a positive number')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    for paths in upo.connect4.replay.render_records(read_records(args), args.output, args.format, args.geometry, args.jobs, args.frame_duration, args.final_duration):
+        print(paths[0] if len(paths) == 1 else paths[0] + ' ... ' + paths[-1])
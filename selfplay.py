@@ -0,0 +1,127 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Self-play data generator for the Connect 4 game.
+
+Plays games between computer agents on a pool of processes, samples the
+positions where a search agent was to move and streams them, labelled with the
+search score, the chosen move and the game outcome, to NumPy .npz shards (see
+upo.connect4.dataset).
+"""
+
+
+import argparse
+import multiprocessing
+import sys
+import upo.connect4.dataset
+import upo.connect4.factory
+import upo.connect4.lines
+
+
+def make_tasks(args):
+    """
+    Generates the description of each game to play.
+    """
+    for i in range(args.num_games):
+        yield {'game': i,
+               'seed': args.seed + i,
+               'agents': args.agents,
+               'agent_args': args.agent_args,
+               'difficulty': args.difficulty,
+               'layout': tuple(args.layout),
+               'k': args.k,
+               'opening': args.opening,
+               'sample_rate': args.sample_rate,
+               'skip': args.skip}
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Self-play data generator")
+
+    parser.add_argument('-a', '--agent', action='append', dest='agents',
+                        choices=[x for x in upo.connect4.factory.AgentFactory.get_available_agents() if x != 'human'],
+                        help='The type of a player agent.', default=[])
+    parser.add_argument('--agentargs', action='append', dest='agent_args', type=str, nargs="*",
+                        help='The arguments to pass to the associated "custom" or "engine" agent (see connect4.py).', default=[])
+    parser.add_argument('--connect', dest='k', type=int,
+                        help='The number of tokens in a row needed to win.', default=upo.connect4.lines.DEFAULT_K)
+    parser.add_argument('-d', '--difficulty', dest='difficulty', type=str,
+                        help='The level of difficulty of the game (valid only for intelligent computer agents.', default=str(upo.connect4.factory.GameDifficulty.default_difficulty()))
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of games to play in parallel (defaults to the number of CPUs).', default=multiprocessing.cpu_count())
+    parser.add_argument('-l', '--layout', dest='layout', type=int, nargs=2,
+                        help='A pair of two numbers specifying the width and height (in number of tiles) of the game board.', default=[7, 6])
+    parser.add_argument('--max-in-flight', dest='max_in_flight', type=int,
+                        help='Maximum number of games submitted to the workers and not yet written (defaults to twice the number of jobs).', default=0)
+    parser.add_argument('-n', '--num-games', dest='num_games', type=int,
+                        help='Number of games to play.', default=1)
+    parser.add_argument('--opening', dest='opening', type=int,
+                        help='Number of random moves played at the beginning of each game.', default=4)
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The directory where to write the shards.', default='selfplay')
+    parser.add_argument('--prefix', dest='prefix', type=str,
+                        help='The prefix of the shard file names.', default='selfplay')
+    parser.add_argument('--sample-rate', dest='sample_rate', type=float,
+                        help='Probability that a position is sampled.', default=1.0)
+    parser.add_argument('--seed', dest='seed', type=int,
+                        help='The seed of the random number generator (game i uses seed+i).', default=5489)
+    parser.add_argument('--shard-size', dest='shard_size', type=int,
+                        help='Number of positions per shard.', default=upo.connect4.dataset.DEFAULT_SHARD_SIZE)
+    parser.add_argument('--skip', dest='skip', type=int,
+                        help='Number of plies at the beginning of each game that are never sampled.', default=0)
+
+    args = parser.parse_args()
+
+    # We need at least two agents
+    while len(args.agents) <= 1:
+        args.agents.append('alphabeta')
+
+    # Check arguments consistency
+    if upo.connect4.factory.AgentFactory.count_agent_args(args.agents) != len(args.agent_args):
+        parser.error('Agent arguments not found for "custom" or "engine" agent')
+    if args.jobs <= 0:
+        parser.error('Number of jobs must be a positive number')
+    if args.max_in_flight <= 0:
+        args.max_in_flight = 2*args.jobs
+    if args.num_games < 0:
+        parser.error('Number of games must be a nonnegative number')
+    if args.opening < 0:
+        parser.error('Number of opening moves must be a nonnegative number')
+    if args.sample_rate < 0 or args.sample_rate > 1:
+        parser.error('Sample rate must be a number in [0,1]')
+    if args.shard_size <= 0:
+        parser.error('Shard size must be a positive number')
+    if min(args.layout) < 4:
+        parser.error('Board must be at least 4x4 large')
+    if args.layout[0]*args.layout[1] > 64:
+        parser.error('Board must have at most 64 cells')
+    if args.k < 2 or args.k > max(args.layout):
+        parser.error('Number of tokens in a row must be at least 2 and fit in the board')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    writer = upo.connect4.dataset.ShardWriter(args.output, args.layout, len(args.agents), args.shard_size, args.prefix, k=args.k)
+    num_games = 0
+    for samples in upo.connect4.dataset.iter_bounded(upo.connect4.dataset.play_selfplay_game, make_tasks(args), args.jobs, args.max_in_flight):
+        for sample in samples:
+            writer.write(sample)
+        num_games += 1
+    writer.close()
+    sys.stderr.write('Games: ' + str(num_games) + ', positions: ' + str(writer.num_samples()) + ', shards: ' + str(len(writer.get_paths())) + '\n')
@@ -0,0 +1,75 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Endgame table builder for the Connect 4 game.
+
+Solves the positions with at most a given number of empty cells reachable
+from the empty board or from the positions of a file (see
+upo.connect4.notation), and writes their table (see upo.connect4.tablebase),
+which search agents can probe with the --tablebase option of connect4.py,
+batch.py and engine.py.
+"""
+
+
+import argparse
+import sys
+import time
+import upo.connect4.lines
+import upo.connect4.notation
+import upo.connect4.tablebase
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Endgame table builder")
+
+    parser.add_argument('--connect', dest='k', type=int,
+                        help='The number of tokens in a row needed to win.', default=upo.connect4.lines.DEFAULT_K)
+    parser.add_argument('-e', '--max-empty', dest='max_empty', type=int,
+                        help='Maximum number of empty cells of the solved positions (defaults to the number of cells of the board, that is the whole game).', default=None)
+    parser.add_argument('-l', '--layout', dest='layout', type=int, nargs=2,
+                        help='A pair of two numbers specifying the width and height (in number of tiles) of the game board.', default=[4, 4])
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The file where to write the table.', required=True)
+    parser.add_argument('--positions', dest='positions', type=str,
+                        help='A file with the root positions, one per line (see upo/connect4/notation.py); defaults to the empty board.', default=None)
+
+    args = parser.parse_args()
+
+    # Check arguments consistency
+    if min(args.layout) < 4:
+        parser.error('Board must be at least 4x4 large')
+    if args.layout[0]*(args.layout[1]+1) > 64:
+        parser.error('Board must have at most 64 cells, counting an extra row')
+    if args.k < 2 or args.k > max(args.layout):
+        parser.error('Number of tokens in a row must be at least 2 and fit in the board')
+    if args.max_empty is None:
+        args.max_empty = args.layout[0]*args.layout[1]
+    if args.max_empty <= 0:
+        parser.error('Maximum number of empty cells must be a positive number')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    layout = tuple(args.layout)
+    roots = None
+    if args.positions is not None:
+        roots = upo.connect4.notation.iter_positions(args.positions, layout, 2, args.k)
+    start_ts = time.time()
+    count = upo.connect4.tablebase.build_tablebase(args.output, layout, args.max_empty, roots, args.k)
+    sys.stderr.write('Positions: ' + str(count) + ', time: ' + str(round(time.time()-start_ts, 1)) + ' s\n')
@@ -0,0 +1,153 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+import unittest
+import upo.connect4.agents
+import upo.connect4.evalbuilder
+import upo.connect4.game
+
+
+# A deterministic evaluation function with values in (-1,1)
+EVAL_SPEC = {'own_2': 0.2, 'own_3': 0.6, 'opp_2': -0.2, 'opp_3': -0.6, 'own_center': 0.1, 'opp_center': -0.1}
+
+
+def random_states(layout, num_agents, num_states, rng, min_ply=2):
+    """
+    Returns the given number of (state, index) pairs, where state is a
+    non-final state reached by random moves and index is the agent to move.
+    """
+    states = []
+    while len(states) < num_states:
+        state = upo.connect4.game.GameState(layout, num_agents)
+        num_plies = rng.randint(min_ply, layout[0]*layout[1]//2)
+        for ply in range(num_plies):
+            if state.is_final():
+                break
+            state.make_move(ply % num_agents, rng.choice(state.iter_legal_actions()))
+        if not state.is_final():
+            states.append((state, state.lines.num_tokens() % num_agents))
+    return states
+
+
+class StarExpectimaxTest(unittest.TestCase):
+    """
+    Star1/Star2 pruning and memoization do not change the decisions of
+    expectimax.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def check_decisions(self, layout, num_agents, depth, eval_func, num_states):
+        for (state, index) in random_states(layout, num_agents, num_states, self.rng):
+            expectimax = upo.connect4.agents.ExpectimaxComputerAgent(index, depth, eval_func)
+            star = upo.connect4.agents.StarExpectimaxComputerAgent(index, depth, eval_func)
+            self.assertEqual(star.get_action(state), expectimax.get_action(state))
+            self.assertAlmostEqual(star.last_value, expectimax.last_value)
+
+    def test_two_agents(self):
+        eval_func = upo.connect4.evalbuilder.build_evaluation_function(EVAL_SPEC)
+        self.check_decisions((7, 6), 2, 3, eval_func, 10)
+        self.check_decisions((5, 4), 2, 4, eval_func, 10)
+
+    def test_three_agents(self):
+        eval_func = upo.connect4.evalbuilder.build_evaluation_function(EVAL_SPEC)
+        self.check_decisions((7, 6), 3, 3, eval_func, 10)
+
+    def test_ties(self):
+        # Most values are ties: the first best action is chosen by both
+        self.check_decisions((5, 4), 2, 4, upo.connect4.agents.basic_evaluation_function, 10)
+
+
+
+class ParanoidTest(unittest.TestCase):
+    """
+    With two agents, the paranoid algorithm is minimax: alpha-beta pruning and
+    the transposition table do not change its decisions.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+        self.eval_func = upo.connect4.evalbuilder.build_evaluation_function(EVAL_SPEC)
+
+    def check_decision(self, agent, state, depth):
+        minimax = upo.connect4.agents.MinimaxComputerAgent(agent.get_index(), depth, self.eval_func)
+        action = agent.get_action(state)
+        self.assertEqual(action, minimax.get_action(state))
+        self.assertAlmostEqual(agent.last_value, minimax.last_value)
+        return action
+
+    def test_positions(self):
+        for (state, index) in random_states((7, 6), 2, 10, self.rng):
+            self.check_decision(upo.connect4.agents.ParanoidComputerAgent(index, 3, self.eval_func), state, 3)
+        for (state, index) in random_states((5, 4), 2, 10, self.rng):
+            self.check_decision(upo.connect4.agents.ParanoidComputerAgent(index, 4, self.eval_func), state, 4)
+
+    def test_game(self):
+        # The agents keep their transposition tables between decisions
+        agents = [upo.connect4.agents.ParanoidComputerAgent(index, 4, self.eval_func) for index in range(2)]
+        state = upo.connect4.game.GameState((5, 4), 2)
+        state.make_move(0, 2)
+        num_hits = 0
+        while not state.is_final():
+            agent = agents[state.lines.num_tokens() % 2]
+            action = self.check_decision(agent, state, 4)
+            num_hits += agent.get_search_stats().num_cache_hits
+            state.make_move(agent.get_index(), action)
+        self.assertTrue(num_hits > 0)
+
+
+class MaxNTest(unittest.TestCase):
+    """
+    Shallow pruning and the transposition table do not change the decisions
+    of max^n.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+        self.eval_func = upo.connect4.evalbuilder.build_evaluation_function(EVAL_SPEC)
+
+    def check_decision(self, agent, state, depth):
+        # No pruning and no transposition table
+        maxn = upo.connect4.agents.MaxNComputerAgent(agent.get_index(), depth, vector_eval_func=upo.connect4.agents.VectorEvaluationFunction(self.eval_func), tt_size=0)
+        action = agent.get_action(state)
+        self.assertEqual(action, maxn.get_action(state))
+        self.assertAlmostEqual(agent.last_value, maxn.last_value)
+        return action
+
+    def test_positions(self):
+        for num_agents in [2, 3]:
+            for (state, index) in random_states((7, 6), num_agents, 10, self.rng):
+                self.check_decision(upo.connect4.agents.MaxNComputerAgent(index, 3, self.eval_func), state, 3)
+
+    def test_game(self):
+        # The agents keep their transposition tables between decisions
+        agents = [upo.connect4.agents.MaxNComputerAgent(index, 4, self.eval_func) for index in range(3)]
+        state = upo.connect4.game.GameState((6, 5), 3)
+        state.make_move(0, 2)
+        num_hits = 0
+        while not state.is_final():
+            agent = agents[state.lines.num_tokens() % 3]
+            action = self.check_decision(agent, state, 4)
+            num_hits += agent.get_search_stats().num_cache_hits
+            state.make_move(agent.get_index(), action)
+        self.assertTrue(num_hits > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
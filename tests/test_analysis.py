@@ -0,0 +1,85 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+import upo.connect4.analysis
+
+
+def unbounded_evaluation_function(game_state, agent, **context):
+    """
+    Scores final states in [-1,1] and other states far outside of it.
+    """
+    if game_state.is_final():
+        if game_state.is_winner(agent.get_index()):
+            return 1.0
+        if game_state.is_tie():
+            return 0.0
+        return -1.0
+    return 50.0 if game_state.lines.num_tokens() % 2 == 0 else -50.0
+
+
+def analyze(analyzer, position, max_depth=None):
+    (state, agent_index) = analyzer.parse_position(position)
+    analysis = upo.connect4.analysis.Analysis(position, state, agent_index, time.monotonic()+60.0, max_depth)
+    analyzer.analyze(analysis)
+    return analysis
+
+
+class AnalyzerTest(unittest.TestCase):
+
+    def test_proved_win(self):
+        analyzer = upo.connect4.analysis.Analyzer((7, 6))
+        analysis = analyze(analyzer, '010101', 4)
+        self.assertTrue(analysis.finished)
+        self.assertTrue(analysis.result['exact'])
+        self.assertEqual(analysis.result['move'], 0)
+        self.assertEqual(analysis.result['depth'], 1)
+        # Exact results are then answered from the book
+        (state, agent_index) = analyzer.parse_position('010101')
+        result = analyzer.lookup('010101', state, agent_index)
+        self.assertTrue(result['exact'])
+        self.assertTrue(result['cached'])
+
+    def test_unproved(self):
+        analyzer = upo.connect4.analysis.Analyzer((7, 6))
+        analysis = analyze(analyzer, '', 3)
+        self.assertFalse(analysis.result['exact'])
+        self.assertEqual(analysis.result['depth'], 3)
+
+    def test_unbounded_evaluation(self):
+        # Heuristic scores beyond the value of a win do not make results exact
+        analyzer = upo.connect4.analysis.Analyzer((7, 6), eval_func=unbounded_evaluation_function)
+        analysis = analyze(analyzer, '33', 3)
+        self.assertFalse(analysis.result['exact'])
+        self.assertEqual(analysis.result['depth'], 3)
+        analysis = analyze(analyzer, '010101', 4)
+        self.assertTrue(analysis.result['exact'])
+        self.assertEqual(analysis.result['move'], 0)
+        self.assertEqual(analysis.result['score'], 1.0)
+
+    def test_final_position(self):
+        analyzer = upo.connect4.analysis.Analyzer((7, 6))
+        (state, agent_index) = analyzer.parse_position('0101010')
+        result = analyzer.lookup('0101010', state, agent_index)
+        self.assertTrue(result['exact'])
+        self.assertIsNone(result['move'])
+        self.assertLess(result['score'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import os
+import sys
+import unittest
+import upo.connect4.agents
+import upo.connect4.engine
+import upo.connect4.notation
+
+
+ENGINE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'engine.py')
+
+
+def make_agents(num_agents):
+    return [upo.connect4.agents.AlphaBetaMinimaxComputerAgent(index, 3) for index in range(num_agents)]
+
+
+def run_engine(commands):
+    """
+    Serves the given command lines with an engine of alpha-beta agents and
+    returns the lines it writes.
+    """
+    output = io.StringIO()
+    engine = upo.connect4.engine.Engine(make_agents, 'test', output)
+    engine.run(io.StringIO(''.join([command + '\n' for command in commands])))
+    return output.getvalue().splitlines()
+
+
+class EngineTest(unittest.TestCase):
+
+    def test_handshake(self):
+        self.assertEqual(run_engine(['engine', 'isready', 'quit', 'isready']),
+                         ['id name test', 'engineok', 'readyok'])
+
+    def test_go_depth(self):
+        # Agent 0 wins in column 0: the first iteration proves it
+        lines = run_engine(['position startpos moves 0 1 0 1 0 1', 'go depth 4'])
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('info depth 1 score '))
+        self.assertTrue(lines[0].endswith(' move 0'))
+        self.assertEqual(lines[1], 'bestmove 0')
+
+    def test_go_own_depth(self):
+        # Agent 0 wins in column 3
+        lines = run_engine(['newgame 4 4 2', 'position columns 11/1//000', 'go'])
+        self.assertTrue(lines[0].startswith('info score '))
+        self.assertEqual(lines[-1], 'bestmove 3')
+
+    def test_newgame_k(self):
+        # With 3 tokens in a row, agent 0 wins in column 2
+        lines = run_engine(['newgame 5 4 2 3', 'position startpos moves 0 0 1 1', 'go depth 2'])
+        self.assertEqual(lines[-1], 'bestmove 2')
+
+    def test_errors(self):
+        lines = run_engine(['foo', 'position startpos moves 9', 'newgame 7 6', 'position columns 0/1', 'go depth 1'])
+        self.assertEqual(lines[:4], ['info string error Unknown command "foo"',
+                                     'info string error Move 1 (column 9) is illegal',
+                                     'info string error Expected width, height, number of agents and optionally k',
+                                     'info string error Position "0/1" has 2 columns instead of 7'])
+        # The position is still the empty board
+        self.assertTrue(lines[-1].startswith('bestmove '))
+        lines = run_engine(['position columns 0000//////'])
+        self.assertEqual(lines, ['info string error Position "0000//////" has 4 tokens of agent 0 instead of 2'])
+
+    def test_full_board(self):
+        lines = run_engine(['newgame 4 4 2', 'position columns 0011/1100/0011/1100', 'go'])
+        self.assertEqual(lines, ['bestmove none'])
+
+
+class EngineAgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = upo.connect4.engine.EngineProcessPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_get_action(self):
+        agent = upo.connect4.engine.EngineAgent(1, [sys.executable, ENGINE_SCRIPT, '-a', 'alphabeta'], depth=2, pool=self.pool)
+        # Agent 1 wins in column 1
+        state = upo.connect4.notation.parse_moves('0121015', (7, 6))
+        self.assertEqual(agent.get_action(state), 1)
+        self.assertEqual(agent.get_engine().get_name(), 'alphabeta')
+        self.assertIsNotNone(agent.get_last_value())
+        # The engine is kept warm between moves
+        engine = agent.get_engine()
+        state = upo.connect4.notation.parse_moves('0101', (7, 6))
+        self.assertIn(agent.get_action(state), state.iter_legal_actions())
+        self.assertIs(agent.get_engine(), engine)
+        agent.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import upo.connect4.agents
+import upo.connect4.dataset
+import upo.connect4.evalbuilder
+import upo.connect4.game
+import upo.connect4.tuning
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def random_states(layout, num_agents, num_states, rng, k=4):
+    """
+    Returns the given number of non-final states reached by random moves.
+    """
+    states = []
+    while len(states) < num_states:
+        state = upo.connect4.game.GameState(layout, num_agents, k)
+        for ply in range(rng.randint(0, layout[0]*layout[1]//2)):
+            if state.is_final():
+                break
+            state.make_move(ply % num_agents, rng.choice(state.iter_legal_actions()))
+        if not state.is_final():
+            states.append(state)
+    return states
+
+
+def random_spec(names, rng):
+    return dict([(name, rng.uniform(-1, 1)) for name in names])
+
+
+class EvaluationFunctionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def test_modes(self):
+        for (num_agents, k) in [(2, 4), (3, 4), (2, 3)]:
+            spec = random_spec(upo.connect4.evalbuilder.get_feature_names(k), self.rng)
+            scan = upo.connect4.evalbuilder.build_evaluation_function(spec, 'scan', k)
+            incremental = upo.connect4.evalbuilder.build_evaluation_function(spec, 'incremental', k)
+            for state in random_states((7, 6), num_agents, 30, self.rng, k):
+                for index in range(num_agents):
+                    agent = upo.connect4.agents.Agent(index)
+                    self.assertAlmostEqual(scan(state, agent), incremental(state, agent))
+
+    def test_terminal_states(self):
+        func = upo.connect4.evalbuilder.build_evaluation_function({'own_3': 5}, win_value=100.0)
+        state = upo.connect4.game.GameState((7, 6), 2)
+        for column in [0, 1, 0, 1, 0, 1, 0]:
+            state.make_move(state.lines.num_tokens() % 2, column)
+        self.assertEqual(func(state, upo.connect4.agents.Agent(0)), 100.0)
+        self.assertEqual(func(state, upo.connect4.agents.Agent(1)), -100.0)
+
+    def test_opponent_lines(self):
+        # Lines holding tokens of two opponents are not opponent lines
+        state = upo.connect4.game.GameState((7, 6), 3)
+        for (index, column) in [(0, 0), (1, 5), (2, 6)]:
+            state.make_move(index, column)
+        func = upo.connect4.evalbuilder.build_evaluation_function({'opp_2': 1})
+        self.assertEqual(func(state, upo.connect4.agents.Agent(0)), 0.0)
+
+    def test_unknown_feature(self):
+        self.assertRaises(Exception, upo.connect4.evalbuilder.build_evaluation_function, {'own_4': 1})
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not available')
+class TunedEvaluationFunctionTest(unittest.TestCase):
+    """
+    Tuned weights evaluate the features they were fitted on.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def test_same_features(self):
+        for num_agents in [2, 3]:
+            for state in random_states((7, 6), num_agents, 30, self.rng):
+                weights = [self.rng.uniform(-1, 1) for name in upo.connect4.tuning.get_feature_names()]
+                func = upo.connect4.evalbuilder.build_evaluation_function(upo.connect4.tuning.make_spec(weights))
+                planes = numpy.array([upo.connect4.dataset.encode_state(state)], dtype=numpy.uint64)
+                for index in range(num_agents):
+                    features = upo.connect4.tuning.extract_features(planes, [index], 7, 6)[0]
+                    z = sum([w*float(f) for (w, f) in zip(weights, features)])
+                    self.assertAlmostEqual(func(state, upo.connect4.agents.Agent(index)), math.tanh(z/2), places=5)
+
+    def test_evaluation_module(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            weights = [self.rng.uniform(-1, 1) for name in upo.connect4.tuning.get_feature_names(5)]
+            upo.connect4.tuning.write_evaluation_module(os.path.join(out_dir, 'tuned_test.py'), weights, 5, 'tuned')
+            sys.path.insert(0, out_dir)
+            try:
+                import tuned_test
+            finally:
+                sys.path.remove(out_dir)
+            self.assertEqual(tuned_test.SPEC, upo.connect4.tuning.make_spec(weights, 5))
+            state = random_states((8, 7), 2, 1, self.rng, 5)[0]
+            expected = upo.connect4.evalbuilder.build_evaluation_function(tuned_test.SPEC, k=5)
+            agent = upo.connect4.agents.Agent(0)
+            self.assertEqual(tuned_test.tuned(state, agent), expected(state, agent))
+        finally:
+            shutil.rmtree(out_dir)
+            sys.modules.pop('tuned_test', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+import unittest
+import upo.connect4.game
+import upo.connect4.hashing
+
+
+def scan_key(game_state, mirrored=False):
+    """
+    Returns the Zobrist key of the given state (or of its mirror image)
+    computed from scratch from its board.
+    """
+    board = game_state.get_board()
+    zobrist = game_state.zobrist
+    key = 0
+    for (x, column) in enumerate(board.data):
+        if mirrored:
+            x = board.w-x-1
+        for (row, token) in enumerate(column):
+            key ^= zobrist.get_key(token, x*board.h+row)
+    return key
+
+
+def play(columns, layout, num_agents=2):
+    state = upo.connect4.game.GameState(layout, num_agents)
+    for (ply, column) in enumerate(columns):
+        state.make_move(ply % num_agents, column)
+    return state
+
+
+class KeyTest(unittest.TestCase):
+    """
+    The incrementally maintained keys match the ones computed from scratch.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def check_keys(self, state):
+        self.assertEqual(state.get_key(), scan_key(state))
+        self.assertEqual(state.get_mirror_key(), scan_key(state, True))
+        (key, mirrored) = upo.connect4.hashing.get_canonical_key(state)
+        self.assertEqual(key, min(scan_key(state), scan_key(state, True)))
+        self.assertEqual(mirrored, scan_key(state, True) < scan_key(state))
+
+    def test_make_unmake(self):
+        for (layout, num_agents) in [((7, 6), 2), ((7, 6), 3), ((6, 5), 2)]:
+            for i in range(20):
+                state = upo.connect4.game.GameState(layout, num_agents)
+                moves = []
+                while not state.is_final():
+                    column = self.rng.choice(state.iter_legal_actions())
+                    agent_index = len(moves) % num_agents
+                    successor = state.generate_successor(agent_index, column)
+                    state.make_move(agent_index, column)
+                    moves.append(column)
+                    self.check_keys(state)
+                    self.check_keys(successor)
+                    self.assertEqual(successor.get_key(), state.get_key())
+                while moves:
+                    state.unmake_move(moves.pop())
+                    self.check_keys(state)
+                self.assertEqual(state.get_key(), 0)
+                self.assertEqual(state.get_mirror_key(), 0)
+
+    def test_mirror_positions(self):
+        columns = [0, 1, 1, 2, 5, 3, 3, 6]
+        state = play(columns, (7, 6))
+        mirror = play([6-c for c in columns], (7, 6))
+        self.assertEqual(state.get_key(), mirror.get_mirror_key())
+        self.assertEqual(state.get_mirror_key(), mirror.get_key())
+        (key, mirrored) = upo.connect4.hashing.get_canonical_key(state)
+        (mirror_key, mirror_mirrored) = upo.connect4.hashing.get_canonical_key(mirror)
+        self.assertEqual(key, mirror_key)
+        self.assertNotEqual(mirrored, mirror_mirrored)
+
+    def test_symmetric_position(self):
+        state = play([3, 3, 2, 2, 4, 4], (7, 6))
+        self.assertEqual(state.get_key(), state.get_mirror_key())
+        self.assertEqual(upo.connect4.hashing.get_canonical_key(state), (state.get_key(), False))
+
+
+class CanonicalTableTest(unittest.TestCase):
+    """
+    Actions stored for a position are mapped back to the probing position,
+    whichever of the two mirror images is stored and probed.
+    """
+
+    def setUp(self):
+        self.columns = [0, 1, 1, 2, 5, 3, 3, 6]
+        self.state = play(self.columns, (7, 6))
+        self.mirror = play([6-c for c in self.columns], (7, 6))
+
+    def test_canonical_actions(self):
+        for mirrored in [False, True]:
+            for action in range(7):
+                canonical = upo.connect4.hashing.to_canonical_action(action, mirrored, 7)
+                self.assertEqual(upo.connect4.hashing.from_canonical_action(canonical, mirrored, 7), action)
+            self.assertIsNone(upo.connect4.hashing.to_canonical_action(None, mirrored, 7))
+
+    def test_lookup(self):
+        for (stored, probed) in [(self.state, self.mirror), (self.mirror, self.state)]:
+            table = upo.connect4.hashing.CanonicalTable()
+            table.store(stored, 0.5, 1)
+            self.assertEqual(len(table), 1)
+            self.assertEqual(table.lookup(stored), (0.5, 1))
+            self.assertTrue(probed in table)
+            self.assertEqual(table.lookup(probed), (0.5, 5))
+            # The entry of the mirror image replaces the stored one
+            table.store(probed, 0.25, 0)
+            self.assertEqual(len(table), 1)
+            self.assertEqual(table.lookup(stored), (0.25, 6))
+            table.store(probed, 0.0)
+            self.assertEqual(table.lookup(stored), (0.0, None))
+
+    def test_transposition_table(self):
+        table = upo.connect4.hashing.TranspositionTable()
+        table.store(self.state, 0, 3, 0.5, upo.connect4.hashing.EXACT_VALUE, 1)
+        self.assertEqual(table.probe(self.state, 0), (3, 0.5, upo.connect4.hashing.EXACT_VALUE, 1))
+        self.assertEqual(table.probe(self.mirror, 0), (3, 0.5, upo.connect4.hashing.EXACT_VALUE, 5))
+        self.assertIsNone(table.probe(self.mirror, 1))
+        table = upo.connect4.hashing.TranspositionTable(fold_mirrors=False)
+        table.store(self.state, 0, 3, 0.5, upo.connect4.hashing.EXACT_VALUE, 1)
+        self.assertIsNone(table.probe(self.mirror, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
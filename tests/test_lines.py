@@ -0,0 +1,238 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+import unittest
+import upo.connect4.game
+import upo.connect4.lines
+import upo.connect4.notation
+
+
+def scan_lines(table, num_agents, tokens):
+    """
+    Returns the (counts, owners) of the lines of the given table computed
+    from scratch, where tokens maps cells to players, counts[line][player] is
+    the number of tokens of player in line and owners[line] is the owner of
+    line.
+    """
+    counts = []
+    owners = []
+    for cells in table.lines:
+        line_counts = [0]*num_agents
+        for c in cells:
+            if c in tokens:
+                line_counts[tokens[c]] += 1
+        players = [q for q in range(num_agents) if line_counts[q] > 0]
+        if not players:
+            owners.append(upo.connect4.lines.EMPTY_LINE)
+        elif len(players) == 1:
+            owners.append(players[0])
+        else:
+            owners.append(upo.connect4.lines.DEAD_LINE)
+        counts.append(line_counts)
+    return (counts, owners)
+
+
+def scan_board(game_state):
+    """
+    Returns the (win, dead) pair of the given game state computed from its
+    board, where win tells if some agent has K tokens in a row and dead tells
+    if no agent can complete a line anymore.
+    """
+    table = game_state.lines.table
+    tokens = {}
+    for (x, column) in enumerate(game_state.get_board().data):
+        for (row, token) in enumerate(column):
+            tokens[table.to_cell(x, row)] = token
+    (counts, owners) = scan_lines(table, game_state.num_agents(), tokens)
+    win = any([owner >= 0 and counts[line][owner] == table.k for (line, owner) in enumerate(owners)])
+    dead = all([owner == upo.connect4.lines.DEAD_LINE for owner in owners])
+    return (win, dead)
+
+
+class LineCountsTest(unittest.TestCase):
+    """
+    The incrementally maintained line statistics match the ones computed from
+    scratch.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def check_counts(self, lc, tokens):
+        table = lc.table
+        n = lc.nagents
+        k = table.k
+        (counts, owners) = scan_lines(table, n, tokens)
+        for line in range(table.num_lines()):
+            self.assertEqual(lc.get_line_owner(line), owners[line])
+            for q in range(n):
+                self.assertEqual(lc.get_line_count(line, q), counts[line][q])
+        for q in range(n):
+            winnable = len([owner for owner in owners if owner in (q, upo.connect4.lines.EMPTY_LINE)])
+            complete = [line for (line, owner) in enumerate(owners) if owner == q and counts[line][q] == k]
+            self.assertEqual(lc.num_winnable_lines(q), winnable)
+            self.assertEqual(lc.num_complete_lines(q), len(complete))
+            self.assertEqual(sorted(lc.get_complete_lines(q)), complete)
+            for c in range(1, k+1):
+                num_open = len([line for (line, owner) in enumerate(owners) if owner == q and counts[line][q] == c])
+                self.assertEqual(lc.num_open_lines(q, c), num_open)
+        winners = [q for q in range(n) if lc.num_complete_lines(q) > 0]
+        dead = all([owner == upo.connect4.lines.DEAD_LINE for owner in owners])
+        self.assertEqual(lc.num_tokens(), len(tokens))
+        self.assertEqual(lc.is_win(), bool(winners))
+        self.assertEqual(lc.is_dead(), dead)
+        self.assertEqual(lc.is_full(), len(tokens) == table.w*table.h)
+        self.assertEqual(lc.is_final(), bool(winners) or dead)
+        self.assertEqual(lc.get_winner(), winners[0] if winners else None)
+        if winners:
+            self.assertEqual(lc.classify(), upo.connect4.lines.WIN)
+        elif dead:
+            self.assertEqual(lc.classify(), upo.connect4.lines.DRAW)
+        else:
+            self.assertEqual(lc.classify(), upo.connect4.lines.IN_PROGRESS)
+
+    def check_push_pop(self, lc, num_tokens=None):
+        """
+        Fills the board (or puts the given number of tokens on it) with tokens
+        of the players in turn in random cells, then empties it removing the
+        tokens in random order, checking the counts after every change.
+        """
+        table = lc.table
+        cells = list(range(table.w*table.h))
+        self.rng.shuffle(cells)
+        cells = cells[:num_tokens]
+        tokens = {}
+        for (i, cell) in enumerate(cells):
+            tokens[cell] = i % lc.nagents
+            lc.push(tokens[cell], cell)
+            self.check_counts(lc, tokens)
+        self.rng.shuffle(cells)
+        for cell in cells:
+            lc.pop(tokens.pop(cell), cell)
+            self.check_counts(lc, tokens)
+
+    def test_push_pop(self):
+        for (layout, num_agents) in [((7, 6), 2), ((7, 6), 3), ((5, 4), 2)]:
+            table = upo.connect4.lines.get_line_table(layout[0], layout[1])
+            for i in range(3):
+                self.check_push_pop(upo.connect4.lines.LineCounts(table, num_agents))
+
+    def test_line_length(self):
+        for k in [3, 5]:
+            table = upo.connect4.lines.get_line_table(7, 6, k)
+            for num_agents in [2, 3]:
+                self.check_push_pop(upo.connect4.lines.LineCounts(table, num_agents))
+
+    def test_sparse(self):
+        for (layout, k, num_agents) in [((7, 6), 4, 2), ((7, 6), 4, 3), ((7, 6), 3, 2)]:
+            table = upo.connect4.lines.get_line_table(layout[0], layout[1], k)
+            lc = upo.connect4.lines.SparseLineCounts(table, num_agents)
+            self.check_push_pop(lc)
+            # Emptied lines are forgotten
+            self.assertEqual(len(lc.counts), 0)
+            self.assertEqual(len(lc.owners), 0)
+
+    def test_large_board(self):
+        table = upo.connect4.lines.get_line_table(16, 16)
+        self.assertTrue(table.num_lines() >= upo.connect4.lines.SPARSE_MIN_LINES)
+        lc = upo.connect4.lines.make_line_counts(table, 2)
+        self.assertTrue(isinstance(lc, upo.connect4.lines.SparseLineCounts))
+        self.check_push_pop(lc, 80)
+        self.assertEqual(len(lc.owners), 0)
+        table = upo.connect4.lines.get_line_table(7, 6)
+        self.assertFalse(isinstance(upo.connect4.lines.make_line_counts(table, 2), upo.connect4.lines.SparseLineCounts))
+
+    def test_dead_line_revival(self):
+        # A line holding tokens of two players is dead until one is removed
+        table = upo.connect4.lines.get_line_table(7, 6)
+        lc = upo.connect4.lines.LineCounts(table, 2)
+        line = table.lines.index((0, 6, 12, 18))
+        lc.push(0, 0)
+        lc.push(0, 6)
+        lc.push(1, 18)
+        self.assertEqual(lc.get_line_owner(line), upo.connect4.lines.DEAD_LINE)
+        self.assertEqual(lc.num_open_lines(0, 2), 0)
+        lc.pop(1, 18)
+        self.assertEqual(lc.get_line_owner(line), 0)
+        self.assertEqual(lc.num_open_lines(0, 2), 1)
+        self.check_counts(lc, {0: 0, 6: 0})
+
+    def test_copy(self):
+        table = upo.connect4.lines.get_line_table(7, 6)
+        for cls in [upo.connect4.lines.LineCounts, upo.connect4.lines.SparseLineCounts]:
+            lc = cls(table, 2)
+            lc.push(0, 0)
+            other = lc.copy()
+            other.push(1, 6)
+            self.check_counts(lc, {0: 0})
+            lc.copy_from(other)
+            self.check_counts(lc, {0: 0, 6: 1})
+            # The copy does not share the sparse dictionaries either
+            other.pop(1, 6)
+            self.check_counts(lc, {0: 0, 6: 1})
+
+
+class GameStateLinesTest(unittest.TestCase):
+    """
+    Wins, ties and dead positions told by the line statistics of random games
+    match a scan of the board, both after make_move and after unmake_move.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def check_state(self, state):
+        (win, dead) = scan_board(state)
+        self.assertEqual(state.is_win(), win)
+        self.assertEqual(state.is_tie(), not win and dead)
+        self.assertEqual(state.is_final(), win or dead)
+
+    def check_random_games(self, layout, num_agents, num_games, k=upo.connect4.lines.DEFAULT_K):
+        for i in range(num_games):
+            state = upo.connect4.game.GameState(layout, num_agents, k)
+            moves = []
+            while not state.is_final():
+                column = self.rng.choice(state.iter_legal_actions())
+                state.make_move(len(moves) % num_agents, column)
+                moves.append(column)
+                self.check_state(state)
+            while moves:
+                state.unmake_move(moves.pop())
+                self.check_state(state)
+
+    def test_random_games(self):
+        self.check_random_games((7, 6), 2, 30)
+        self.check_random_games((7, 6), 3, 30)
+
+    def test_line_length(self):
+        self.check_random_games((7, 6), 2, 20, 3)
+        self.check_random_games((8, 7), 2, 20, 5)
+
+    def test_large_board(self):
+        # The line statistics of the states are sparse
+        self.check_random_games((16, 16), 2, 3)
+
+    def test_early_draw(self):
+        # Nobody can complete a line on this 4x4 board with three empty cells
+        state = upo.connect4.notation.parse_board('01/0101/011/1000', (4, 4))
+        self.assertTrue(state.is_tie())
+        self.check_state(state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import upo.connect4.dataset
+import upo.connect4.game
+import upo.connect4.notation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def random_game(layout, num_agents, rng, max_moves=None):
+    """
+    Returns the columns of a game of random moves, which is stopped when it
+    is over or after max_moves moves.
+    """
+    state = upo.connect4.game.GameState(layout, num_agents)
+    columns = []
+    while not state.is_final() and (max_moves is None or len(columns) < max_moves):
+        column = rng.choice(state.iter_legal_actions())
+        state.make_move(len(columns) % num_agents, column)
+        columns.append(column)
+    return columns
+
+
+class NotationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(5489)
+
+    def test_moves_round_trip(self):
+        for (layout, num_agents) in [((7, 6), 2), ((12, 5), 3)]:
+            for i in range(20):
+                columns = random_game(layout, num_agents, self.rng)
+                text = upo.connect4.notation.format_moves(columns)
+                self.assertEqual(upo.connect4.notation.get_form(text), upo.connect4.notation.MOVES_FORM)
+                self.assertEqual(upo.connect4.notation.parse_moves_columns(text), columns)
+                state = upo.connect4.notation.parse_position(text, layout, num_agents)
+                self.assertEqual(state.lines.num_tokens(), len(columns))
+
+    def test_board_round_trip(self):
+        layout = (7, 6)
+        for i in range(20):
+            columns = random_game(layout, 2, self.rng)
+            state = upo.connect4.notation.parse_moves(upo.connect4.notation.format_moves(columns), layout)
+            text = upo.connect4.notation.format_board(state)
+            self.assertEqual(upo.connect4.notation.get_form(text), upo.connect4.notation.BOARD_FORM)
+            parsed = upo.connect4.notation.parse_position(text, layout)
+            self.assertEqual(parsed.get_board().data, state.get_board().data)
+            self.assertEqual(upo.connect4.notation.format_board(parsed), text)
+            self.assertEqual(upo.connect4.notation.get_agent_to_move(parsed), len(columns) % 2)
+            self.assertEqual(parsed.is_win(), state.is_win())
+
+    def test_empty_board(self):
+        state = upo.connect4.notation.parse_position('', (7, 6))
+        self.assertEqual(upo.connect4.notation.format_board(state), '//////')
+        self.assertEqual(upo.connect4.notation.parse_position('//////', (7, 6)).lines.num_tokens(), 0)
+
+    def test_invalid_positions(self):
+        for text in ['7', '0000000', '00x']:
+            self.assertRaises(Exception, upo.connect4.notation.parse_position, text, (7, 6))
+        for text in ['/////', '0000000//////', '//2////']:
+            self.assertRaises(Exception, upo.connect4.notation.parse_position, text, (7, 6))
+
+    def test_impossible_positions(self):
+        # Wrong numbers of tokens for the turn order
+        for text in ['0000//////', '1//////', '000//1////']:
+            self.assertRaises(Exception, upo.connect4.notation.parse_position, text, (7, 6))
+        # Tokens placed after a line is complete
+        for text in ['0000/111/1////', '00001/111/////', '01/01/01/01///']:
+            self.assertRaises(Exception, upo.connect4.notation.parse_position, text, (7, 6))
+        self.assertRaises(Exception, upo.connect4.notation.parse_position, '01010101', (7, 6))
+        # The game may end with the last move, possibly completing two lines
+        for (text, layout) in [('0/0/0/0/1/1/1', (7, 6)), ('0011/000/10/1011/10/0011', (6, 4))]:
+            self.assertTrue(upo.connect4.notation.parse_position(text, layout).is_win())
+        # Lines of K tokens only
+        self.assertFalse(upo.connect4.notation.parse_position('000/11/////', (7, 6), k=4).is_win())
+        self.assertRaises(Exception, upo.connect4.notation.parse_position, '000/11/1////', (7, 6), 2, 3)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not available')
+    def test_bulk_impossible_positions(self):
+        for text in ['0000//////', '0000/111/1////', '00001/111/////', '01010101', '01010103']:
+            self.assertRaises(Exception, upo.connect4.notation.encode_positions, [b'33', text.encode('ascii')], (7, 6))
+        data = upo.connect4.notation.encode_positions([b'0/0/0/0/1/1/1', b'0101010', b'000/11/////'], (7, 6))
+        self.assertEqual(data['ply'].tolist(), [7, 7, 5])
+        self.assertRaises(Exception, upo.connect4.notation.encode_positions, [b'000/11/1////'], (7, 6), 2, 3)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not available')
+    def test_bulk_encoding(self):
+        layout = (7, 6)
+        games = [random_game(layout, 2, self.rng, self.rng.randint(0, 42)) for i in range(50)]
+        states = [upo.connect4.notation.parse_moves(upo.connect4.notation.format_moves(columns), layout) for columns in games]
+        moves = [upo.connect4.notation.format_moves(columns).encode('ascii') for columns in games]
+        boards = [upo.connect4.notation.format_board(state).encode('ascii') for state in states]
+        # Both forms, mixed, give the bit planes of upo.connect4.dataset
+        data = upo.connect4.notation.encode_positions(moves[:25] + boards[25:], layout)
+        for (i, state) in enumerate(states):
+            self.assertEqual([int(plane) for plane in data['planes'][i]], upo.connect4.dataset.encode_state(state))
+            self.assertEqual(data['ply'][i], state.lines.num_tokens())
+            self.assertEqual(data['to_move'][i], upo.connect4.notation.get_agent_to_move(state))
+            decoded = upo.connect4.notation.make_state(data['planes'][i], layout)
+            self.assertEqual(decoded.get_board().data, state.get_board().data)
+
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not available')
+class PositionFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'positions.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_positions(self, lines):
+        with open(self.path, 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    def test_load(self):
+        positions = ['//////', '3342', '/1//01//0/', '33', '0/1/////', '6543210']
+        self.write_positions(['# Comment', ''] + [p + ' ignored' for p in positions[:3]] + [''] + positions[3:])
+        chunks = list(upo.connect4.notation.iter_position_chunks(self.path, (7, 6), chunk_size=4))
+        self.assertEqual([len(chunk['ply']) for chunk in chunks], [4, 2])
+        data = upo.connect4.notation.load_positions(self.path, (7, 6), chunk_size=4)
+        self.assertEqual(list(data['layout']), [7, 6])
+        expected = upo.connect4.notation.encode_positions([p.encode('ascii') for p in positions], (7, 6))
+        for name in ['planes', 'to_move', 'ply']:
+            self.assertEqual(data[name].tolist(), expected[name].tolist())
+        states = list(upo.connect4.notation.iter_positions(self.path, (7, 6)))
+        self.assertEqual([upo.connect4.notation.format_board(state) for state in states],
+                         [upo.connect4.notation.format_board(upo.connect4.notation.parse_position(p, (7, 6))) for p in positions])
+
+    def test_lazy_chunks(self):
+        # A chunk is encoded before the following lines are read
+        self.write_positions(['33', '34', '35', 'x'])
+        chunks = upo.connect4.notation.iter_position_chunks(self.path, (7, 6), chunk_size=2)
+        self.assertEqual(next(chunks)['ply'].tolist(), [2, 2])
+        self.assertRaises(Exception, next, chunks)
+
+    def test_empty_file(self):
+        self.write_positions(['# Nothing'])
+        data = upo.connect4.notation.load_positions(self.path, (7, 6))
+        self.assertEqual(data['planes'].shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
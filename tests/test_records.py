@@ -0,0 +1,120 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import upo.connect4.agents
+import upo.connect4.game
+import upo.connect4.records
+
+
+def play_game(layout, k, num_agents=2):
+    """
+    Plays a game of random agents and returns it.
+    """
+    agents = [upo.connect4.agents.RandomComputerAgent(index) for index in range(num_agents)]
+    game = upo.connect4.game.Game(agents, layout, k)
+    while not game.is_over():
+        game.make_move()
+    return game
+
+
+class GameRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'games.c4r')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameRecord(self, record, other):
+        self.assertEqual(record.to_dict(), other.to_dict())
+        self.assertEqual(record.get_moves(), other.get_moves())
+
+    def test_write_read(self):
+        records = []
+        for (i, num_opening) in enumerate([0, 2, 5]):
+            game = play_game((8, 7), 5)
+            records.append(upo.connect4.records.GameRecord.from_game(game, i, num_opening))
+        with upo.connect4.records.GameRecordWriter(self.path, 8, 7, 2, k=5) as writer:
+            for record in records:
+                writer.write(record)
+        self.assertTrue(upo.connect4.records.is_record_file(self.path))
+        with upo.connect4.records.GameRecordReader(self.path) as reader:
+            self.assertEqual(reader.get_layout(), (8, 7))
+            self.assertEqual(reader.get_k(), 5)
+            self.assertEqual(reader.num_agents(), 2)
+            self.assertEqual(len(reader), len(records))
+            for (i, record) in enumerate(records):
+                self.assertSameRecord(reader[i], record)
+                self.assertEqual(reader.get_columns(i), record.columns)
+                self.assertEqual(reader.get_num_moves(i), len(record.columns))
+            self.assertEqual([r.game for r in reader], [0, 1, 2])
+            self.assertEqual([t[0] for t in reader.iter_results()], [0, 1, 2])
+
+    def test_dict_round_trip(self):
+        game = play_game((7, 6), 3, 3)
+        record = upo.connect4.records.GameRecord.from_game(game, 7, 3)
+        record.timings = [float(ply) for ply in range(len(record.columns))]
+        data = record.to_dict()
+        self.assertEqual(data['k'], 3)
+        self.assertSameRecord(upo.connect4.records.GameRecord.from_dict(data), record)
+        # Records written before k was stored are k=4 games
+        del data['k']
+        self.assertEqual(upo.connect4.records.GameRecord.from_dict(data).k, 4)
+
+    def test_append(self):
+        first = upo.connect4.records.GameRecord.from_game(play_game((7, 6), 4), 0)
+        second = upo.connect4.records.GameRecord.from_game(play_game((7, 6), 4), 1)
+        with upo.connect4.records.GameRecordWriter(self.path, 7, 6, 2) as writer:
+            writer.write(first)
+        with upo.connect4.records.GameRecordWriter(self.path, 7, 6, 2) as writer:
+            self.assertEqual(writer.num_records(), 1)
+            writer.write(second)
+        with upo.connect4.records.GameRecordReader(self.path) as reader:
+            self.assertEqual(len(reader), 2)
+            self.assertSameRecord(reader[-1], second)
+        # The header must match
+        self.assertRaises(Exception, upo.connect4.records.GameRecordWriter, self.path, 7, 6, 2, k=5)
+        self.assertRaises(Exception, upo.connect4.records.GameRecordWriter, self.path, 7, 6, 3)
+
+    def test_mismatching_record(self):
+        record = upo.connect4.records.GameRecord.from_game(play_game((7, 6), 5), 0)
+        with upo.connect4.records.GameRecordWriter(self.path, 7, 6, 2) as writer:
+            self.assertRaises(Exception, writer.write, record)
+
+    def test_version_1(self):
+        record = upo.connect4.records.GameRecord.from_game(play_game((7, 6), 4), 0)
+        with upo.connect4.records.GameRecordWriter(self.path, 7, 6, 2) as writer:
+            writer.write(record)
+        # A version 1 header has padding in place of k
+        with open(self.path, 'r+b') as f:
+            data = bytearray(f.read(upo.connect4.records._HEADER.size))
+            data[4] = 1
+            data[11] = 0
+            f.seek(0)
+            f.write(data)
+        with upo.connect4.records.GameRecordReader(self.path) as reader:
+            self.assertEqual(reader.get_k(), 4)
+            self.assertSameRecord(reader[0], record)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+import upo.connect4.agents
+import upo.connect4.game
+import upo.connect4.sandbox
+
+
+TIMEOUT = 0.5
+
+
+class SleepyComputerAgent(upo.connect4.agents.ComputerAgent):
+    """
+    An agent that sleeps well past the timeout before its move on the empty
+    board, and moves at once in the leftmost column otherwise.
+    """
+    def get_action(self, game_state):
+        if game_state.get_board().is_empty():
+            time.sleep(60)
+        return min(game_state.get_legal_actions())
+
+
+class SandboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = upo.connect4.sandbox.AgentWorkerPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_timeout(self):
+        agent = upo.connect4.sandbox.SandboxedAgent(SleepyComputerAgent(0), TIMEOUT, self.pool)
+        worker = self.pool.get_worker(agent.get_agent())
+        process = worker.process
+        start_ts = time.time()
+        self.assertRaises(upo.connect4.game.MoveTimeout, agent.get_action, upo.connect4.game.GameState((7, 6), 2))
+        self.assertTrue(time.time()-start_ts < 10*TIMEOUT)
+        # The killed worker is replaced by a fresh one
+        self.assertFalse(process.is_alive())
+        self.assertIs(self.pool.get_worker(agent.get_agent()), worker)
+        self.assertTrue(worker.is_alive())
+        self.assertIsNot(worker.process, process)
+        state = upo.connect4.game.GameState((7, 6), 2)
+        state.make_move(1, 3)
+        self.assertEqual(agent.get_action(state), 0)
+
+    def test_warm_worker(self):
+        agent = upo.connect4.sandbox.SandboxedAgent(SleepyComputerAgent(0), TIMEOUT, self.pool)
+        process = self.pool.get_worker(agent.get_agent()).process
+        state = upo.connect4.game.GameState((7, 6), 2)
+        for column in [3, 2]:
+            state.make_move(1, column)
+            self.assertEqual(agent.get_action(state), 0)
+        self.assertIs(self.pool.get_worker(agent.get_agent()).process, process)
+        agent.close()
+        self.assertEqual(len(self.pool.workers), 0)
+        self.assertFalse(process.is_alive())
+
+    def test_forfeit(self):
+        agents = [upo.connect4.sandbox.SandboxedAgent(SleepyComputerAgent(0), TIMEOUT, self.pool),
+                  upo.connect4.agents.FirstFitLeftComputerAgent(1)]
+        game = upo.connect4.game.Game(agents, (7, 6))
+        self.assertIsNone(game.make_move())
+        self.assertTrue(game.is_over())
+        self.assertIs(game.get_forfeiting_agent(), agents[0])
+        self.assertEqual(game.stats.get_tot_forfeits(0), 1)
+        self.assertEqual(game.stats.get_tot_num_moves(0), 0)
+        self.assertEqual(game.stats.get_tot_forfeits(1), 0)
+        self.assertTrue(game.get_state().get_board().is_empty())
+        # A new game starts with a fresh worker
+        game.reset()
+        self.assertFalse(game.is_over())
+        self.assertTrue(self.pool.get_worker(agents[0].get_agent()).is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import upo.connect4.agents
+import upo.connect4.game
+import upo.connect4.notation
+import upo.connect4.tablebase
+
+
+def solve(game_state):
+    """
+    Returns the value of the given (non-final) state for the agent to move,
+    as stored in endgame tables, by a plain negamax search.
+    """
+    agent = game_state.lines.num_tokens() % 2
+    best = None
+    for column in game_state.iter_legal_actions():
+        child = game_state.copy()
+        child.make_move(agent, column)
+        if child.is_win():
+            value = 1
+        elif child.is_final():
+            value = 0
+        else:
+            value = solve(child)
+            if value > 0:
+                value = -(value+1)
+            elif value < 0:
+                value = -value+1
+        if best is None or upo.connect4.tablebase._rank(value) > upo.connect4.tablebase._rank(best):
+            best = value
+    return best
+
+
+class TensEvaluationFunction:
+    """
+    Scores final states +-100 and any other state 50.
+    """
+
+    win_value = 100.0
+
+    def __call__(self, game_state, agent, **context):
+        if game_state.is_final():
+            if game_state.is_winner(agent.get_index()):
+                return 100.0
+            if game_state.is_tie():
+                return 0.0
+            return -100.0
+        return 50.0
+
+
+def random_positions(layout, num_positions, min_tokens, rng):
+    """
+    Returns the given number of non-final states with at least min_tokens
+    tokens, reached by random moves.
+    """
+    positions = []
+    while len(positions) < num_positions:
+        state = upo.connect4.game.GameState(layout, 2)
+        while not state.is_final() and state.lines.num_tokens() < min_tokens:
+            state.make_move(state.lines.num_tokens() % 2, rng.choice(state.iter_legal_actions()))
+        if not state.is_final():
+            positions.append(state)
+    return positions
+
+
+class TablebaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.dir, '4x4.c4tb')
+        # Solves the whole 4x4 game
+        cls.count = upo.connect4.tablebase.build_tablebase(cls.path, (4, 4))
+        cls.tablebase = upo.connect4.tablebase.Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        shutil.rmtree(cls.dir)
+
+    def test_header(self):
+        self.assertTrue(upo.connect4.tablebase.is_tablebase_file(self.path))
+        self.assertEqual(self.tablebase.get_layout(), (4, 4))
+        self.assertEqual(self.tablebase.get_k(), 4)
+        self.assertEqual(self.tablebase.get_max_empty(), 16)
+        self.assertEqual(len(self.tablebase), self.count)
+
+    def test_probe_vs_search(self):
+        rng = random.Random(5489)
+        for state in random_positions((4, 4), 100, 8, rng):
+            self.assertEqual(self.tablebase.probe(state), solve(state))
+
+    def test_mirror(self):
+        rng = random.Random(5489)
+        for state in random_positions((4, 4), 20, 6, rng):
+            mirror = upo.connect4.game.GameState((4, 4), 2)
+            for (x, column) in enumerate(reversed(state.get_board().data)):
+                for token in column:
+                    mirror.make_move(token, x)
+            self.assertEqual(self.tablebase.probe(mirror), self.tablebase.probe(state))
+
+    def test_not_covered(self):
+        self.assertIsNone(self.tablebase.probe(upo.connect4.game.GameState((5, 4), 2)))
+        self.assertIsNone(self.tablebase.probe(upo.connect4.game.GameState((4, 4), 3)))
+        self.assertIsNone(self.tablebase.probe(upo.connect4.game.GameState((4, 4), 2, 3)))
+
+    def test_agent_value(self):
+        rng = random.Random(5489)
+        for state in random_positions((4, 4), 20, 8, rng):
+            value = solve(state)
+            to_move = state.lines.num_tokens() % 2
+            expected = 0.0 if value == 0 else (1.0 if value > 0 else -1.0)
+            self.assertEqual(self.tablebase.get_value(state, to_move), expected)
+            self.assertEqual(self.tablebase.get_value(state, 1-to_move), -expected)
+
+    def test_search_agent(self):
+        # A search agent probing the table plays a move that keeps the value
+        # of the position
+        rng = random.Random(5489)
+        for state in random_positions((4, 4), 10, 6, rng):
+            to_move = state.lines.num_tokens() % 2
+            agent = upo.connect4.agents.AlphaBetaMinimaxComputerAgent(to_move, 2)
+            agent.set_tablebase(self.tablebase)
+            column = agent.get_action(state)
+            child = state.copy()
+            child.make_move(to_move, column)
+            if child.is_final():
+                continue
+            value = self.tablebase.get_value(state, to_move)
+            self.assertEqual(self.tablebase.get_value(child, to_move), value)
+
+
+class WinValueTest(unittest.TestCase):
+    """
+    Table hits are scored on the scale of the evaluation function.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        path = os.path.join(self.dir, '4x5.c4tb')
+        # Agent 0 has no immediate win, but wins with column 0: the table only
+        # holds the positions that follow this move
+        self.state = upo.connect4.notation.parse_moves('0112122323', (4, 5))
+        child = self.state.copy()
+        child.make_move(0, 0)
+        upo.connect4.tablebase.build_tablebase(path, (4, 5), roots=[child])
+        self.tablebase = upo.connect4.tablebase.Tablebase(path)
+        self.assertEqual(self.tablebase.get_value(child, 0), 1.0)
+
+    def tearDown(self):
+        self.tablebase.close()
+        shutil.rmtree(self.dir)
+
+    def get_action(self, agent_class, win_value=None):
+        agent = agent_class(0, 3, TensEvaluationFunction())
+        agent.set_tablebase(self.tablebase, win_value)
+        return agent.get_action(self.state)
+
+    def test_evaluation_win_value(self):
+        for agent_class in [upo.connect4.agents.MinimaxComputerAgent,
+                            upo.connect4.agents.AlphaBetaMinimaxComputerAgent,
+                            upo.connect4.agents.ParanoidComputerAgent]:
+            self.assertEqual(self.get_action(agent_class), 0)
+
+    def test_explicit_win_value(self):
+        agent_class = upo.connect4.agents.AlphaBetaMinimaxComputerAgent
+        self.assertEqual(self.get_action(agent_class, 100.0), 0)
+        # A table win worth less than a heuristic value is thrown away
+        self.assertNotEqual(self.get_action(agent_class, 1.0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import time
+import unittest
+import upo.connect4.agents
+import upo.connect4.game
+
+# Runs without a screen
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+try:
+    import pygame
+    import upo.connect4.ui
+except ImportError:
+    pygame = None
+
+
+def wait_for(predicate, timeout=10.0):
+    """
+    Waits until the given predicate holds, for at most timeout seconds, and
+    returns its last value.
+    """
+    deadline = time.time()+timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def make_ui(agents, render_mode):
+    """
+    Returns a user interface for a new 7x6 game between the given agents,
+    with its window opened on the dummy video driver.
+    """
+    game = upo.connect4.game.Game(agents, (7, 6))
+    ui = upo.connect4.ui.PyGameUI(game, (320, 240), render_mode=render_mode)
+    ui.init_display()
+    return ui
+
+
+def cell_rect(ui, column, row):
+    """
+    Returns the rectangle redrawn for a token at the given board position.
+    """
+    (x, y) = ui.board_to_screen_coords((column, row))
+    return pygame.Rect(x, y, ui.tile_size+2, ui.tile_size+2)
+
+
+@unittest.skipIf(pygame is None, 'pygame is not installed')
+class MoveRunnerTest(unittest.TestCase):
+    """
+    Computer moves are searched in a background thread while the window keeps
+    being drawn.
+    """
+
+    def setUp(self):
+        pygame.init()
+        self.state = upo.connect4.game.GameState((7, 6), 2)
+        # Avoids the opening move played without searching
+        self.state.make_move(0, 3)
+
+    def tearDown(self):
+        pygame.quit()
+
+    def test_action(self):
+        runner = upo.connect4.ui.MoveRunner(upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1, 3), self.state)
+        runner.start()
+        self.assertTrue(wait_for(runner.is_done))
+        self.assertIsNone(runner.get_error())
+        self.assertTrue(self.state.is_legal_action(runner.get_action()))
+        self.assertGreater(runner.get_elapsed_time(), 0)
+
+    def test_progress_and_cancel(self):
+        runner = upo.connect4.ui.MoveRunner(upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1), self.state)
+        runner.start()
+        self.assertTrue(wait_for(lambda: runner.get_progress() is not None and runner.get_progress()['nodes'] > 0))
+        self.assertFalse(runner.is_done())
+        runner.cancel()
+        self.assertTrue(runner.is_done())
+        self.assertIsInstance(runner.get_error(), upo.connect4.agents.SearchAborted)
+
+    def test_cancel_right_after_start(self):
+        runner = upo.connect4.ui.MoveRunner(upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1), self.state)
+        runner.start()
+        runner.cancel()
+        self.assertTrue(runner.is_done())
+        self.assertIsInstance(runner.get_error(), upo.connect4.agents.SearchAborted)
+
+
+@unittest.skipIf(pygame is None, 'pygame is not installed')
+class DirtyRenderingTest(unittest.TestCase):
+    """
+    The 'dirty' rendering mode only redraws the rectangles that changed.
+    """
+
+    def setUp(self):
+        pygame.init()
+        agents = [upo.connect4.agents.FirstFitLeftComputerAgent(0),
+                  upo.connect4.agents.FirstFitLeftComputerAgent(1)]
+        self.ui = make_ui(agents, 'dirty')
+
+    def tearDown(self):
+        pygame.quit()
+
+    def test_static_state(self):
+        for i in range(3):
+            self.assertEqual(self.ui.draw_dirty(None, [], 0, None), [])
+
+    def test_moves(self):
+        game = self.ui.game
+        height = game.get_state().get_board().height()
+        for (column, row) in [(0, height-1), (0, height-2), (0, height-3)]:
+            self.assertEqual(game.make_move(), column)
+            self.assertEqual(self.ui.draw_dirty(None, [], 0, None), [cell_rect(self.ui, column, row)])
+        self.assertEqual(self.ui.draw_dirty(None, [], 0, None), [])
+
+    def test_column_highlight(self):
+        (x0, y0) = self.ui.board_to_screen_coords((0, 0))
+        (x1, y1) = self.ui.board_to_screen_coords((1, 0))
+        first_rects = self.ui.draw_dirty((x0+1, y0+1), [], 0, None)
+        self.assertEqual(len(first_rects), 1)
+        # Moving inside the same column changes nothing
+        self.assertEqual(self.ui.draw_dirty((x0+2, y0+2), [], 0, None), [])
+        # The old highlight is erased and the new one is drawn
+        rects = self.ui.draw_dirty((x1+1, y1+1), [], 0, None)
+        self.assertEqual(len(rects), 2)
+        self.assertEqual(rects[0], first_rects[0])
+        self.assertEqual(self.ui.draw_dirty(None, [], 0, None), [first_rects[0].move(x1-x0, 0)])
+
+    def test_computer_move(self):
+        agents = [upo.connect4.agents.AlphaBetaMinimaxComputerAgent(0, 3),
+                  upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1, 3)]
+        ui = make_ui(agents, 'dirty')
+        self.assertEqual(ui.draw_dirty(None, [], 0, None), [])
+        game = ui.game
+        runner = upo.connect4.ui.MoveRunner(game.get_current_agent(), game.get_state())
+        runner.start()
+        # While the agent thinks, only its progress is redrawn
+        progress_rects = ui.draw_dirty(None, [], 0, runner)
+        self.assertEqual(len(progress_rects), 1)
+        self.assertTrue(wait_for(runner.is_done))
+        column = game.commit_move(runner.get_action(), runner.get_elapsed_time())
+        # The new token and the area of the removed progress are redrawn
+        row = game.get_state().get_board().height()-1
+        rects = ui.draw_dirty(None, [], 0, None)
+        self.assertEqual(sorted(map(tuple, rects)), sorted([tuple(cell_rect(ui, column, row)), tuple(progress_rects[0])]))
+        self.assertEqual(ui.draw_dirty(None, [], 0, None), [])
+
+    def test_same_pixels_as_full_mode(self):
+        game = self.ui.game
+        for i in range(5):
+            game.make_move()
+        (x, y) = self.ui.board_to_screen_coords((2, 0))
+        self.ui.draw_dirty((x+1, y+1), [], 0, None)
+        self.ui.draw_dirty(None, [], 0, None)
+        dirty_pixels = pygame.image.tostring(self.ui.display, 'RGB')
+        # Draws the same frame as the 'full' rendering mode
+        full_ui = upo.connect4.ui.PyGameUI(game, (320, 240), render_mode='full')
+        full_ui.init_display()
+        full_ui.display.fill(full_ui.bg_color)
+        full_ui.draw_board()
+        full_ui.draw_legend()
+        self.assertEqual(pygame.image.tostring(full_ui.display, 'RGB'), dirty_pixels)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,11 +18,17 @@
 import pathlib
 import random
 import upo.connect4.agents
+import upo.connect4.engine
 import upo.connect4.game
+import upo.connect4.records
+import upo.connect4.sandbox
 import upo.utils
 
 
 verbosity = 2
+move_timeout = 0 # maximum number of seconds an agent can think about a move (zero disables the timeout)
+records_file = None # file where to append the binary record of each game (see upo.connect4.records); None disables recording
+engine_command = None # command line of the engine processes running the agents (e.g., [sys.executable, 'engine.py']; see upo.connect4.engine), which are kept warm across games; None runs the agents in-process
 
 
 def make_schedule(players):
@@ -36,7 +42,20 @@ def make_schedule(players):
     return schedule
 
 
-def play_schedule(schedule):
+def make_engine_agent(index, evalfunc_name, depth):
+    """
+    Returns an agent that searches until the given depth with the given
+    evaluation function in an engine process.
+    """
+    command = engine_command + ['-a', 'custom', '--name', evalfunc_name,
+                                '--agentargs', 'class=myagents.AlphaBetaMinimaxComputerAgent', 'evalfunc=' + evalfunc_name]
+    # The protocol counts plies, while agents count the root as well
+    agent = upo.connect4.engine.EngineAgent(index, command, depth-1, None, move_timeout)
+    agent.set_name(evalfunc_name)
+    return agent
+
+
+def play_schedule(schedule, records=None):
     winners = []
     for match in schedule:
         if verbosity > 1:
@@ -53,7 +72,14 @@ def play_schedule(schedule):
         for r in range(nrun):
             agents = []
             red_agent = yellow_agent = None
-            if r < (nrun//2):
+            if engine_command is not None:
+                if r < (nrun//2):
+                    red_agent = make_engine_agent(0, match[0], depth)
+                    yellow_agent = make_engine_agent(1, match[1], depth)
+                else:
+                    red_agent = make_engine_agent(0, match[1], depth)
+                    yellow_agent = make_engine_agent(1, match[0], depth)
+            elif r < (nrun//2):
                 red_agent = upo.connect4.agents.AlphaBetaMinimaxComputerAgent(0, depth, evalfunc1)
                 red_agent.set_name(match[0])
                 yellow_agent = upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1, depth, evalfunc2)
@@ -63,6 +89,11 @@ def play_schedule(schedule):
                 red_agent.set_name(match[1])
                 yellow_agent = upo.connect4.agents.AlphaBetaMinimaxComputerAgent(1, depth, evalfunc1)
                 yellow_agent.set_name(match[0])
+            if move_timeout > 0 and engine_command is None:
+                # Runs agents in worker processes so that a runaway agent
+                # cannot stall the whole tournament
+                red_agent = upo.connect4.sandbox.SandboxedAgent(red_agent, move_timeout)
+                yellow_agent = upo.connect4.sandbox.SandboxedAgent(yellow_agent, move_timeout)
             agents = [red_agent, yellow_agent]
 
             if verbosity > 1:
@@ -71,13 +102,24 @@ def play_schedule(schedule):
             game = upo.connect4.game.Game(agents, (7,6))
             while not game.is_over():
                 game.make_move()
+            if move_timeout > 0 and engine_command is None:
+                red_agent.close()
+                yellow_agent.close()
+            if records is not None:
+                records.write(upo.connect4.records.GameRecord.from_game(game, records.num_records()))
             match_stats[red_agent.get_name()]['nmoves'] += game.get_stats().get_tot_num_moves(red_agent.get_index())
             match_stats[red_agent.get_name()]['nstates'] += game.get_stats().get_tot_expanded_states(red_agent.get_index())
             match_stats[red_agent.get_name()]['timings'] += game.get_stats().get_tot_elapsed_time(red_agent.get_index())
             match_stats[yellow_agent.get_name()]['nmoves'] += game.get_stats().get_tot_num_moves(yellow_agent.get_index())
             match_stats[yellow_agent.get_name()]['nstates'] += game.get_stats().get_tot_expanded_states(yellow_agent.get_index())
             match_stats[yellow_agent.get_name()]['timings'] += game.get_stats().get_tot_elapsed_time(yellow_agent.get_index())
-            if game.get_state().is_win():
+            if game.get_forfeiting_agent() is not None:
+                losing_agent = game.get_forfeiting_agent()
+                winning_agent = yellow_agent if losing_agent is red_agent else red_agent
+                if verbosity > 1:
+                    print('-> Run ', r, ' is won by ' + winning_agent.get_name() + ' (' + losing_agent.get_name() + ' timed out)!')
+                match_stats[winning_agent.get_name()]['win_count'] += 1
+            elif game.get_state().is_win():
                 winning_cells = game.get_state().get_winner_positions()
                 winning_agent = game.get_agent(game.get_state().get_winner())
                 if verbosity > 1:
@@ -156,6 +198,10 @@ def main():
 
     random.seed(5489) # Just fix the seed to make executions reproducible
 
+    records = None
+    if records_file is not None:
+        records = upo.connect4.records.GameRecordWriter(records_file, 7, 6, 2, 64)
+
     #schedule = make_schedule(safe_modules)
 
     #if verbosity > 0:
@@ -176,7 +222,7 @@ def main():
         if verbosity > 0:
             print('Schedule #', i, ': ', schedule)
         old_winners_len = len(winners)
-        winners = play_schedule(schedule)
+        winners = play_schedule(schedule, records)
         if verbosity > 0:
             print('-> Schedule #', i, ' Winners: ', winners)
         if len(winners) > 1 and (len(winners) % 2) != 0:
@@ -190,7 +236,7 @@ def main():
             tie_schedule = make_schedule(tie_agents)
             if verbosity > 0:
                 print('Tie-breaker Schedule #', i, ': ', tie_schedule)
-            tie_winners = play_schedule(tie_schedule)
+            tie_winners = play_schedule(tie_schedule, records)
             if verbosity > 0:
                 print('-> Tie-breaker Schedule #', i, ' Winners: ', tie_winners)
             if len(tie_winners) > 1:
@@ -212,7 +258,7 @@ def main():
         schedule = make_schedule([winner, instructor_evalfunc])
         if verbosity > 0:
             print('Schedule #', i, ': ', schedule)
-        tmp_winners = play_schedule(schedule)
+        tmp_winners = play_schedule(schedule, records)
         if verbosity > 0:
             print('-> Schedule #', i, ' Winners: ', tmp_winners)
 
@@ -225,6 +271,12 @@ def main():
     else:
         print('-> Nobody is able to beat the instructor!')
 
+    if engine_command is not None:
+        upo.connect4.engine.default_pool.close()
+
+    if records is not None:
+        records.close()
+
 
 if __name__ == '__main__':
     import sys
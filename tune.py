@@ -0,0 +1,115 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tunes the weights of a linear evaluation function on recorded positions (see
+upo.connect4.tuning) and writes the resulting evaluation function as a Python
+module.
+"""
+
+
+import argparse
+import multiprocessing
+import sys
+import time
+import upo.connect4.dataset
+import upo.connect4.records
+import upo.connect4.tuning
+
+
+def load_positions(args):
+    """
+    Loads the positions of all the input files and returns the tuple
+    (planes, to_move, outcome, layout, k).
+    """
+    import numpy
+    data = []
+    for path in args.inputs:
+        if upo.connect4.records.is_record_file(path):
+            data.append(upo.connect4.tuning.load_record_positions(path, args.skip))
+        else:
+            shard = upo.connect4.dataset.load_shards([path])
+            if args.skip > 0:
+                keep = shard['ply'] >= args.skip
+                for name in ['planes', 'to_move', 'outcome']:
+                    shard[name] = shard[name][keep]
+            data.append(shard)
+    layout = tuple(data[0]['layout'])
+    # Shards written before k was stored hold k=4 games
+    k = int(data[0].get('k', 4))
+    for d in data:
+        if tuple(d['layout']) != layout or int(d.get('k', 4)) != k:
+            raise Exception('Input files have different layouts or k')
+    return (numpy.concatenate([d['planes'] for d in data]),
+            numpy.concatenate([d['to_move'] for d in data]),
+            numpy.concatenate([d['outcome'] for d in data]),
+            layout,
+            k)
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="UPO :: Connect 4 game :: Evaluation weight tuner")
+
+    parser.add_argument('inputs', type=str, nargs='+',
+                        help='Self-play shards (.npz, see selfplay.py) or game record files (see batch.py --records).')
+    parser.add_argument('--batch-size', dest='batch_size', type=int,
+                        help='Number of positions per mini-batch.', default=4096)
+    parser.add_argument('-e', '--epochs', dest='epochs', type=int,
+                        help='Number of passes over the positions.', default=20)
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Number of processes computing mini-batch gradients in parallel (defaults to the number of CPUs).', default=multiprocessing.cpu_count())
+    parser.add_argument('--l2', dest='l2', type=float,
+                        help='Weight of the L2 regularization term.', default=0.0)
+    parser.add_argument('--learning-rate', dest='learning_rate', type=float,
+                        help='Learning rate.', default=0.05)
+    parser.add_argument('--name', dest='name', type=str,
+                        help='Name of the evaluation function in the output module.', default='better_evaluation_function')
+    parser.add_argument('-o', '--output', dest='output', type=str,
+                        help='The Python module where to write the tuned evaluation function.', default='tuned_evaluation.py')
+    parser.add_argument('--seed', dest='seed', type=int,
+                        help='The seed of the random number generator.', default=5489)
+    parser.add_argument('--skip', dest='skip', type=int,
+                        help='Number of plies at the beginning of each game that are not used.', default=0)
+
+    args = parser.parse_args()
+
+    if args.batch_size <= 0:
+        parser.error('Batch size must be a positive number')
+    if args.epochs < 0:
+        parser.error('Number of epochs must be a nonnegative number')
+    if args.jobs <= 0:
+        parser.error('Number of jobs must be a positive number')
+
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_options()
+    start_ts = time.time()
+    (planes, to_move, outcome, layout, k) = load_positions(args)
+    features = upo.connect4.tuning.extract_features(planes, to_move, layout[0], layout[1], k)
+    targets = upo.connect4.tuning.outcome_targets(outcome)
+    sys.stderr.write('Positions: ' + str(len(targets)) + ', features extracted in ' + '{0:.2f}'.format(time.time()-start_ts) + 's\n')
+    tuner = upo.connect4.tuning.TexelTuner(features, targets, args.batch_size, args.learning_rate, args.l2, args.jobs, args.seed)
+    sys.stderr.write('Initial loss: ' + '{0:.6f}'.format(tuner.loss()) + '\n')
+    def report(epoch, loss):
+        sys.stderr.write('Epoch ' + str(epoch+1) + ': loss ' + '{0:.6f}'.format(loss) + '\n')
+    weights = tuner.fit(args.epochs, report)
+    tuner.close()
+    for (feature, w) in zip(upo.connect4.tuning.get_feature_names(k), weights):
+        print(feature + ': ' + '{0:.6f}'.format(w))
+    upo.connect4.tuning.write_evaluation_module(args.output, weights, k, name=args.name)
+    sys.stderr.write('Evaluation function written to ' + args.output + ' (' + '{0:.2f}'.format(time.time()-start_ts) + 's)\n')
@@ -16,6 +16,10 @@
 
 
 import random
+import threading
+import time
+import upo.connect4.hashing
+import upo.connect4.tracing
 import upo.utils
 
 
@@ -34,7 +38,7 @@ class Agent:
         The Agent will receive a GameState object and must return an action
         representing the column of the board where to put the token.
         """
-        utils.raise_undefined_method()
+        upo.utils.raise_undefined_method()
 
     def get_index(self):
         return self.idx
@@ -48,6 +52,22 @@ class Agent:
     def is_interactive(self):
         return False
 
+    def start_pondering(self, game_state, agent_index):
+        """
+        Tells the agent that the given agent has to move in the given state, so
+        that the agent can think in the background while waiting for its turn.
+        The given state must not be modified by the agent.
+        By default, the agent does nothing.
+        """
+        pass
+
+    def stop_pondering(self):
+        """
+        Tells the agent to stop thinking in the background, if it is doing so.
+        By default, the agent does nothing.
+        """
+        pass
+
     def set_verbosity_level(self, level):
         """
         Set the verbosity level to the given value.
@@ -66,6 +86,26 @@ class Agent:
 ################################################################################
 
 
+class SearchAborted(Exception):
+    """
+    Raised inside a search when the search has been asked to stop.
+    """
+    pass
+
+
+# Outcomes of a game proved by a search, for the searching agent (see
+# SearchComputerAgent.get_outcome)
+LOSS = -1
+DRAW = 0
+WIN = 1
+
+# Outcome of a node whose value depends on the evaluation function
+UNKNOWN_OUTCOME = (LOSS, WIN, False)
+
+
+################################################################################
+
+
 class HumanAgent(Agent):
     """
     An agent controlled by human.
@@ -182,51 +222,582 @@ def improved_evaluation_function(game_state, agent, **context):
 default_evaluation_function = improved_evaluation_function
 
 
+class VectorEvaluationFunction:
+    """
+    Adapts an evaluation function to a vector-valued evaluation function for
+    n-player searches (see MaxNComputerAgent).
+
+    The resulting function evaluates a node for every agent with the given
+    evaluation function, whose values are assumed to lie in
+    [lower_bound, upper_bound] (values outside this range are clamped), and
+    returns the list of these values, shifted to be nonnegative and
+    normalized to sum to 1 (uniform values are returned when they are all
+    zero).
+    """
+    def __init__(self, eval_func=default_evaluation_function, lower_bound=-1.0, upper_bound=1.0):
+        self.evaluation_function = eval_func
+        self.lower_bound = float(lower_bound)
+        self.upper_bound = float(upper_bound)
+        self.agents = []
+
+    def __call__(self, game_state, agent, **context):
+        n = game_state.num_agents()
+        # Evaluation functions only need an agent to know its index
+        while len(self.agents) < n:
+            self.agents.append(ComputerAgent(len(self.agents)))
+        values = [min(max(self.evaluation_function(game_state, self.agents[i], **context), self.lower_bound), self.upper_bound)-self.lower_bound for i in range(n)]
+        total = sum(values)
+        if total <= 0:
+            return [1.0/n]*n
+        return [v/total for v in values]
+
+
 ################################################################################
 
 
-class MinimaxComputerAgent(ComputerAgent):
+class SearchStats:
     """
-    A computer-controlled agent that chooses its action according to the
-    minimax algorithm.
+    Statistics collected by a search agent while making a decision.
+
+    Depths are expressed in plies from the root of the game tree (the root has
+    depth 0).
+    """
+    def __init__(self):
+        self.nodes_per_depth = []
+        self.num_cutoffs = 0
+        self.num_first_move_cutoffs = 0
+        self.num_evaluations = 0
+        self.num_cache_probes = 0
+        self.num_cache_hits = 0
+        self.iteration_times = []
+
+    def count_node(self, depth):
+        """
+        Accounts for a node expanded at the given depth.
+        """
+        while len(self.nodes_per_depth) <= depth:
+            self.nodes_per_depth.append(0)
+        self.nodes_per_depth[depth] += 1
+
+    def count_cutoff(self, first_move):
+        """
+        Accounts for a beta cutoff; first_move tells if the cutoff has been
+        caused by the first successor that has been searched.
+        """
+        self.num_cutoffs += 1
+        if first_move:
+            self.num_first_move_cutoffs += 1
+
+    def count_evaluation(self):
+        """
+        Accounts for a call to the evaluation function.
+        """
+        self.num_evaluations += 1
+
+    def count_cache_probe(self, hit):
+        """
+        Accounts for a lookup in a cache (e.g., a transposition table).
+        """
+        self.num_cache_probes += 1
+        if hit:
+            self.num_cache_hits += 1
+
+    def add_iteration_time(self, seconds):
+        """
+        Accounts for a search iteration that took the given wall time.
+        """
+        self.iteration_times.append(seconds)
+
+    def num_nodes(self):
+        return sum(self.nodes_per_depth)
+
+    def max_depth(self):
+        return len(self.nodes_per_depth)-1
+
+    def elapsed_time(self):
+        return sum(self.iteration_times)
+
+    def first_move_cutoff_rate(self):
+        """
+        Returns the fraction of cutoffs caused by the first searched successor,
+        which measures the quality of move ordering.
+        """
+        if self.num_cutoffs == 0:
+            return 0.0
+        return self.num_first_move_cutoffs/float(self.num_cutoffs)
+
+    def cache_hit_rate(self):
+        if self.num_cache_probes == 0:
+            return 0.0
+        return self.num_cache_hits/float(self.num_cache_probes)
+
+    def effective_branching_factor(self):
+        """
+        Returns the effective branching factor b*, that is the branching factor
+        that a uniform tree of depth d would need in order to contain N+1
+        nodes, where N is the number of non-root nodes and d is the maximum
+        depth reached (see Russell and Norvig).
+        """
+        d = self.max_depth()
+        n = self.num_nodes()
+        if d <= 0 or n <= 1:
+            return 0.0
+        # Solves N+1 = 1 + b + b^2 + ... + b^d by bisection
+        target = float(n)
+        (lo, hi) = (0.0, max(1.0, target))
+        for i in range(100):
+            b = (lo+hi)/2.0
+            if sum(b**k for k in range(d+1)) < target:
+                lo = b
+            else:
+                hi = b
+        return (lo+hi)/2.0
+
+    def copy(self):
+        other = SearchStats()
+        other.merge(self)
+        return other
+
+    def merge(self, other):
+        """
+        Adds the statistics collected in other to this object.
+        """
+        for depth in range(len(other.nodes_per_depth)):
+            while len(self.nodes_per_depth) <= depth:
+                self.nodes_per_depth.append(0)
+            self.nodes_per_depth[depth] += other.nodes_per_depth[depth]
+        self.num_cutoffs += other.num_cutoffs
+        self.num_first_move_cutoffs += other.num_first_move_cutoffs
+        self.num_evaluations += other.num_evaluations
+        self.num_cache_probes += other.num_cache_probes
+        self.num_cache_hits += other.num_cache_hits
+        self.iteration_times.extend(other.iteration_times)
+
+    def to_dict(self):
+        """
+        Returns the statistics as a dictionary (e.g., to export them as JSON).
+        """
+        return {'nodes': self.num_nodes(),
+                'nodes_per_depth': list(self.nodes_per_depth),
+                'cutoffs': self.num_cutoffs,
+                'first_move_cutoffs': self.num_first_move_cutoffs,
+                'first_move_cutoff_rate': self.first_move_cutoff_rate(),
+                'effective_branching_factor': self.effective_branching_factor(),
+                'evaluations': self.num_evaluations,
+                'cache_probes': self.num_cache_probes,
+                'cache_hits': self.num_cache_hits,
+                'iteration_times': list(self.iteration_times)}
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+################################################################################
+
+
+class SearchComputerAgent(ComputerAgent):
+    """
+    Base class for computer-controlled agents that choose their actions by
+    searching the game tree until a given depth.
 
-    The minimax algorithm evaluates the game tree until the given depth.
     Note that the depth is expressed in terms of plies (i.e., a sequence of
     actions where each agent plays its turn).
 
-    See:
-    - S. Russell and P. Norvig, "Artificial Intelligence: A Modern Approach," 3rd Edition, Prentice Hall, 2010.
+    A derived class must define a make_decision method.
+
+    Search agents can ponder: while the other agents are to move, a background
+    thread searches the positions that can follow the replies of the other
+    agents (the ones closest to the center of the board first), and the
+    actions found are played at once if one of these positions occurs.
+    Derived classes with a persistent cache (e.g., a transposition table) also
+    keep what has been stored there while pondering.
+
+    Searches can prove the outcome of the game.
+    The outcome attribute holds the outcome of the last searched node, that
+    is the triple (lower, upper, proved) where lower and upper bound the
+    outcome of the node whatever the agents play, and proved tells if the
+    value of the node is the one of a final state (or an endgame table entry)
+    with this outcome.
+    It is set by evaluate for cutoff nodes, and by derived classes that
+    combine the outcomes of the children of inner nodes (see
+    get_node_outcome), which also set proved_outcome at the root (see
+    get_outcome).
     """
+
+    # Maximum number of positions searched while pondering
+    MAX_PONDER_POSITIONS = 64
+
     def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function):
         ComputerAgent.__init__(self, index)
         self.depth = depth
-        self.num_expanded_nodes = 0
         self.evaluation_function = eval_func
+        self.num_expanded_nodes = 0
+        self.search_stats = SearchStats()
+        self.tracer = None
+        self.stop_requested = False
+        self.ponder_thread = None
+        self.ponder_saved = None
+        self.ponder_actions = {}
+        self.best_action = None
+        self.search_start_ts = None
+        self.last_value = None
+        self.outcome = UNKNOWN_OUTCOME
+        self.proved_outcome = None
+        self.tablebase = None
+        self.tablebase_hit = None
+        self.tablebase_win_value = 1.0
 
     def get_depth(self):
         return self.depth
 
+    def set_tablebase(self, tablebase, win_value=None):
+        """
+        Attaches the given endgame table (see upo.connect4.tablebase.Tablebase)
+        to this agent, or detaches the current one if tablebase is None.
+        Positions found in the table are not searched further: they are
+        evaluated as won, lost or tied positions, that is win_value, -win_value
+        or 0.
+        Since these values compete with the ones of final states and of the
+        evaluation function, win_value must be the value the evaluation
+        function gives to won final states: by default, it is the win_value
+        attribute of the evaluation function, if any (e.g., see
+        upo.connect4.evalbuilder), or 1 (as for the evaluation functions of
+        this module).
+        """
+        if win_value is None:
+            win_value = getattr(self.evaluation_function, 'win_value', 1.0)
+        self.tablebase = tablebase
+        self.tablebase_hit = None
+        self.tablebase_win_value = float(win_value)
+
+    def get_tablebase(self):
+        return self.tablebase
+
+    def set_tracer(self, tracer):
+        """
+        Attaches the given tracer (see upo.connect4.tracing.SearchTracer) to
+        this agent, or detaches the current one if tracer is None.
+        Searching without a tracer has no tracing overhead.
+        """
+        self.tracer = tracer
+
+    def get_tracer(self):
+        return self.tracer
+
+    def set_verbosity_level(self, level):
+        """
+        Set the verbosity level to the given value.
+        A verbosity level greater than 1 attaches a tracer that prints the
+        game tree as it is searched (unless a tracer is already attached).
+        """
+        ComputerAgent.set_verbosity_level(self, level)
+        if self.verbose > 1 and self.tracer is None:
+            self.tracer = upo.connect4.tracing.PrintTracer()
+        elif self.verbose <= 1 and type(self.tracer) is upo.connect4.tracing.PrintTracer:
+            self.tracer = None
+
     def num_expanded_states(self):
         return self.num_expanded_nodes
 
+    def get_search_stats(self):
+        """
+        Returns the statistics collected during the last decision.
+        """
+        return self.search_stats
+
+    def get_decision_name(self):
+        """
+        Returns the name of the decision procedure (used for logging).
+        """
+        return 'SEARCH-DECISION'
+
     def get_action(self, game_state):
+        """
+        Searches the game tree for the best action in the given state.
+        Raises SearchAborted if request_stop is called during the search.
+        """
+        self.stop_pondering()
+        # A stop request only applies to the search that follows it
+        self.stop_requested = False
+        return self.search_action(game_state)
+
+    def search_action(self, game_state):
+        """
+        Same as get_action, but a pending stop request is not cleared, so that
+        a caller running a sequence of searches (e.g., by iterative deepening)
+        can stop all of them with a single call to request_stop.
+        """
+        self.stop_pondering()
         if self.get_verbosity_level() > 1:
-            print('MINIMAX-DECISION>> Agent: ', self.get_index(), ', Board: \n', game_state.get_board())
+            print(self.get_decision_name() + '>> Agent: ', self.get_index(), ', Board: \n', game_state.get_board())
+        self.search_stats = SearchStats()
+        self.best_action = None
+        self.search_start_ts = time.time()
+        self.last_value = None
+        self.proved_outcome = None
         action = None
+        ponder_key = (game_state.get_key(), game_state.num_agents())
         if game_state.get_board().is_empty() and (game_state.get_board().width() % 2) != 0:
             # When the board is empty and has an odd number of columns,
             # it is better to push a token in the middle
             action = game_state.get_board().width()//2
+        elif ponder_key in self.ponder_actions:
+            # This position has already been searched while pondering
+            self.search_stats.count_cache_probe(True)
+            action = self.ponder_actions[ponder_key]
         else:
-            (value, action) = self.make_minimax_decision(game_state, self.get_index(), 0, True)
+            if self.tracer is not None:
+                self.tracer.begin(self.get_index(), game_state)
+            (value, action) = self.make_decision(game_state)
+            self.search_stats.add_iteration_time(time.time()-self.search_start_ts)
+            self.last_value = value
+            if self.tracer is not None:
+                self.tracer.end(self.get_index(), value, action)
+        self.search_start_ts = None
         if self.get_verbosity_level() > 1:
-            print("MINIMAX-DECISION>> Final action: ", action)
+            print(self.get_decision_name() + ">> Final action: ", action)
         return action
 
-    def make_minimax_decision(self, game_state, agent_index, depth, first=False):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MINIMAX-DECISION(',agent_index,',',depth,') ')
+    def make_decision(self, game_state):
+        """
+        Searches the game tree rooted at the given state and returns the pair
+        (value, action) for this agent.
+        """
+        upo.utils.raise_undefined_method()
+
+    def get_last_value(self):
+        """
+        Returns the value (for this agent) of the action returned by the last
+        call to get_action, or None if that action was not searched (e.g., the
+        first move on an empty board or a move found while pondering).
+        """
+        return self.last_value
+
+    def get_outcome(self):
+        """
+        Returns the outcome of the game (WIN, DRAW or LOSS, for this agent)
+        proved by the last call to make_decision (or get_action), that is the
+        outcome that the returned action secures whatever the other agents
+        play, when the returned value is the one of a final state (or an
+        endgame table entry) with this outcome; otherwise, returns None.
+        """
+        return self.proved_outcome
+
+    def get_max_bounds(self, bounds, child_outcome):
+        """
+        Returns the bounds of the outcome of a node where this agent is to
+        move, given the bounds computed so far and the outcome of another
+        child.
+        """
+        return (max(bounds[0], child_outcome[0]), max(bounds[1], child_outcome[1]))
+
+    def get_min_bounds(self, bounds, child_outcome):
+        """
+        Returns the bounds of the outcome of a node where another agent is to
+        move, given the bounds computed so far and the outcome of another
+        child.
+        """
+        return (min(bounds[0], child_outcome[0]), min(bounds[1], child_outcome[1]))
+
+    def get_node_outcome(self, bounds, best_outcome, depth):
+        """
+        Returns the outcome of an inner node at the given depth, given the
+        bounds of its outcome and the outcome of the child of the chosen
+        action, and sets the outcome proved at the root.
+        """
+        proved = (bounds[0] == bounds[1] and best_outcome is not None and best_outcome[2]
+                  and best_outcome[0] == bounds[0] and best_outcome[1] == bounds[1])
+        if depth == 1:
+            self.proved_outcome = bounds[0] if proved else None
+        return (bounds[0], bounds[1], proved)
+
+    def get_search_progress(self):
+        """
+        Returns a dictionary describing the progress of the current search (it
+        can be called from another thread), or None if the agent is not
+        searching.
+        The dictionary has the following keys:
+        - 'depth': the maximum depth reached so far,
+        - 'nodes': the number of nodes expanded so far,
+        - 'elapsed': the number of seconds elapsed since the search started,
+        - 'nodes_per_sec': the number of nodes expanded per second,
+        - 'best_action': the best action found so far (None if unknown).
+        """
+        start_ts = self.search_start_ts
+        if start_ts is None:
+            return None
+        stats = self.search_stats
+        elapsed = time.time()-start_ts
+        nodes = stats.num_nodes()
+        return {'depth': max(stats.max_depth(), 0),
+                'nodes': nodes,
+                'elapsed': elapsed,
+                'nodes_per_sec': nodes/elapsed if elapsed > 0 else 0.0,
+                'best_action': self.best_action}
+
+    def request_stop(self):
+        """
+        Asks the current search (if any) to stop as soon as possible by
+        raising SearchAborted.
+        """
+        self.stop_requested = True
+
+    def start_pondering(self, game_state, agent_index):
+        self.stop_pondering()
+        if agent_index == self.get_index() or game_state.is_final():
+            return
+        # Node counters and statistics are those of the last decision: the
+        # ones of pondering are discarded
+        self.ponder_saved = (self.num_expanded_nodes, self.search_stats, self.tracer)
+        self.tracer = None
+        self.stop_requested = False
+        self.ponder_actions = {}
+        self.ponder_thread = threading.Thread(target=self.ponder, args=(game_state.copy(), agent_index))
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return
+        self.request_stop()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.stop_requested = False
+        (self.num_expanded_nodes, self.search_stats, self.tracer) = self.ponder_saved
+        self.ponder_saved = None
+
+    def is_pondering(self):
+        return self.ponder_thread is not None
+
+    def get_ponder_states(self, game_state, agent_index):
+        """
+        Returns the states where this agent is to move after the replies of
+        the other agents to the given state, where the given agent is to move.
+        States following replies closer to the center of the board come first.
+        """
+        center = (game_state.get_board().width()-1)/2.0
+        states = []
+        frontier = [(game_state, agent_index)]
+        while len(frontier) > 0 and len(states) < self.MAX_PONDER_POSITIONS:
+            next_frontier = []
+            for (state, index) in frontier:
+                next_index = (index+1) % state.num_agents()
+                for action in sorted(state.iter_legal_actions(), key=lambda x: abs(x-center)):
+                    successor_state = state.generate_successor(index, action)
+                    if successor_state.is_final():
+                        continue
+                    if next_index == self.get_index():
+                        states.append(successor_state)
+                    else:
+                        next_frontier.append((successor_state, next_index))
+            frontier = next_frontier
+        return states[:self.MAX_PONDER_POSITIONS]
+
+    def ponder(self, game_state, agent_index):
+        """
+        Searches the positions that can follow the given one (where the given
+        agent is to move) until the search is asked to stop.
+        """
+        for state in self.get_ponder_states(game_state, agent_index):
+            if self.stop_requested:
+                break
+            self.search_stats = SearchStats()
+            try:
+                (value, action) = self.make_decision(state)
+            except SearchAborted:
+                break
+            self.ponder_actions[(state.get_key(), state.num_agents())] = action
+
+    def expand_node(self, depth):
+        """
+        Accounts for the expansion of a node at the given depth.
+        Raises SearchAborted if the search has been asked to stop.
+        """
+        if self.stop_requested:
+            raise SearchAborted()
         self.num_expanded_nodes += 1
+        self.search_stats.count_node(depth)
+
+    def probe_tablebase(self, game_state):
+        """
+        Returns the value (for this agent) of the given state in the endgame
+        table, or None if the state is not in the table.
+        """
+        hit = self.tablebase_hit
+        if hit is not None:
+            self.tablebase_hit = None
+            if hit[0] is game_state:
+                return hit[1]
+        return self.tablebase.get_value(game_state, self.get_index(), self.tablebase_win_value)
+
+    def evaluate(self, game_state, depth):
+        """
+        Evaluates the given (cutoff) state with the endgame table, if the
+        state is there, or else with the evaluation function, and sets the
+        bounds of its outcome.
+        """
+        self.search_stats.count_evaluation()
+        if game_state.is_final():
+            if game_state.is_winner(self.get_index()):
+                self.outcome = (WIN, WIN, True)
+            elif game_state.is_tie():
+                self.outcome = (DRAW, DRAW, True)
+            else:
+                self.outcome = (LOSS, LOSS, True)
+        else:
+            self.outcome = UNKNOWN_OUTCOME
+            if self.tablebase is not None:
+                value = self.probe_tablebase(game_state)
+                if value is not None:
+                    outcome = WIN if value > 0 else (LOSS if value < 0 else DRAW)
+                    self.outcome = (outcome, outcome, True)
+                    return value
+        return self.evaluation_function(game_state, self, depth=depth)
+
+    def cutoff_test(self, game_state, depth):
+        """
+        Checks if the maximum tree depth has been reached or if the current
+        node of the game tree is a terminal node or a node solved by the
+        endgame table (except the root, whose action is needed).
+        """
+        if depth == self.depth or game_state.is_final():
+            return True
+        if self.tablebase is not None and depth > 1:
+            value = self.probe_tablebase(game_state)
+            if value is not None:
+                # Saves evaluate a second probe
+                self.tablebase_hit = (game_state, value)
+                return True
+        return False
+
+
+################################################################################
+
+
+class MinimaxComputerAgent(SearchComputerAgent):
+    """
+    A computer-controlled agent that chooses its action according to the
+    minimax algorithm.
+
+    The minimax algorithm evaluates the game tree until the given depth.
+    Note that the depth is expressed in terms of plies (i.e., a sequence of
+    actions where each agent plays its turn).
+
+    See:
+    - S. Russell and P. Norvig, "Artificial Intelligence: A Modern Approach," 3rd Edition, Prentice Hall, 2010.
+    """
+    def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function):
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
+
+    def get_decision_name(self):
+        return 'MINIMAX-DECISION'
+
+    def make_decision(self, game_state):
+        self.proved_outcome = None
+        return self.make_minimax_decision(game_state, self.get_index(), 0, True)
+
+    def make_minimax_decision(self, game_state, agent_index, depth, first=False):
+        self.expand_node(depth)
         next_agent_index = 0
         if first:
             next_agent_index = agent_index
@@ -238,61 +809,71 @@ class MinimaxComputerAgent(ComputerAgent):
             return self.make_min_decision(game_state, next_agent_index, depth+1)
 
     def make_min_decision(self, game_state, agent_index, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MIN-DECISION(',agent_index,',',depth,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MIN_NODE, agent_index, depth, None, None)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning MIN-VALUE(',agent_index,',',depth,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MIN_NODE, agent_index, depth, value)
+            return (value, None)
         min_value = float('+inf')
         min_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'MIN-DECISION Action: ', action)
+        bounds = (WIN, WIN)
+        min_outcome = None
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MIN_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_minimax_decision(successor_game_state, agent_index, depth)
+            successor_game_state.release()
+            bounds = self.get_min_bounds(bounds, self.outcome)
             if successor_value < min_value:
                 min_value = successor_value
                 min_action = action
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning MIN-VALUE(',agent_index,',',depth,'): ', min_value, ' (', min_action, ')')
+                min_outcome = self.outcome
+        self.outcome = self.get_node_outcome(bounds, min_outcome, depth)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MIN_NODE, agent_index, depth, min_value, min_action)
         return (min_value, min_action)
 
     def make_max_decision(self, game_state, agent_index, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MAX-DECISION(',agent_index,',',depth,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MAX_NODE, agent_index, depth, None, None)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning MAX-VALUE(',agent_index,',',depth,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MAX_NODE, agent_index, depth, value)
+            return (value, None)
         max_value = float('-inf')
         max_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'MAX-DECISION Action: ', action)
+        bounds = (LOSS, LOSS)
+        max_outcome = None
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MAX_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_minimax_decision(successor_game_state, agent_index, depth)
+            successor_game_state.release()
+            bounds = self.get_max_bounds(bounds, self.outcome)
             if successor_value > max_value:
                 max_value = successor_value
                 max_action = action
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning MAX-VALUE(',agent_index,',',depth,'): ', max_value, ' (', max_action, ')')
+                max_outcome = self.outcome
+                if depth == 1:
+                    # Best root action so far (see get_search_progress)
+                    self.best_action = action
+        self.outcome = self.get_node_outcome(bounds, max_outcome, depth)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value, max_action)
         return (max_value, max_action)
 
-    def cutoff_test(self, game_state, depth):
-        """
-        Checks if the maximum tree depth has been reached or if the current
-        node of the game tree is a terminal node.
-        """
-        if depth == self.depth or game_state.is_final():
-            return True
-        return False
-
 
 ################################################################################
 
 
-class AlphaBetaMinimaxComputerAgent(ComputerAgent):
+class AlphaBetaMinimaxComputerAgent(SearchComputerAgent):
     """
     A computer-controlled agent that chooses its action according to the
     minimax algorithm with alpha-beta pruning.
@@ -307,35 +888,17 @@ class AlphaBetaMinimaxComputerAgent(ComputerAgent):
     - S. Russell and P. Norvig, "Artificial Intelligence: A Modern Approach," 3rd Edition, Prentice Hall, 2010.
     """
     def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function):
-        ComputerAgent.__init__(self, index)
-        self.depth = depth
-        self.evaluation_function = eval_func
-        self.num_expanded_nodes = 0
-
-    def get_depth(self):
-        return self.depth
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
 
-    def num_expanded_states(self):
-        return self.num_expanded_nodes
+    def get_decision_name(self):
+        return 'ALPHA-BETA-MINIMAX-DECISION'
 
-    def get_action(self, game_state):
-        if self.get_verbosity_level() > 1:
-            print('ALPHA-BETA-MINIMAX-DECISION>> Agent: ', self.get_index(), ', Board: \n', game_state.get_board())
-        action = None
-        if game_state.get_board().is_empty() and (game_state.get_board().width() % 2) != 0:
-            # When the board is empty and has an odd number of columns,
-            # it is better to push a token in the middle
-            action = game_state.get_board().width()//2
-        else:
-            (value, action) = self.make_minimax_decision(game_state, self.get_index(), float('-inf'), float('+inf'), 0, True)
-        if self.get_verbosity_level() > 1:
-            print("ALPHA-BETA-MINIMAX-DECISION>> Final action: ", action)
-        return action
+    def make_decision(self, game_state):
+        self.proved_outcome = None
+        return self.make_minimax_decision(game_state, self.get_index(), float('-inf'), float('+inf'), 0, True)
 
     def make_minimax_decision(self, game_state, agent_index, alpha, beta, depth, first=False):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making ALPHA-BETA-MINIMAX-DECISION(agent=',agent_index,',depth=',depth,',alpha=', alpha, ',beta=', beta, ')')
-        self.num_expanded_nodes += 1
+        self.expand_node(depth)
         next_agent_index = 0
         if first:
             next_agent_index = agent_index
@@ -347,67 +910,90 @@ class AlphaBetaMinimaxComputerAgent(ComputerAgent):
             return self.make_min_decision(game_state, next_agent_index, alpha, beta, depth+1)
 
     def make_min_decision(self, game_state, agent_index, alpha, beta, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MIN-DECISION(',game_state,',agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MIN_NODE, agent_index, depth, alpha, beta)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning MIN-VALUE(agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MIN_NODE, agent_index, depth, value)
+            return (value, None)
         min_value = float('+inf')
         min_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'MIN-DECISION Action: ', action)
+        bounds = (WIN, WIN)
+        min_outcome = None
+        first_move = True
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MIN_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_minimax_decision(successor_game_state, agent_index, alpha, beta, depth)
+            successor_game_state.release()
+            bounds = self.get_min_bounds(bounds, self.outcome)
             if successor_value < min_value:
                 min_value = successor_value
                 min_action = action
+                min_outcome = self.outcome
             if min_value <= alpha:
+                self.search_stats.count_cutoff(first_move)
+                if tracer is not None:
+                    tracer.prune(upo.connect4.tracing.MIN_NODE, agent_index, depth, min_value)
+                # The pruned actions can only lower the outcome
+                bounds = (LOSS, bounds[1])
                 break
             beta = min(beta, min_value)
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning MIN-VALUE(agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,'): ', min_value, ' (', min_action, ')')
+            first_move = False
+        self.outcome = self.get_node_outcome(bounds, min_outcome, depth)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MIN_NODE, agent_index, depth, min_value, min_action)
         return (min_value, min_action)
 
     def make_max_decision(self, game_state, agent_index, alpha, beta, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MAX-DECISION(',game_state,',agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MAX_NODE, agent_index, depth, alpha, beta)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning MAX-VALUE(agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MAX_NODE, agent_index, depth, value)
+            return (value, None)
         max_value = float('-inf')
         max_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'MAX-DECISION Action: ', action)
+        bounds = (LOSS, LOSS)
+        max_outcome = None
+        first_move = True
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MAX_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_minimax_decision(successor_game_state, agent_index, alpha, beta, depth)
+            successor_game_state.release()
+            bounds = self.get_max_bounds(bounds, self.outcome)
             if successor_value > max_value:
                 max_value = successor_value
                 max_action = action
+                max_outcome = self.outcome
+                if depth == 1:
+                    self.best_action = action
             if max_value >= beta:
+                self.search_stats.count_cutoff(first_move)
+                if tracer is not None:
+                    tracer.prune(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value)
+                # The pruned actions can only raise the outcome
+                bounds = (bounds[0], WIN)
                 break
             alpha = max(alpha, max_value)
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning MAX-VALUE(agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,'): ', max_value, ' (', max_action, ')')
+            first_move = False
+        self.outcome = self.get_node_outcome(bounds, max_outcome, depth)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value, max_action)
         return (max_value, max_action)
 
-    def cutoff_test(self, game_state, depth):
-        """
-        Checks if the maximum tree depth has been reached or if the current
-        node of the game tree is a terminal node.
-        """
-        if depth == self.depth or game_state.is_final():
-            return True
-        return False
-
 
 ################################################################################
 
 
-class ExpectimaxComputerAgent(ComputerAgent):
+class ExpectimaxComputerAgent(SearchComputerAgent):
     """
     A computer-controlled agent that chooses its action according to the
     expectimax algorithm.
@@ -420,30 +1006,16 @@ class ExpectimaxComputerAgent(ComputerAgent):
     - S. Russell and P. Norvig, "Artificial Intelligence: A Modern Approach," 3rd Edition, Prentice Hall, 2010.
     """
     def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function):
-        ComputerAgent.__init__(self, index)
-        self.depth = depth
-        self.evaluation_function = eval_func
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
 
-    def get_depth(self):
-        return self.depth
+    def get_decision_name(self):
+        return 'EXPECTIMAX-DECISION'
 
-    def get_action(self, game_state):
-        if self.get_verbosity_level() > 1:
-            print('EXPECTIMAX-DECISION>> Agent: ', self.get_index(), ', Board: \n', game_state.get_board())
-        action = None
-        if game_state.get_board().is_empty() and (game_state.get_board().width() % 2) != 0:
-            # When the board is empty and has an odd number of columns,
-            # it is better to push a token in the middle
-            action = game_state.get_board().width()//2
-        else:
-            (value, action) = self.make_expectimax_decision(game_state, self.get_index(), 0, True)
-        if self.get_verbosity_level() > 1:
-            print("EXPECTIMAX-DECISION>> Final action: ", action)
-        return action
+    def make_decision(self, game_state):
+        return self.make_expectimax_decision(game_state, self.get_index(), 0, True)
 
     def make_expectimax_decision(self, game_state, agent_index, depth, first=False):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making EXPECTIMAX-DECISION(agent=',agent_index,',depth=',depth,') ')
+        self.expand_node(depth)
         next_agent_index = 0
         if first:
             next_agent_index = agent_index
@@ -455,51 +1027,519 @@ class ExpectimaxComputerAgent(ComputerAgent):
             return self.make_exp_decision(game_state, next_agent_index, depth+1)
 
     def make_exp_decision(self, game_state, agent_index, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making EXP-DECISION(agent=',agent_index,',depth=',depth,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, None, None)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning EXP-VALUE(agent=',agent_index,',depth=',depth,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, value)
+            return (value, None)
         exp_value = 0
         exp_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'EXP-DECISION Action: ', action)
+        legal_actions = game_state.iter_legal_actions()
+        for action in legal_actions:
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_expectimax_decision(successor_game_state, agent_index, depth)
+            successor_game_state.release()
             exp_value += successor_value
-        exp_value /= float(len(game_state.get_legal_actions()))
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning EXP-VALUE(agent=',agent_index,',depth=',depth,'): ', exp_value, ' (', exp_action, ')')
+        exp_value /= float(len(legal_actions))
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, exp_value, exp_action)
         return (exp_value, exp_action)
 
     def make_max_decision(self, game_state, agent_index, depth):
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Making MAX-DECISION(agent=',agent_index,',',depth,') ')
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MAX_NODE, agent_index, depth, None, None)
         if self.cutoff_test(game_state, depth):
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + '[cutoff] Returning MAX-VALUE(agent=',agent_index,',depth=',depth,'): ', self.evaluation_function(game_state, self, depth=depth), ' (', None, ')')
-            return (self.evaluation_function(game_state, self, depth=depth), None)
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MAX_NODE, agent_index, depth, value)
+            return (value, None)
         max_value = float('-inf')
         max_action = None
-        for action in game_state.get_legal_actions():
-            if self.get_verbosity_level() > 1:
-                print('  '*(depth+1) + 'MAX-DECISION Action: ', action)
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MAX_NODE, agent_index, depth, action)
             successor_game_state = game_state.generate_successor(agent_index, action)
             (successor_value,successor_action) = self.make_expectimax_decision(successor_game_state, agent_index, depth)
+            successor_game_state.release()
             if successor_value > max_value:
                 max_value = successor_value
                 max_action = action
-        if self.get_verbosity_level() > 1:
-            print('  '*(depth+1) + 'Returning MAX-VALUE(agent=',agent_index,',depth=',depth,'): ', max_value, ' (', max_action, ')')
+                if depth == 1:
+                    self.best_action = action
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value, max_action)
         return (max_value, max_action)
 
+
+################################################################################
+
+
+class StarExpectimaxComputerAgent(SearchComputerAgent):
+    """
+    A computer-controlled agent that chooses its action according to the
+    expectimax algorithm with Star1 and Star2 pruning of chance nodes.
+
+    Like the expectimax algorithm, the opponents are modeled as chance nodes
+    choosing uniformly at random among their legal actions, but the values of
+    the evaluation function are assumed to lie in [lower_bound, upper_bound]
+    (values outside this range are clamped).
+    Knowing these bounds, a chance node can be pruned as soon as the values of
+    the children searched so far make its value fall outside the search
+    window (Star1); when the children of a chance node are max nodes, a
+    cheap probe of the first action of each child gives tighter lower bounds
+    (Star2).
+    Exact values of the nodes are memoized for the duration of a decision,
+    keyed by position key, agent to move and depth.
+
+    With the default parameters, the chosen action is the same as the one of
+    the ExpectimaxComputerAgent with a deterministic evaluation function.
+    Optionally:
+    - chance_samples limits the number of (randomly sampled) children of a
+      chance node whose values are averaged;
+    - node_budget limits the number of nodes expanded for each decision: when
+      the budget is exhausted, the remaining nodes are evaluated as cutoff
+      nodes.
+
+    See:
+    - B.W. Ballard, "The *-Minimax Search Procedure for Trees Containing Chance Nodes," Artificial Intelligence 21(3):327-350, 1983.
+    - J. Veness, "Expectimax Enhancements for Stochastic Game Players," BSc Thesis, University of New South Wales, 2006.
+    """
+    def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function, lower_bound=-1.0, upper_bound=1.0, chance_samples=None, node_budget=None):
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
+        if lower_bound >= upper_bound:
+            raise Exception('The lower bound of the evaluation function must be less than the upper bound')
+        self.lower_bound = float(lower_bound)
+        self.upper_bound = float(upper_bound)
+        self.chance_samples = chance_samples
+        self.node_budget = node_budget
+        self.num_nodes_left = float('+inf')
+        self.memo = {}
+
+    def get_decision_name(self):
+        return 'STAR-EXPECTIMAX-DECISION'
+
+    def make_decision(self, game_state):
+        self.memo = {}
+        self.num_nodes_left = self.node_budget if self.node_budget is not None else float('+inf')
+        (value, action) = self.make_expectimax_decision(game_state, self.get_index(), float('-inf'), float('+inf'), 0, True)
+        self.memo = {}
+        return (value, action)
+
+    def expand_node(self, depth):
+        SearchComputerAgent.expand_node(self, depth)
+        self.num_nodes_left -= 1
+
+    def evaluate(self, game_state, depth):
+        value = SearchComputerAgent.evaluate(self, game_state, depth)
+        return min(max(value, self.lower_bound), self.upper_bound)
+
     def cutoff_test(self, game_state, depth):
+        return self.num_nodes_left <= 0 or SearchComputerAgent.cutoff_test(self, game_state, depth)
+
+    def make_expectimax_decision(self, game_state, agent_index, alpha, beta, depth, first=False):
+        self.expand_node(depth)
+        next_agent_index = 0
+        if first:
+            next_agent_index = agent_index
+        else:
+            next_agent_index = (agent_index+1) % game_state.num_agents()
+        if next_agent_index == self.get_index():
+            return self.make_max_decision(game_state, next_agent_index, alpha, beta, depth+1)
+        else:
+            return self.make_exp_decision(game_state, next_agent_index, alpha, beta, depth+1)
+
+    def lookup_memo(self, game_state, agent_index, depth):
         """
-        Checks if the maximum tree depth has been reached or if the current
-        node of the game tree is a terminal node.
+        Returns the memoized (value, action) pair of the given node, if any;
+        otherwise, returns None.
         """
-        if depth == self.depth or game_state.is_final():
-            return True
-        return False
+        entry = self.memo.get((game_state.get_key(), agent_index, depth))
+        self.search_stats.count_cache_probe(entry is not None)
+        return entry
+
+    def probe(self, game_state, agent_index, alpha, beta, depth):
+        """
+        Searches only the first action of the given max node (at the given
+        depth) and returns the resulting lower bound of its value.
+        """
+        actions = game_state.iter_legal_actions()
+        successor_game_state = game_state.generate_successor(agent_index, actions[0])
+        (value, action) = self.make_expectimax_decision(successor_game_state, agent_index, alpha, beta, depth)
+        successor_game_state.release()
+        # A value not above the lower bound of the evaluation function is
+        # only an upper bound: the best lower bound is then the lower bound
+        # of the evaluation function
+        return max(value, self.lower_bound)
+
+    def make_exp_decision(self, game_state, agent_index, alpha, beta, depth):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, alpha, beta)
+        if self.cutoff_test(game_state, depth):
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, value)
+            return (value, None)
+        entry = self.lookup_memo(game_state, agent_index, depth)
+        if entry is not None:
+            return entry
+        legal_actions = game_state.iter_legal_actions()
+        if self.chance_samples is not None and len(legal_actions) > self.chance_samples:
+            legal_actions = random.sample(legal_actions, self.chance_samples)
+        n = len(legal_actions)
+        successor_game_states = [game_state.generate_successor(agent_index, action) for action in legal_actions]
+        # Lower bounds of the values of the children (refined by Star2 probes)
+        lower_bounds = [self.lower_bound]*n
+        (exp_value, exp_action) = (None, None)
+        if ((agent_index+1) % game_state.num_agents()) == self.get_index():
+            # Star2: children are max nodes, whose value is at least the value
+            # of their first action
+            lower_sum = n*self.lower_bound
+            for i in range(n):
+                if self.cutoff_test(successor_game_states[i], depth+1):
+                    continue
+                lower_sum -= self.lower_bound
+                # The child value making the chance node fail high
+                child_beta = n*beta-lower_sum
+                lower_bounds[i] = self.probe(successor_game_states[i], self.get_index(), self.lower_bound, child_beta, depth+1)
+                lower_sum += lower_bounds[i]
+                if lower_sum >= n*beta:
+                    self.search_stats.count_cutoff(i == 0)
+                    if tracer is not None:
+                        tracer.prune(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, beta)
+                    exp_value = beta
+                    break
+        if exp_value is None:
+            # Star1 (with the lower bounds of the Star2 probes, if any)
+            value_sum = 0.0
+            lower_sum = sum(lower_bounds)
+            for i in range(n):
+                if tracer is not None:
+                    tracer.child(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, legal_actions[i])
+                lower_sum -= lower_bounds[i]
+                child_alpha = n*alpha-value_sum-(n-i-1)*self.upper_bound
+                child_beta = n*beta-value_sum-lower_sum
+                (successor_value,successor_action) = self.make_expectimax_decision(successor_game_states[i], agent_index, child_alpha, child_beta, depth)
+                if successor_value <= child_alpha:
+                    exp_value = alpha
+                elif successor_value >= child_beta:
+                    exp_value = beta
+                if exp_value is not None:
+                    self.search_stats.count_cutoff(i == 0)
+                    if tracer is not None:
+                        tracer.prune(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, exp_value)
+                    break
+                value_sum += successor_value
+            if exp_value is None:
+                exp_value = value_sum/float(n)
+                if alpha < exp_value < beta:
+                    self.memo[(game_state.get_key(), agent_index, depth)] = (exp_value, exp_action)
+        for successor_game_state in successor_game_states:
+            successor_game_state.release()
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.CHANCE_NODE, agent_index, depth, exp_value, exp_action)
+        return (exp_value, exp_action)
+
+    def make_max_decision(self, game_state, agent_index, alpha, beta, depth):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MAX_NODE, agent_index, depth, alpha, beta)
+        if self.cutoff_test(game_state, depth):
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MAX_NODE, agent_index, depth, value)
+            return (value, None)
+        entry = self.lookup_memo(game_state, agent_index, depth)
+        if entry is not None:
+            return entry
+        max_value = float('-inf')
+        max_action = None
+        first_move = True
+        child_alpha = alpha
+        for action in game_state.iter_legal_actions():
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MAX_NODE, agent_index, depth, action)
+            successor_game_state = game_state.generate_successor(agent_index, action)
+            (successor_value,successor_action) = self.make_expectimax_decision(successor_game_state, agent_index, child_alpha, beta, depth)
+            successor_game_state.release()
+            if successor_value > max_value:
+                max_value = successor_value
+                max_action = action
+                if depth == 1:
+                    self.best_action = action
+            if max_value >= beta:
+                self.search_stats.count_cutoff(first_move)
+                if tracer is not None:
+                    tracer.prune(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value)
+                break
+            child_alpha = max(child_alpha, max_value)
+            first_move = False
+        if alpha < max_value < beta:
+            self.memo[(game_state.get_key(), agent_index, depth)] = (max_value, max_action)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_value, max_action)
+        return (max_value, max_action)
+
+
+################################################################################
+
+
+class ParanoidComputerAgent(SearchComputerAgent):
+    """
+    A computer-controlled agent for games with any number of agents that
+    chooses its action according to the paranoid algorithm, that is assuming
+    that all the other agents form a coalition that minimizes its value.
+
+    The paranoid game tree is searched with alpha-beta pruning until the given
+    depth, where every opponent plays its own MIN ply.
+    A transposition table (shared by mirror images and kept between
+    decisions) avoids searching the same position with the same agent to move
+    twice, and its best actions are searched first; its entries store the
+    value along with the bounds of the outcome (see SearchComputerAgent).
+
+    See:
+    - N. Sturtevant and R. Korf, "On Pruning Techniques for Multi-Player Games," Proc. of AAAI, 2000.
+    """
+    def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function, tt_size=1000000):
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
+        self.transposition_table = upo.connect4.hashing.TranspositionTable(tt_size)
+
+    def get_decision_name(self):
+        return 'PARANOID-DECISION'
+
+    def get_transposition_table(self):
+        return self.transposition_table
+
+    def make_decision(self, game_state):
+        self.proved_outcome = None
+        return self.make_paranoid_decision(game_state, self.get_index(), float('-inf'), float('+inf'), 0, True)
+
+    def make_paranoid_decision(self, game_state, agent_index, alpha, beta, depth, first=False):
+        self.expand_node(depth)
+        next_agent_index = 0
+        if first:
+            next_agent_index = agent_index
+        else:
+            next_agent_index = (agent_index+1) % game_state.num_agents()
+        return self.make_node_decision(game_state, next_agent_index, alpha, beta, depth+1)
+
+    def make_node_decision(self, game_state, agent_index, alpha, beta, depth):
+        maximize = agent_index == self.get_index()
+        node_type = upo.connect4.tracing.MAX_NODE if maximize else upo.connect4.tracing.MIN_NODE
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(node_type, agent_index, depth, alpha, beta)
+        if self.cutoff_test(game_state, depth):
+            value = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(node_type, agent_index, depth, value)
+            return (value, None)
+        remaining_depth = self.depth-depth
+        actions = game_state.iter_legal_actions()
+        entry = self.transposition_table.probe(game_state, agent_index)
+        self.search_stats.count_cache_probe(entry is not None)
+        if entry is not None:
+            (entry_depth, (entry_value, entry_outcome), entry_kind, entry_action) = entry
+            # The root is always searched, so that its action is the one of
+            # the plain search
+            if depth > 1 and entry_depth >= remaining_depth:
+                if (entry_kind == upo.connect4.hashing.EXACT_VALUE
+                    or (entry_kind == upo.connect4.hashing.LOWER_BOUND and entry_value >= beta)
+                    or (entry_kind == upo.connect4.hashing.UPPER_BOUND and entry_value <= alpha)):
+                    self.outcome = entry_outcome
+                    if tracer is not None:
+                        tracer.exit(node_type, agent_index, depth, entry_value, entry_action)
+                    return (entry_value, entry_action)
+            if depth > 1 and entry_action in actions:
+                # Searches the best action of the table first
+                actions = (entry_action,) + tuple([a for a in actions if a != entry_action])
+        (orig_alpha, orig_beta) = (alpha, beta)
+        best_value = float('-inf') if maximize else float('+inf')
+        best_action = None
+        bounds = (LOSS, LOSS) if maximize else (WIN, WIN)
+        best_outcome = None
+        first_move = True
+        for action in actions:
+            if tracer is not None:
+                tracer.child(node_type, agent_index, depth, action)
+            successor_game_state = game_state.generate_successor(agent_index, action)
+            (successor_value,successor_action) = self.make_paranoid_decision(successor_game_state, agent_index, alpha, beta, depth)
+            successor_game_state.release()
+            if maximize:
+                bounds = self.get_max_bounds(bounds, self.outcome)
+                if successor_value > best_value:
+                    best_value = successor_value
+                    best_action = action
+                    best_outcome = self.outcome
+                    if depth == 1:
+                            self.best_action = action
+                cutoff = best_value >= beta
+            else:
+                bounds = self.get_min_bounds(bounds, self.outcome)
+                if successor_value < best_value:
+                    best_value = successor_value
+                    best_action = action
+                    best_outcome = self.outcome
+                cutoff = best_value <= alpha
+            if cutoff:
+                self.search_stats.count_cutoff(first_move)
+                if tracer is not None:
+                    tracer.prune(node_type, agent_index, depth, best_value)
+                # The pruned actions can only move the outcome in favor of
+                # the agent to move
+                bounds = (bounds[0], WIN) if maximize else (LOSS, bounds[1])
+                break
+            if maximize:
+                alpha = max(alpha, best_value)
+            else:
+                beta = min(beta, best_value)
+            first_move = False
+        if best_value <= orig_alpha:
+            kind = upo.connect4.hashing.UPPER_BOUND
+        elif best_value >= orig_beta:
+            kind = upo.connect4.hashing.LOWER_BOUND
+        else:
+            kind = upo.connect4.hashing.EXACT_VALUE
+        self.outcome = self.get_node_outcome(bounds, best_outcome, depth)
+        self.transposition_table.store(game_state, agent_index, remaining_depth, (best_value, self.outcome), kind, best_action)
+        if tracer is not None:
+            tracer.exit(node_type, agent_index, depth, best_value, best_action)
+        return (best_value, best_action)
+
+
+################################################################################
+
+
+class MaxNComputerAgent(SearchComputerAgent):
+    """
+    A computer-controlled agent for games with any number of agents that
+    chooses its action according to the max^n algorithm, that is assuming
+    that every agent maximizes its own component of a vector-valued
+    evaluation.
+
+    The vector-valued evaluation function vector_eval_func takes the same
+    arguments as an evaluation function and returns a sequence with a value
+    for each agent; when it is not given, the evaluation function eval_func is
+    adapted by means of VectorEvaluationFunction.
+    When the components of the vectors are nonnegative and sum at most to
+    max_sum, the search uses shallow pruning (max_sum defaults to 1 with the
+    adapted evaluation function, and to None, meaning no pruning, otherwise).
+    A transposition table (shared by mirror images and kept between
+    decisions) stores the exact values of the searched positions.
+    Note, when an agent has several actions with the same value for itself,
+    the chosen vector (hence the values for the other agents) depends on the
+    order actions are searched in.
+
+    See:
+    - C. Luckhardt and K. Irani, "An Algorithmic Solution of N-Person Games," Proc. of AAAI, 1986.
+    - R. Korf, "Multi-Player Alpha-Beta Pruning," Artificial Intelligence 48(1):99-111, 1991.
+    """
+    def __init__(self, index, depth=float('+inf'), eval_func=default_evaluation_function, vector_eval_func=None, max_sum=None, tt_size=1000000):
+        SearchComputerAgent.__init__(self, index, depth, eval_func)
+        if vector_eval_func is None:
+            vector_eval_func = VectorEvaluationFunction(eval_func)
+            if max_sum is None:
+                max_sum = 1.0
+        self.vector_evaluation_function = vector_eval_func
+        self.max_sum = max_sum
+        self.transposition_table = upo.connect4.hashing.TranspositionTable(tt_size)
+
+    def get_decision_name(self):
+        return 'MAXN-DECISION'
+
+    def get_transposition_table(self):
+        return self.transposition_table
+
+    def evaluate(self, game_state, depth):
+        n = game_state.num_agents()
+        if self.tablebase is not None and n == 2 and not game_state.is_final():
+            # Endgame tables only hold two-agent games
+            value = self.probe_tablebase(game_state)
+            if value is not None:
+                # A win (a loss) gives all (nothing) of the unit sum to this
+                # agent, like VectorEvaluationFunction
+                self.search_stats.count_evaluation()
+                share = (1.0+value/self.tablebase_win_value)/2.0
+                values = [1.0-share]*n
+                values[self.get_index()] = share
+                return tuple(values)
+        self.search_stats.count_evaluation()
+        return tuple(self.vector_evaluation_function(game_state, self, depth=depth))
+
+    def make_decision(self, game_state):
+        (values, action) = self.make_maxn_decision(game_state, self.get_index(), float('-inf'), 0, True)
+        return (values[self.get_index()], action)
+
+    def make_maxn_decision(self, game_state, agent_index, bound, depth, first=False):
+        self.expand_node(depth)
+        next_agent_index = 0
+        if first:
+            next_agent_index = agent_index
+        else:
+            next_agent_index = (agent_index+1) % game_state.num_agents()
+        return self.make_max_decision(game_state, next_agent_index, bound, depth+1)
+
+    def make_max_decision(self, game_state, agent_index, bound, depth):
+        """
+        Searches the node where the given agent is to move; bound is the best
+        value found so far by the agent to move in the parent node.
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter(upo.connect4.tracing.MAX_NODE, agent_index, depth, None, None)
+        if self.cutoff_test(game_state, depth):
+            values = self.evaluate(game_state, depth)
+            if tracer is not None:
+                tracer.cutoff(upo.connect4.tracing.MAX_NODE, agent_index, depth, values[agent_index])
+            return (values, None)
+        remaining_depth = self.depth-depth
+        actions = game_state.iter_legal_actions()
+        entry = self.transposition_table.probe(game_state, agent_index)
+        self.search_stats.count_cache_probe(entry is not None)
+        if entry is not None and depth > 1:
+            (entry_depth, entry_values, entry_kind, entry_action) = entry
+            if entry_depth >= remaining_depth:
+                if tracer is not None:
+                    tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, entry_values[agent_index], entry_action)
+                return (entry_values, entry_action)
+            if entry_action in actions:
+                # Searches the best action of the table first
+                actions = (entry_action,) + tuple([a for a in actions if a != entry_action])
+        # Shallow pruning: the parent agent gets at most max_sum minus the
+        # value of the agent to move, so it ignores this node as soon as this
+        # is not more than what it already has (or than 0, which also prunes
+        # when the agent to move gets max_sum)
+        prune_value = self.max_sum-max(bound, 0.0) if self.max_sum is not None else float('+inf')
+        max_values = None
+        max_action = None
+        first_move = True
+        pruned = False
+        for action in actions:
+            if tracer is not None:
+                tracer.child(upo.connect4.tracing.MAX_NODE, agent_index, depth, action)
+            successor_game_state = game_state.generate_successor(agent_index, action)
+            (successor_values,successor_action) = self.make_maxn_decision(successor_game_state, agent_index, max_values[agent_index] if max_values is not None else float('-inf'), depth)
+            successor_game_state.release()
+            if max_values is None or successor_values[agent_index] > max_values[agent_index]:
+                max_values = successor_values
+                max_action = action
+                if depth == 1:
+                    self.best_action = action
+            if max_values[agent_index] >= prune_value:
+                pruned = True
+                self.search_stats.count_cutoff(first_move)
+                if tracer is not None:
+                    tracer.prune(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_values[agent_index])
+                break
+            first_move = False
+        if not pruned:
+            self.transposition_table.store(game_state, agent_index, remaining_depth, max_values, upo.connect4.hashing.EXACT_VALUE, max_action)
+        if tracer is not None:
+            tracer.exit(upo.connect4.tracing.MAX_NODE, agent_index, depth, max_values[agent_index], max_action)
+        return (max_values, max_action)
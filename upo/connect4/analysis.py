@@ -0,0 +1,526 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Position analysis service.
+
+A long-lived asyncio server that answers "best move and score" queries over a
+local TCP or Unix socket, so that clients do not pay the start-up and cache
+warm-up costs at every query.
+
+The protocol is line-based: each request is a line with a JSON object, e.g.:
+
+    {"id": 1, "position": "3342", "time": 0.5}
+
+where:
+- id (optional) is echoed back in the response;
+- position is a position string (see upo.connect4.notation), either the
+  sequence of the columns played from the empty board (e.g., "3342") or the
+  contents of the board (e.g., "//1/00///"); a list of column numbers played
+  from the empty board is accepted too;
+- time (optional) is the time budget of the request in seconds;
+- depth (optional) is the maximum search depth in plies.
+A request can also ask for several positions at once with a "positions" list
+instead of "position": the response then has a "results" list.
+A line that is not a JSON object is taken as a position string.
+
+Each response is a line with a JSON object with keys id, position, move (the
+best column, or null in a final position), score (the value of the move for
+the agent to move, between -1 and 1 for the default evaluation function),
+depth (the depth in plies of the last completed search iteration), exact
+(true if the search proved the outcome of the move, e.g. a forced win, in
+which case score is the value of a final state), nodes, time and cached (true
+if the answer comes from the book), or with keys id and error.
+
+Positions are searched by iterative deepening with a paranoid alpha-beta
+agent per agent to move, whose transposition table is kept between requests,
+until the search is exact or the time budget of the request runs out; the
+result of the last completed iteration is returned.
+Results are kept in a book (see upo.connect4.hashing.CanonicalTable), which
+can be loaded from and saved to a file, and exact results are answered from
+the book without searching.
+Requests are searched one at a time by a single worker thread, earliest
+deadline first and in slices of time when several requests are waiting, and
+concurrent requests for the same position share the same search.
+"""
+
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+import upo.connect4.agents
+import upo.connect4.evalbuilder
+import upo.connect4.game
+import upo.connect4.hashing
+import upo.connect4.notation
+
+
+DEFAULT_TIME_BUDGET = 1.0 # seconds
+MAX_TIME_BUDGET = 60.0 # seconds
+DEFAULT_TIME_SLICE = 0.05 # seconds
+DEFAULT_TT_SIZE = 1000000
+DEFAULT_BOOK_SIZE = 100000
+
+# Default weights of the evaluation function (see upo.connect4.evalbuilder)
+DEFAULT_EVALUATION_SPEC = {'own_3': 5, 'own_2': 2, 'opp_3': -5, 'opp_2': -2,
+                           'own_center': 1, 'opp_center': -1,
+                           'own_odd_threats': 3, 'opp_even_threats': -3}
+
+
+def parse_position(position, layout, num_agents):
+    """
+    Returns the state described by the given position (a position string in
+    either form of upo.connect4.notation, or a list of column numbers played
+    from the empty board), along with the index of the agent to move.
+    """
+    if not isinstance(position, str):
+        position = format_position(position)
+    state = upo.connect4.notation.parse_position(position, layout, num_agents)
+    return (state, upo.connect4.notation.get_agent_to_move(state))
+
+
+def format_position(columns):
+    """
+    Returns the position string of the given list of column numbers.
+    """
+    return upo.connect4.notation.format_moves([int(c) for c in columns])
+
+
+def count_empty_cells(game_state):
+    board = game_state.get_board()
+    return board.width()*board.height()-game_state.lines.num_tokens()
+
+
+################################################################################
+
+
+class Analysis:
+    """
+    The search of a position, shared by all the requests asking for it.
+
+    A search can be run in several slices of time: each run goes on with the
+    iterations from where the previous run stopped (the transposition table
+    keeps the work of interrupted iterations too).
+    The result of the last completed iteration is available in result as soon
+    as it is known, so that requests can be answered while the search goes
+    on.
+    Times are in time.monotonic seconds.
+    """
+
+    def __init__(self, position, state, agent_index, deadline, max_depth=None):
+        self.position = position
+        self.state = state
+        self.agent_index = agent_index
+        self.deadline = deadline # Latest deadline of the requests
+        self.max_depth = max_depth
+        self.until = deadline # End of the current run
+        self.run = 0 # Number of the current run
+        self.running = False
+        self.finished = False
+        self.result = None
+        self.nodes = 0
+        self.done = None # Future set when the search is over
+
+
+################################################################################
+
+
+class Analyzer:
+    """
+    Searches positions of a given layout with warm agents: a paranoid
+    alpha-beta agent per agent to move, each one keeping its transposition
+    table between searches, and a book of the results.
+
+    Searches are not thread-safe: a single thread at a time can call analyze.
+    """
+
+    def __init__(self, layout, num_agents=2, eval_func=None, tt_size=DEFAULT_TT_SIZE, book_size=DEFAULT_BOOK_SIZE):
+        if eval_func is None:
+            eval_func = upo.connect4.evalbuilder.build_evaluation_function(DEFAULT_EVALUATION_SPEC)
+        self.layout = tuple(layout)
+        self.nagents = num_agents
+        self.agents = []
+        for index in range(num_agents):
+            agent = upo.connect4.agents.ParanoidComputerAgent(index, 2, eval_func, tt_size)
+            self.agents.append(agent)
+        # Book entries are ((depth, score, exact, position), action): the
+        # position implies the agent to move
+        self.book = upo.connect4.hashing.CanonicalTable(book_size)
+        self.lock = threading.Lock()
+
+    def get_layout(self):
+        return self.layout
+
+    def num_agents(self):
+        return self.nagents
+
+    def get_agent(self, agent_index):
+        return self.agents[agent_index]
+
+    def get_book(self):
+        return self.book
+
+    def parse_position(self, position):
+        return parse_position(position, self.layout, self.nagents)
+
+    def make_result(self, position, action, value, depth, exact, nodes, elapsed, cached):
+        return {'position': position,
+                'move': action,
+                'score': value,
+                'depth': depth,
+                'exact': exact,
+                'nodes': nodes,
+                'time': elapsed,
+                'cached': cached}
+
+    def lookup(self, position, game_state, agent_index, max_depth=None):
+        """
+        Returns the result for the given state that is known without
+        searching (i.e., final states and book entries that are exact or
+        searched to at least max_depth plies), or None.
+        """
+        if game_state.is_final():
+            agent = self.agents[agent_index]
+            value = agent.evaluation_function(game_state, agent, depth=0)
+            return self.make_result(position, None, value, 0, True, 0, 0.0, False)
+        entry = self.book.lookup(game_state)
+        if entry is None:
+            return None
+        ((depth, value, exact, book_position), action) = entry
+        if exact or (max_depth is not None and depth >= max_depth):
+            return self.make_result(position, action, value, depth, exact, 0, 0.0, True)
+        return None
+
+    def store(self, game_state, result):
+        """
+        Stores the given search result in the book, unless it holds a deeper
+        result for the same position.
+        """
+        entry = self.book.lookup(game_state)
+        if entry is not None and (entry[0][2] or entry[0][0] > result['depth']):
+            return
+        self.book.store(game_state, (result['depth'], result['score'], result['exact'], result['position']), result['move'])
+
+    def lookup_book(self, position, game_state):
+        """
+        Returns the result stored in the book for the given state, whatever
+        its depth, or None.
+        """
+        entry = self.book.lookup(game_state)
+        if entry is None:
+            return None
+        ((depth, value, exact, book_position), action) = entry
+        return self.make_result(position, action, value, depth, exact, 0, 0.0, True)
+
+    def analyze(self, analysis):
+        """
+        Goes on searching the position of the given analysis by iterative
+        deepening until the result is exact, the maximum depth is reached, the
+        end of the current run (analysis.until) is reached or the run is
+        interrupted (see interrupt), and stores the result in the book.
+        """
+        agent = self.agents[analysis.agent_index]
+        state = analysis.state
+        with self.lock:
+            analysis.running = True
+        start_nodes = agent.num_expanded_states()
+        max_depth = count_empty_cells(state)
+        if analysis.max_depth is not None:
+            max_depth = min(max_depth, analysis.max_depth)
+        start_depth = 1 if analysis.result is None else analysis.result['depth']+1
+        try:
+            for depth in range(start_depth, max_depth+1):
+                if time.monotonic() >= analysis.until:
+                    break
+                # The depth of the agent counts the root as well
+                agent.depth = depth+1
+                agent.search_stats = upo.connect4.agents.SearchStats()
+                try:
+                    (value, action) = agent.make_decision(state)
+                except upo.connect4.agents.SearchAborted:
+                    break
+                # Exact when the search proved the outcome, whatever the range
+                # of the evaluation function
+                exact = agent.get_outcome() is not None
+                analysis.result = self.make_result(analysis.position, action, value, depth, exact,
+                                                   analysis.nodes+agent.num_expanded_states()-start_nodes,
+                                                   0.0, False)
+                if exact:
+                    break
+            else:
+                analysis.finished = True
+            if analysis.result is not None and analysis.result['exact']:
+                analysis.finished = True
+        finally:
+            with self.lock:
+                analysis.running = False
+                # An interruption only applies to this run
+                agent.stop_requested = False
+            analysis.nodes += agent.num_expanded_states()-start_nodes
+        if analysis.result is not None:
+            self.store(state, analysis.result)
+
+    def interrupt(self, analysis, run):
+        """
+        Asks the given run of the given analysis to stop as soon as possible
+        (it can be called from any thread).
+        """
+        with self.lock:
+            if analysis.running and analysis.run == run:
+                self.agents[analysis.agent_index].request_stop()
+
+    def load_book(self, path):
+        """
+        Loads the book entries from the given file of JSON lines (as written
+        by save_book) and returns their number.
+        """
+        count = 0
+        with open(path, 'r') as f:
+            for line in f:
+                if len(line.strip()) == 0:
+                    continue
+                result = json.loads(line)
+                (state, agent_index) = self.parse_position(result['position'])
+                self.store(state, result)
+                count += 1
+        return count
+
+    def save_book(self, path):
+        """
+        Saves the book entries to the given file as JSON lines.
+        """
+        with open(path, 'w') as f:
+            for (depth, value, exact, position) in [entry[0] for entry in self.book.entries.values()]:
+                (state, agent_index) = self.parse_position(position)
+                action = self.book.lookup(state)[1]
+                f.write(json.dumps({'position': position, 'move': action, 'score': value, 'depth': depth, 'exact': exact}) + '\n')
+
+
+################################################################################
+
+
+class AnalysisServer:
+    """
+    Serves the requests of any number of clients (see the module
+    documentation) with the given analyzer.
+
+    Analyses are run by a single worker thread, the ones without a result
+    first and then earliest deadline first: while other analyses are waiting,
+    each run lasts at most time_slice seconds, so that requests with a short
+    budget are not stuck behind requests with a long one.
+    """
+
+    def __init__(self, analyzer, default_budget=DEFAULT_TIME_BUDGET, max_budget=MAX_TIME_BUDGET, time_slice=DEFAULT_TIME_SLICE):
+        self.analyzer = analyzer
+        self.default_budget = default_budget
+        self.max_budget = max_budget
+        self.time_slice = time_slice
+        self.queue = [] # Analyses waiting to be run
+        self.queue_event = asyncio.Event()
+        self.pending = {} # Waiting or running analyses, by position key
+        self.current = None # Running analysis
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.worker = None
+        self.servers = []
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """
+        Starts listening on the given TCP address and returns the server.
+        """
+        server = await asyncio.start_server(self.handle_client, host, port)
+        self.start_worker()
+        self.servers.append(server)
+        return server
+
+    async def start_unix(self, path):
+        """
+        Starts listening on the given Unix socket and returns the server.
+        """
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        self.start_worker()
+        self.servers.append(server)
+        return server
+
+    def start_worker(self):
+        if self.worker is None:
+            self.worker = asyncio.ensure_future(self.run_worker())
+
+    async def close(self):
+        """
+        Stops listening and interrupts the running analysis, if any.
+        """
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+        if self.current is not None:
+            self.analyzer.interrupt(self.current, self.current.run)
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        self.executor.shutdown(wait=True)
+
+    def schedule_interrupt(self, analysis, until):
+        """
+        Ends the current run of the given analysis at the given time.
+        """
+        analysis.until = until
+        loop = asyncio.get_event_loop()
+        loop.call_later(max(until-time.monotonic(), 0.0), self.analyzer.interrupt, analysis, analysis.run)
+
+    async def run_worker(self):
+        """
+        Runs the waiting analyses, the ones without a result first and then
+        earliest deadline first.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            if len(self.queue) == 0:
+                self.queue_event.clear()
+                await self.queue_event.wait()
+                continue
+            # Analyses without a result come first, so that every request
+            # gets an answer as soon as possible
+            analysis = min(self.queue, key=lambda a: (a.result is not None, a.deadline))
+            self.queue.remove(analysis)
+            now = time.monotonic()
+            if now < analysis.deadline:
+                until = analysis.deadline
+                if len(self.queue) > 0:
+                    until = min(until, now+self.time_slice)
+                analysis.run += 1
+                self.schedule_interrupt(analysis, until)
+                self.current = analysis
+                try:
+                    await loop.run_in_executor(self.executor, self.analyzer.analyze, analysis)
+                finally:
+                    self.current = None
+            if analysis.finished or time.monotonic() >= analysis.deadline:
+                key = analysis.state.get_key()
+                if self.pending.get(key) is analysis:
+                    del self.pending[key]
+                analysis.done.set_result(analysis.result)
+            else:
+                self.queue.append(analysis)
+
+    async def analyze(self, position, budget=None, max_depth=None):
+        """
+        Analyzes the given position within the given time budget (in seconds)
+        and returns the result.
+        """
+        start_ts = time.monotonic()
+        if budget is None:
+            budget = self.default_budget
+        budget = min(max(float(budget), 0.0), self.max_budget)
+        if max_depth is not None:
+            max_depth = int(max_depth)
+        if not isinstance(position, str):
+            position = format_position(position)
+        (state, agent_index) = self.analyzer.parse_position(position)
+        result = self.analyzer.lookup(position, state, agent_index, max_depth)
+        if result is not None:
+            return result
+        deadline = start_ts+budget
+        analysis = self.pending.get(state.get_key())
+        if analysis is None:
+            analysis = Analysis(position, state, agent_index, deadline, max_depth)
+            analysis.done = asyncio.get_event_loop().create_future()
+            self.pending[state.get_key()] = analysis
+            self.queue.append(analysis)
+            self.queue_event.set()
+            current = self.current
+            if current is not None and current.until > start_ts+self.time_slice:
+                # Preempts the running analysis
+                self.schedule_interrupt(current, start_ts+self.time_slice)
+        else:
+            analysis.deadline = max(analysis.deadline, deadline)
+            if analysis.max_depth is not None:
+                analysis.max_depth = None if max_depth is None else max(analysis.max_depth, max_depth)
+        try:
+            await asyncio.wait_for(asyncio.shield(analysis.done), budget)
+        except asyncio.TimeoutError:
+            pass
+        result = analysis.result
+        if result is None:
+            result = self.analyzer.lookup_book(position, state)
+            if result is None:
+                raise Exception('No search iteration completed within the time budget')
+        result = dict(result)
+        result['position'] = position
+        result['time'] = time.monotonic()-start_ts
+        return result
+
+    async def handle_request(self, request):
+        """
+        Returns the response to the given request (see the module
+        documentation).
+        """
+        response = {'id': request.get('id')}
+        budget = request.get('time')
+        max_depth = request.get('depth')
+        try:
+            if 'positions' in request:
+                results = await asyncio.gather(*[self.analyze(position, budget, max_depth) for position in request['positions']], return_exceptions=True)
+                response['results'] = [{'position': position, 'error': str(r)} if isinstance(r, Exception) else r
+                                       for (position, r) in zip(request['positions'], results)]
+            elif 'position' in request:
+                response.update(await self.analyze(request['position'], budget, max_depth))
+            else:
+                raise Exception('Position not specified')
+        except Exception as e:
+            response['error'] = str(e)
+        return response
+
+    async def handle_line(self, line, writer):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            request = {'position': line}
+        response = await self.handle_request(request)
+        writer.write((json.dumps(response) + '\n').encode('utf-8'))
+        await writer.drain()
+
+    async def handle_client(self, reader, writer):
+        """
+        Serves the requests of a client until it closes the connection.
+        Requests are served concurrently: responses can come in any order.
+        """
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8').strip()
+                if len(line) == 0:
+                    continue
+                task = asyncio.ensure_future(self.handle_line(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
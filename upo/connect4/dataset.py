@@ -0,0 +1,265 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Self-play datasets of positions labelled with search scores and outcomes.
+
+Each sample is a position where a search agent was to move, along with the
+value of the move it chose (from its own point of view), the move itself and
+the final outcome of the game (from the point of view of the agent to move).
+
+Positions are encoded as one bit plane per agent: a 64-bit integer where bit
+x*H+row is set if the agent has a token in column x and stack row row (i.e.,
+row 0 is the bottom of the board), as in upo.connect4.lines.LineTable.
+Hence, boards can have at most 64 cells.
+
+Samples are stored in NumPy .npz shards with the following arrays (n is the
+number of samples of the shard, N the number of agents):
+    planes      uint64  (n, N)  bit planes of the position
+    to_move     int8    (n,)    index of the agent to move
+    ply         int16   (n,)    number of tokens on the board
+    score       float32 (n,)    search value of the chosen move, for the agent to move
+    best_move   int8    (n,)    column chosen by the agent to move
+    outcome     int8    (n,)    1 if the agent to move won the game, -1 if it lost, 0 if tie
+    game        int32   (n,)    number of the game the position comes from
+    layout      int32   (2,)    board width and height
+    k           int32   ()      number of tokens in a row needed to win
+
+Shards written before k was stored have no k array and hold k=4 games.
+"""
+
+
+import collections
+import multiprocessing
+import os
+import random
+import upo.connect4.factory
+import upo.connect4.game
+import upo.connect4.lines
+
+
+DEFAULT_SHARD_SIZE = 100000
+
+
+def encode_state(game_state):
+    """
+    Returns the list of the bit planes (one per agent) of the given state.
+    """
+    board = game_state.get_board()
+    (w, h) = (board.width(), board.height())
+    if w*h > 64:
+        raise Exception('Boards with more than 64 cells cannot be encoded')
+    planes = [0]*game_state.num_agents()
+    for x in range(w):
+        for (row, token) in enumerate(board.data[x]):
+            planes[token] |= 1 << (x*h+row)
+    return planes
+
+
+def decode_planes(planes, width, height):
+    """
+    Returns the board encoded by the given bit planes as a list of columns,
+    each one being the list of the tokens from the bottom to the top.
+    """
+    columns = []
+    for x in range(width):
+        column = []
+        for row in range(height):
+            bit = 1 << (x*height+row)
+            token = None
+            for (agent, plane) in enumerate(planes):
+                if int(plane) & bit:
+                    token = agent
+                    break
+            if token is None:
+                break
+            column.append(token)
+        columns.append(column)
+    return columns
+
+
+def play_selfplay_game(task):
+    """
+    Plays a single game as described by the given task (a dictionary with keys
+    'game', 'seed', 'agents', 'agent_args', 'difficulty', 'layout', 'k',
+    'opening', 'sample_rate' and 'skip') and returns the list of the sampled
+    (planes, to_move, ply, score, best_move, outcome, game) tuples.
+
+    Only the moves chosen by searching are sampled, each one with probability
+    sample_rate, skipping the first skip plies of the game.
+    """
+    random.seed(task['seed'])
+    agent_factory = upo.connect4.factory.AgentFactory()
+    agents = agent_factory.make_agents(task['agents'], task['agent_args'], task['difficulty'])
+    game = upo.connect4.game.Game(agents, task['layout'], task.get('k', upo.connect4.lines.DEFAULT_K))
+    game.play_opening(upo.connect4.game.make_random_opening(game, task['opening']))
+    positions = []
+    while not game.is_over():
+        state = game.get_state()
+        agent = game.get_current_agent()
+        ply = state.lines.num_tokens()
+        sample = ply >= task['skip'] and random.random() < task['sample_rate']
+        planes = encode_state(state) if sample else None
+        column = game.make_move()
+        if sample and column is not None and 'get_last_value' in dir(agent) and agent.get_last_value() is not None:
+            positions.append((planes, agent.get_index(), ply, agent.get_last_value(), column))
+    winner = None
+    if game.get_forfeiting_agent() is None and game.get_state().is_win():
+        winner = game.get_state().get_winner()
+    samples = []
+    for (planes, to_move, ply, score, column) in positions:
+        outcome = 0
+        if winner is not None:
+            outcome = 1 if winner == to_move else -1
+        samples.append((planes, to_move, ply, score, column, outcome, task['game']))
+    return samples
+
+
+def iter_bounded(func, tasks, jobs, max_in_flight):
+    """
+    Applies func to each task on a pool of the given number of processes and
+    yields the results in task order.
+
+    At most max_in_flight tasks are submitted but not yet consumed at any
+    time, so that neither pending tasks nor finished results pile up in
+    memory when the consumer is slower than the workers.
+    """
+    if jobs <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(func, (task,)))
+        while len(pending) > 0:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+################################################################################
+
+
+class ShardWriter:
+    """
+    Buffers samples and writes them to .npz shards of (at most) shard_size
+    samples each, named <prefix>-<N>.npz, of games on a board of the given
+    layout where k tokens in a row are needed to win.
+
+    Only the current shard is kept in memory.
+    """
+
+    def __init__(self, output_dir, layout, num_agents, shard_size=DEFAULT_SHARD_SIZE, prefix='selfplay', compress=True, k=upo.connect4.lines.DEFAULT_K):
+        import numpy
+        self.numpy = numpy
+        self.output_dir = output_dir
+        self.layout = tuple(layout)
+        self.k = k
+        self.nagents = num_agents
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.compress = compress
+        self.nshards = 0
+        self.nsamples = 0
+        self.paths = []
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        self.new_buffers()
+
+    def new_buffers(self):
+        numpy = self.numpy
+        n = self.shard_size
+        self.planes = numpy.zeros((n, self.nagents), dtype=numpy.uint64)
+        self.to_move = numpy.zeros(n, dtype=numpy.int8)
+        self.ply = numpy.zeros(n, dtype=numpy.int16)
+        self.score = numpy.zeros(n, dtype=numpy.float32)
+        self.best_move = numpy.zeros(n, dtype=numpy.int8)
+        self.outcome = numpy.zeros(n, dtype=numpy.int8)
+        self.game = numpy.zeros(n, dtype=numpy.int32)
+        self.count = 0
+
+    def write(self, sample):
+        """
+        Adds the given (planes, to_move, ply, score, best_move, outcome, game)
+        sample, writing the current shard out when it is full.
+        """
+        i = self.count
+        (planes, self.to_move[i], self.ply[i], self.score[i], self.best_move[i], self.outcome[i], self.game[i]) = sample
+        self.planes[i] = planes
+        self.count += 1
+        self.nsamples += 1
+        if self.count == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes out the samples buffered so far (if any) as a new shard.
+        """
+        if self.count == 0:
+            return
+        n = self.count
+        path = os.path.join(self.output_dir, '{0}-{1:05}.npz'.format(self.prefix, self.nshards))
+        save = self.numpy.savez_compressed if self.compress else self.numpy.savez
+        save(path,
+             planes=self.planes[:n],
+             to_move=self.to_move[:n],
+             ply=self.ply[:n],
+             score=self.score[:n],
+             best_move=self.best_move[:n],
+             outcome=self.outcome[:n],
+             game=self.game[:n],
+             layout=self.numpy.array(self.layout, dtype=self.numpy.int32),
+             k=self.numpy.array(self.k, dtype=self.numpy.int32))
+        self.paths.append(path)
+        self.nshards += 1
+        self.count = 0
+
+    def num_samples(self):
+        return self.nsamples
+
+    def get_paths(self):
+        """
+        Returns the paths of the shards written so far.
+        """
+        return self.paths
+
+    def close(self):
+        self.flush()
+
+
+def load_shards(paths):
+    """
+    Loads and concatenates the given shards, returning a dictionary of arrays
+    (see the module documentation).
+    """
+    import numpy
+    data = {}
+    for path in paths:
+        with numpy.load(path) as shard:
+            for name in shard.files:
+                if name in ('layout', 'k'):
+                    data[name] = shard[name]
+                else:
+                    data.setdefault(name, []).append(shard[name])
+    for name in data:
+        if name not in ('layout', 'k'):
+            data[name] = numpy.concatenate(data[name])
+    return data
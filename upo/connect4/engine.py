@@ -0,0 +1,637 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Line-based engine protocol, similar to UCI.
+
+An engine is a long-running process (see engine.py) that hosts an agent per
+agent index and reads commands from its standard input, one per line, writing
+its replies to its standard output.
+
+Commands:
+- engine: the engine replies with "id name <name>" and "engineok".
+- isready: the engine replies with "readyok".
+- newgame [<width> <height> <num_agents> [<k>]]: starts a new game on the
+  given layout, where k tokens in a row win (7 6 2 4 by default); the caches
+  of the agents (e.g., transposition tables) are kept, unless the layout
+  changes.
+- position startpos [moves <column> ...]: sets the position reached by
+  playing the given columns (0-based) from the empty board.
+- position columns <column 0>/<column 1>/.../<column W-1>: sets the position
+  where each column holds the given tokens (the indices of the agents, from
+  the bottom), e.g. "position columns ///01///" (i.e., the board string of
+  upo.connect4.notation).
+- go [depth <plies>] [movetime <milliseconds>]: searches the position for the
+  agent to move (agent 0 moves first, so it is the number of tokens modulo
+  the number of agents).
+  Without arguments, the agent searches with its own depth; with a depth
+  and/or a move time, search agents search by iterative deepening, which
+  ends early when an iteration proves the outcome of the game (see
+  upo.connect4.agents.SearchComputerAgent.get_outcome).
+  Search agents write an "info [depth <plies>] score <value> nodes <nodes>
+  time <milliseconds> move <column>" line after each search (iteration).
+  The search ends with a "bestmove <column>" line ("bestmove none" if there
+  are no legal moves).
+- stop: stops the current search, which replies with the best move of the
+  last completed iteration, or stops pondering.
+- ponder: the agent that made the last move thinks about the position while
+  the other agents are to move, until the next command (see
+  upo.connect4.agents.SearchComputerAgent); a later go on one of the
+  positions searched while pondering is answered at once.
+- quit: terminates the engine.
+Commands other than engine, isready and stop wait for the current search to
+end.
+Errors are reported with "info string <message>" lines.
+
+EngineAgent plays through an engine process, which is kept warm between
+moves and games.
+"""
+
+
+import queue
+import subprocess
+import sys
+import threading
+import time
+import upo.connect4.agents
+import upo.connect4.game
+import upo.connect4.lines
+import upo.connect4.notation
+
+
+DEFAULT_LAYOUT = (7, 6)
+DEFAULT_NUM_AGENTS = 2
+DEFAULT_HANDSHAKE_TIMEOUT = 30 # seconds
+STOP_GRACE_TIME = 1.0 # seconds an engine has to reply after a stop
+
+
+def count_empty_cells(game_state):
+    board = game_state.get_board()
+    return board.width()*board.height()-game_state.lines.num_tokens()
+
+
+################################################################################
+
+
+class Engine:
+    """
+    Serves the engine protocol (see the module documentation) for the agents
+    built by make_agents(num_agents), a callable that returns a list with an
+    agent per agent index.
+
+    Searches run in a background thread, so that stop can be read while
+    searching.
+    """
+
+    def __init__(self, make_agents, name='connect4', output=sys.stdout):
+        self.make_agents = make_agents
+        self.name = name
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.layout = None
+        self.nagents = None
+        self.k = None
+        self.agents = None
+        self.state = None
+        self.search_thread = None
+        self.search_agent = None
+        self.search_id = 0
+        self.ponder_agent = None
+        self.new_game(DEFAULT_LAYOUT, DEFAULT_NUM_AGENTS)
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def new_game(self, layout, num_agents, k=upo.connect4.lines.DEFAULT_K):
+        layout = tuple(layout)
+        if layout != self.layout or num_agents != self.nagents or k != self.k:
+            self.layout = layout
+            self.nagents = num_agents
+            self.k = k
+            self.agents = self.make_agents(num_agents)
+        self.state = upo.connect4.game.GameState(layout, num_agents, k)
+
+    def get_agent_to_move(self):
+        return self.state.lines.num_tokens() % self.nagents
+
+    def is_searching(self):
+        return self.search_thread is not None and self.search_thread.is_alive()
+
+    def run(self, input=sys.stdin):
+        """
+        Serves the commands read from the given input until quit is read or
+        the input ends.
+        """
+        for line in input:
+            if not self.handle_line(line):
+                break
+        self.stop_search()
+        self.wait_search()
+        self.stop_pondering()
+
+    def handle_line(self, line):
+        """
+        Executes the given command line and returns False if the engine must
+        quit.
+        """
+        tokens = line.split()
+        if len(tokens) == 0:
+            return True
+        command = tokens[0]
+        args = tokens[1:]
+        try:
+            if command == 'quit':
+                return False
+            if command not in ('engine', 'isready', 'stop'):
+                # Other commands wait for the current search to end
+                self.wait_search()
+            if command == 'engine':
+                self.send('id name ' + self.name)
+                self.send('engineok')
+            elif command == 'isready':
+                self.send('readyok')
+            elif command == 'stop':
+                self.stop_search()
+                self.stop_pondering()
+            elif command == 'newgame':
+                self.stop_pondering()
+                if len(args) == 0:
+                    self.new_game(DEFAULT_LAYOUT, DEFAULT_NUM_AGENTS)
+                else:
+                    values = [int(arg) for arg in args]
+                    if len(values) not in (3, 4):
+                        raise Exception('Expected width, height, number of agents and optionally k')
+                    self.new_game(values[0:2], values[2], *values[3:])
+            elif command == 'position':
+                self.stop_pondering()
+                self.set_position(args)
+            elif command == 'go':
+                self.stop_pondering()
+                self.go(args)
+            elif command == 'ponder':
+                self.ponder()
+            else:
+                raise Exception('Unknown command "' + command + '"')
+        except Exception as e:
+            self.send('info string error ' + str(e))
+        return True
+
+    def set_position(self, args):
+        if len(args) >= 1 and args[0] == 'startpos':
+            state = upo.connect4.game.GameState(self.layout, self.nagents, self.k)
+            moves = []
+            if len(args) >= 2:
+                if args[1] != 'moves':
+                    raise Exception('Expected "moves", found "' + args[1] + '"')
+                moves = [int(arg) for arg in args[2:]]
+            for (ply, column) in enumerate(moves):
+                if column < 0 or column >= self.layout[0] or not state.is_legal_action(column):
+                    raise Exception('Move ' + str(ply+1) + ' (column ' + str(column) + ') is illegal')
+                state.make_move(ply % self.nagents, column)
+        elif len(args) == 2 and args[0] == 'columns':
+            state = upo.connect4.notation.parse_board(args[1], self.layout, self.nagents, self.k)
+        else:
+            raise Exception('Invalid position')
+        self.state = state
+
+    def go(self, args):
+        depth = None
+        movetime = None
+        i = 0
+        while i < len(args):
+            if args[i] == 'depth' and i+1 < len(args):
+                depth = int(args[i+1])
+            elif args[i] == 'movetime' and i+1 < len(args):
+                movetime = int(args[i+1])/1000.0
+            else:
+                raise Exception('Invalid argument "' + args[i] + '"')
+            i += 2
+        if len(self.state.iter_legal_actions()) == 0:
+            self.send('bestmove none')
+            return
+        agent = self.agents[self.get_agent_to_move()]
+        with self.lock:
+            self.search_id += 1
+            self.search_agent = agent
+            if isinstance(agent, upo.connect4.agents.SearchComputerAgent):
+                # A stop request only applies to the search that follows it
+                agent.stop_requested = False
+        self.search_thread = threading.Thread(target=self.search, args=(self.search_agent, self.state.copy(), depth, movetime, self.search_id))
+        self.search_thread.daemon = True
+        self.search_thread.start()
+        if movetime is not None:
+            timer = threading.Timer(movetime, self.stop_search, (self.search_id,))
+            timer.daemon = True
+            timer.start()
+
+    def search(self, agent, state, depth, movetime, search_id):
+        """
+        Searches the given state with the given agent and writes the best
+        move (see the module documentation).
+        """
+        start_ts = time.time()
+        best_action = None
+        error = None
+        saved_depth = agent.depth if isinstance(agent, upo.connect4.agents.SearchComputerAgent) else None
+        try:
+            if saved_depth is None:
+                best_action = agent.get_action(state)
+            elif depth is None and movetime is None:
+                start_nodes = agent.num_expanded_states()
+                best_action = agent.search_action(state)
+                if agent.get_last_value() is not None:
+                    self.send_info(None, agent.get_last_value(), agent.num_expanded_states()-start_nodes, time.time()-start_ts, best_action)
+            else:
+                max_depth = count_empty_cells(state)
+                if depth is not None:
+                    max_depth = min(max_depth, depth)
+                start_nodes = agent.num_expanded_states()
+                for d in range(1, max_depth+1):
+                    if movetime is not None and time.time()-start_ts >= movetime:
+                        break
+                    # The depth of the agent counts the root as well
+                    agent.depth = d+1
+                    try:
+                        # A stop request stops all the iterations
+                        action = agent.search_action(state)
+                    except upo.connect4.agents.SearchAborted:
+                        break
+                    best_action = action
+                    value = agent.get_last_value()
+                    if value is None:
+                        # Not searched (e.g., found while pondering)
+                        break
+                    self.send_info(d, value, agent.num_expanded_states()-start_nodes, time.time()-start_ts, action)
+                    if agent.get_outcome() is not None:
+                        # Proved win, draw or loss: deeper searches cannot
+                        # change it
+                        break
+        except (Exception, SystemExit) as e:
+            # The engine must answer even if the agent fails
+            error = e
+        finally:
+            with self.lock:
+                self.search_agent = None
+                if saved_depth is not None:
+                    agent.depth = saved_depth
+        if error is not None:
+            self.send('info string error ' + str(error))
+        if best_action is None and saved_depth is not None:
+            best_action = agent.best_action
+        if best_action is None:
+            legals = state.iter_legal_actions()
+            best_action = legals[len(legals)//2] if len(legals) > 0 else None
+        self.send('bestmove ' + ('none' if best_action is None else str(best_action)))
+
+    def send_info(self, depth, value, nodes, elapsed, action):
+        line = 'info'
+        if depth is not None:
+            line += ' depth ' + str(depth)
+        line += ' score ' + str(round(value, 6)) + ' nodes ' + str(nodes) + ' time ' + str(int(elapsed*1000)) + ' move ' + str(action)
+        self.send(line)
+
+    def stop_search(self, search_id=None):
+        """
+        Asks the current search (or the given one, if still running) to stop.
+        """
+        with self.lock:
+            agent = self.search_agent
+            if agent is not None and (search_id is None or search_id == self.search_id):
+                if 'request_stop' in dir(agent):
+                    agent.request_stop()
+
+    def wait_search(self):
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def ponder(self):
+        self.stop_pondering()
+        if self.state.lines.num_tokens() == 0:
+            return
+        to_move = self.get_agent_to_move()
+        agent = self.agents[(to_move-1) % self.nagents]
+        agent.start_pondering(self.state, to_move)
+        self.ponder_agent = agent
+
+    def stop_pondering(self):
+        if self.ponder_agent is not None:
+            self.ponder_agent.stop_pondering()
+            self.ponder_agent = None
+
+
+################################################################################
+
+
+class EngineProcess:
+    """
+    A running engine process, spawned with the given command line (a list).
+    """
+
+    def __init__(self, command, handshake_timeout=DEFAULT_HANDSHAKE_TIMEOUT):
+        self.command = list(command)
+        self.handshake_timeout = handshake_timeout
+        self.process = None
+        self.lines = None
+        self.name = None
+        self.start()
+
+    def start(self):
+        """
+        Spawns the engine process and waits for its handshake.
+        """
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self.read_loop, args=(self.process.stdout, self.lines))
+        reader.daemon = True
+        reader.start()
+        self.send('engine')
+        deadline = time.time()+self.handshake_timeout
+        while True:
+            line = self.read_line(max(deadline-time.time(), 0.0))
+            if line is None:
+                self.kill()
+                raise Exception('Engine "' + ' '.join(self.command) + '" did not answer the handshake')
+            if line.startswith('id name '):
+                self.name = line[len('id name '):]
+            elif line == 'engineok':
+                break
+
+    def read_loop(self, stream, lines):
+        """
+        Moves the lines written by the engine to the given queue (a None line
+        means that the engine has terminated).
+        """
+        for line in stream:
+            lines.put(line.rstrip('\n'))
+        lines.put(None)
+
+    def get_name(self):
+        return self.name
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, line):
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    def read_line(self, timeout=None):
+        """
+        Returns the next line written by the engine, waiting at most timeout
+        seconds (None means waiting forever), or None if no line has been
+        written in time.
+        Raises an exception if the engine has terminated.
+        """
+        try:
+            line = self.lines.get(True, timeout)
+        except queue.Empty:
+            return None
+        if line is None:
+            raise Exception('Engine "' + ' '.join(self.command) + '" terminated unexpectedly')
+        return line
+
+    def stop(self):
+        """
+        Asks the engine to quit, killing it if it does not exit by itself.
+        """
+        if self.process is None:
+            return
+        try:
+            self.send('quit')
+            self.process.wait(1.0)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+    def kill(self):
+        """
+        Kills the engine process immediately.
+        """
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+        self.process = None
+
+    def restart(self):
+        """
+        Kills the engine process and spawns a fresh one in its place.
+        """
+        self.kill()
+        self.start()
+
+
+class EngineProcessPool:
+    """
+    Keeps one warm engine process per command line and agent index, so that
+    agents built for different games share the same engine.
+    """
+    def __init__(self):
+        self.processes = {}
+
+    def get_process(self, command, agent_index):
+        """
+        Returns the engine process for the given command line and agent
+        index, spawning it if needed.
+        """
+        key = (tuple(command), agent_index)
+        if key not in self.processes or self.processes[key].process is None:
+            self.processes[key] = EngineProcess(command)
+        return self.processes[key]
+
+    def close(self):
+        """
+        Stops all the engine processes of this pool.
+        """
+        for process in self.processes.values():
+            process.stop()
+        self.processes = {}
+
+
+default_pool = EngineProcessPool()
+
+
+################################################################################
+
+
+class EngineAgent(upo.connect4.agents.ComputerAgent):
+    """
+    A computer agent that plays through an engine process (see the module
+    documentation), which is spawned at the first move with the given command
+    line and kept warm (along with its caches) between moves and games.
+
+    Moves are searched with "go", "go depth <depth>" and/or "go movetime
+    <movetime>" (in milliseconds), depending on the given arguments.
+    With a timeout (in seconds) greater than zero, the engine is asked to stop
+    when the timeout expires and upo.connect4.game.MoveTimeout is raised (the
+    engine is restarted if it does not stop).
+    """
+
+    def __init__(self, index, command, depth=None, movetime=None, timeout=0, pool=default_pool):
+        upo.connect4.agents.ComputerAgent.__init__(self, index)
+        if timeout < 0:
+            raise Exception('Timeout value must be a nonnegative number')
+        self.command = list(command)
+        self.depth = depth
+        self.movetime = movetime
+        self.timeout = timeout
+        self.pool = pool
+        self.engine = None
+        self.engine_layout = None
+        self.searching = False
+        self.pondering = False
+        self.num_expanded_nodes = 0
+        self.search_nodes = 0
+        self.last_value = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # The engine process cannot be shared with other processes
+        state = self.__dict__.copy()
+        state['engine'] = None
+        state['engine_layout'] = None
+        state['pool'] = None
+        state['lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pool = default_pool
+        self.lock = threading.Lock()
+
+    def get_engine(self):
+        """
+        Returns the engine process of this agent, spawning it if needed.
+        """
+        if self.engine is None or not self.engine.is_alive():
+            self.engine = self.pool.get_process(self.command, self.get_index())
+            self.engine_layout = None
+        return self.engine
+
+    def set_position(self, engine, game_state):
+        board = game_state.get_board()
+        layout = (board.width(), board.height(), game_state.num_agents(), game_state.get_k())
+        if layout != self.engine_layout:
+            engine.send('newgame ' + ' '.join([str(x) for x in layout]))
+            self.engine_layout = layout
+        engine.send('position columns ' + upo.connect4.notation.format_board(game_state))
+
+    def get_action(self, game_state):
+        self.stop_pondering()
+        engine = self.get_engine()
+        self.set_position(engine, game_state)
+        command = 'go'
+        if self.depth is not None:
+            command += ' depth ' + str(self.depth)
+        if self.movetime is not None:
+            command += ' movetime ' + str(self.movetime)
+        self.last_value = None
+        self.search_nodes = 0
+        with self.lock:
+            engine.send(command)
+            self.searching = True
+        deadline = time.time()+self.timeout if self.timeout > 0 else None
+        try:
+            while True:
+                line = engine.read_line(None if deadline is None else max(deadline-time.time(), 0.0))
+                if line is None:
+                    # Timed out: the late move is discarded
+                    self.request_stop()
+                    late_deadline = time.time()+STOP_GRACE_TIME
+                    while line is None or not line.startswith('bestmove'):
+                        line = engine.read_line(max(late_deadline-time.time(), 0.0))
+                        if line is None:
+                            engine.restart()
+                            self.engine_layout = None
+                            break
+                    raise upo.connect4.game.MoveTimeout('Agent ' + str(self.get_index()) + ' did not move within ' + str(self.timeout) + ' seconds')
+                tokens = line.split()
+                if len(tokens) == 0:
+                    continue
+                if tokens[0] == 'info':
+                    self.parse_info(tokens[1:])
+                elif tokens[0] == 'bestmove':
+                    self.num_expanded_nodes += self.search_nodes
+                    return None if tokens[1] == 'none' else int(tokens[1])
+        finally:
+            with self.lock:
+                self.searching = False
+
+    def parse_info(self, tokens):
+        if len(tokens) > 0 and tokens[0] == 'string':
+            if self.get_verbosity_level() > 0:
+                print('Engine of agent ' + str(self.get_index()) + ': ' + ' '.join(tokens[1:]))
+            return
+        info = dict(zip(tokens[0::2], tokens[1::2]))
+        if 'score' in info:
+            self.last_value = float(info['score'])
+        if 'nodes' in info:
+            self.search_nodes = int(info['nodes'])
+
+    def request_stop(self):
+        """
+        Asks the engine to stop the current search (if any), so that it moves
+        at once.
+        """
+        with self.lock:
+            if self.searching and self.engine is not None:
+                self.engine.send('stop')
+
+    def start_pondering(self, game_state, agent_index):
+        self.stop_pondering()
+        if agent_index == self.get_index() or game_state.is_final():
+            return
+        engine = self.get_engine()
+        self.set_position(engine, game_state)
+        engine.send('ponder')
+        self.pondering = True
+
+    def stop_pondering(self):
+        if self.pondering:
+            if self.engine is not None and self.engine.is_alive():
+                self.engine.send('stop')
+            self.pondering = False
+
+    def is_pondering(self):
+        return self.pondering
+
+    def get_last_value(self):
+        """
+        Returns the score of the last move, as reported by the engine (None if
+        it did not report any).
+        """
+        return self.last_value
+
+    def num_expanded_states(self):
+        return self.num_expanded_nodes
+
+    def close(self):
+        """
+        Stops the engine process of this agent.
+        """
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
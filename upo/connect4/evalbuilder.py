@@ -0,0 +1,296 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Linear evaluation functions built from a declarative specification.
+
+A specification is a dictionary mapping feature names to weights, e.g.:
+
+    {'own_3': 5, 'own_2': 2, 'opp_3': -5, 'opp_2': -2, 'own_center': 1}
+
+where features are seen from the agent the state is evaluated for:
+- own_C (opp_C): number of lines of K cells holding exactly C tokens of the
+  agent (of one of the other agents) and no other token, for C=1,...,K-1;
+- own_center (opp_center): number of tokens of the agent (of the other
+  agents) in the center column(s) of the board;
+- own_odd_threats, own_even_threats (opp_odd_threats, opp_even_threats):
+  number of empty cells in an odd (even) row, counting rows from 1 at the
+  bottom of the board, that would complete a line of the agent (of one of the
+  other agents);
+- mobility: number of legal actions.
+
+The line and center features are the ones whose weights upo.connect4.tuning
+fits on recorded games: tune.py writes its weights as a specification.
+
+The value of a non-terminal state is z = sum of weight*feature or, if the
+function squashes values (the default), tanh(z/2) (i.e., 2*sigmoid(z)-1),
+which lies in (-1,1); terminal states are worth win_value (win), -win_value
+(loss) or 0 (tie), where win_value defaults to 1 (the bound of squashed
+values).
+
+The specification can be compiled in two ways:
+- 'scan': every evaluation reads the board cells of every line of the
+  (shared) line table once and computes all the features in that pass;
+- 'incremental': line features are read from the line counts the game state
+  updates at every move (see upo.connect4.lines.LineCounts), so their cost
+  does not depend on the board size; only threats need a pass over the lines
+  (without reading the board).
+Both give the same values.
+"""
+
+
+import math
+import upo.connect4.lines
+import upo.utils
+
+
+MODES = ['incremental', 'scan']
+DEFAULT_MODE = 'incremental'
+
+# Features that do not depend on K
+_OTHER_FEATURES = ['own_center', 'opp_center',
+                   'own_odd_threats', 'own_even_threats',
+                   'opp_odd_threats', 'opp_even_threats',
+                   'mobility']
+
+
+def get_line_feature_names(k=4):
+    """
+    Returns the names of the line features (own_C and opp_C) for lines of the
+    given length.
+    """
+    return (['own_' + str(c) for c in range(1, k)]
+            + ['opp_' + str(c) for c in range(1, k)])
+
+
+def get_feature_names(k=4):
+    """
+    Returns the names of all the supported features for lines of the given
+    length.
+    """
+    return get_line_feature_names(k) + _OTHER_FEATURES
+
+
+def get_center_columns(width):
+    """
+    Returns the center column(s) of a board of the given width.
+    """
+    if width % 2 != 0:
+        return [width//2]
+    return [width//2-1, width//2]
+
+
+class CompiledEvaluationFunction:
+    """
+    Base class of the evaluation functions built by build_evaluation_function.
+
+    Instances can be pickled (e.g., to be used by sandboxed agents).
+    """
+
+    def __init__(self, spec, k=4, squash=True, win_value=1.0):
+        names = get_feature_names(k)
+        for name in spec:
+            if name not in names:
+                raise Exception('Unknown feature "' + str(name) + '"')
+        self.spec = dict(spec)
+        self.k = k
+        self.squash = squash
+        self.win_value = win_value
+        weight = lambda name: float(self.spec.get(name, 0.0))
+        # own_weights[c] (opp_weights[c]) is the weight of a line with c
+        # tokens of the agent (of another agent) only
+        self.own_weights = [0.0] + [weight('own_' + str(c)) for c in range(1, k)] + [0.0]
+        self.opp_weights = [0.0] + [weight('opp_' + str(c)) for c in range(1, k)] + [0.0]
+        self.own_center_weight = weight('own_center')
+        self.opp_center_weight = weight('opp_center')
+        # threat_weights[(own, odd)]
+        self.threat_weights = {(True, True): weight('own_odd_threats'),
+                               (True, False): weight('own_even_threats'),
+                               (False, True): weight('opp_odd_threats'),
+                               (False, False): weight('opp_even_threats')}
+        self.use_threats = any(w != 0 for w in self.threat_weights.values())
+        self.mobility_weight = weight('mobility')
+
+    def get_spec(self):
+        return self.spec
+
+    def evaluate_lines(self, game_state, agent_index):
+        """
+        Returns the weighted sum of the line and threat features of the given
+        state for the given agent.
+        """
+        upo.utils.raise_undefined_method()
+
+    def evaluate_threats(self, threats, agent_index):
+        """
+        Returns the weighted sum of the threat features for the given set of
+        (player, x, row) threats (several players may threaten the same cell).
+        """
+        z = 0.0
+        opp_cells = set()
+        for (player, x, row) in threats:
+            if player == agent_index:
+                z += self.threat_weights[(True, row % 2 == 0)]
+            else:
+                opp_cells.add((x, row))
+        for (x, row) in opp_cells:
+            z += self.threat_weights[(False, row % 2 == 0)]
+        return z
+
+    def evaluate_linear(self, game_state, agent_index):
+        """
+        Returns the weighted sum of all the features of the given state for
+        the given agent.
+        """
+        z = self.evaluate_lines(game_state, agent_index)
+        if self.own_center_weight != 0 or self.opp_center_weight != 0:
+            board = game_state.get_board()
+            for x in get_center_columns(board.width()):
+                for token in board.data[x]:
+                    if token == agent_index:
+                        z += self.own_center_weight
+                    else:
+                        z += self.opp_center_weight
+        if self.mobility_weight != 0:
+            z += self.mobility_weight*len(game_state.iter_legal_actions())
+        return z
+
+    def __call__(self, game_state, agent, **context):
+        agent_index = agent.get_index()
+        if game_state.is_final():
+            if game_state.is_winner(agent_index):
+                return self.win_value
+            if game_state.is_tie():
+                return 0.0
+            return -self.win_value
+        z = self.evaluate_linear(game_state, agent_index)
+        if self.squash:
+            return math.tanh(z/2)
+        return z
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + repr(self.spec) + ', ' + repr(self.k) + ', ' + repr(self.squash) + ', ' + repr(self.win_value) + ')'
+
+
+class ScanEvaluationFunction(CompiledEvaluationFunction):
+    """
+    Evaluates a state with one pass over the board cells of every line.
+    """
+
+    def __init__(self, spec, k=4, squash=True, win_value=1.0):
+        CompiledEvaluationFunction.__init__(self, spec, k, squash, win_value)
+        self.line_cells = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['line_cells'] = {}
+        return state
+
+    def get_line_cells(self, width, height):
+        """
+        Returns the list of the (column, row) pairs of the cells of every line
+        of the given layout.
+        """
+        cells = self.line_cells.get((width, height))
+        if cells is None:
+            table = upo.connect4.lines.get_line_table(width, height, self.k)
+            cells = [tuple(table.get_line_cells(line)) for line in range(table.num_lines())]
+            self.line_cells[(width, height)] = cells
+        return cells
+
+    def evaluate_lines(self, game_state, agent_index):
+        board = game_state.get_board()
+        data = board.data
+        k1 = self.k-1
+        own_weights = self.own_weights
+        opp_weights = self.opp_weights
+        use_threats = self.use_threats
+        threats = set()
+        z = 0.0
+        for cells in self.get_line_cells(board.width(), board.height()):
+            player = -1
+            count = 0
+            empty = None
+            for (x, row) in cells:
+                column = data[x]
+                if row < len(column):
+                    token = column[row]
+                    if player < 0:
+                        player = token
+                    elif token != player:
+                        player = -2
+                        break
+                    count += 1
+                else:
+                    empty = (x, row)
+            if player >= 0:
+                if player == agent_index:
+                    z += own_weights[count]
+                else:
+                    z += opp_weights[count]
+                if use_threats and count == k1:
+                    threats.add((player, empty[0], empty[1]))
+        if use_threats:
+            z += self.evaluate_threats(threats, agent_index)
+        return z
+
+
+class IncrementalEvaluationFunction(CompiledEvaluationFunction):
+    """
+    Evaluates a state from the line counts it keeps up to date.
+    """
+
+    def evaluate_lines(self, game_state, agent_index):
+        lines = game_state.lines
+        k = self.k
+        if lines.table.k != k:
+            raise Exception('Evaluation function built for ' + str(k) + ' in a row, game with ' + str(lines.table.k))
+        open_lines = lines.open_lines
+        z = 0.0
+        for player in range(lines.nagents):
+            weights = self.own_weights if player == agent_index else self.opp_weights
+            base = player*(k+1)
+            for c in range(1, k):
+                z += weights[c]*open_lines[base+c]
+        if self.use_threats:
+            n = lines.nagents
+            counts = lines.counts
+            table = lines.table
+            data = game_state.get_board().data
+            h = table.h
+            threats = set()
+            for (line, player) in lines.iter_owners():
+                if player >= 0 and counts[line*n+player] == k-1:
+                    for cell in table.lines[line]:
+                        (x, row) = divmod(cell, h)
+                        if row >= len(data[x]):
+                            threats.add((player, x, row))
+                            break
+            z += self.evaluate_threats(threats, agent_index)
+        return z
+
+
+def build_evaluation_function(spec, mode=DEFAULT_MODE, k=4, squash=True, win_value=1.0):
+    """
+    Compiles the given specification (a dictionary mapping feature names to
+    weights, see the module documentation) into an evaluation function
+    eval_func(game_state, agent, **context).
+    """
+    if mode == 'scan':
+        return ScanEvaluationFunction(spec, k, squash, win_value)
+    if mode == 'incremental':
+        return IncrementalEvaluationFunction(spec, k, squash, win_value)
+    raise Exception('Unknown compilation mode "' + str(mode) + '"')
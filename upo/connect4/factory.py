@@ -0,0 +1,145 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import enum
+import inspect
+import shlex
+import upo.connect4.agents
+import upo.connect4.engine
+import upo.utils
+
+
+class GameDifficulty(enum.IntEnum):
+    """
+    Enumeration for predefined difficulty levels.
+    """
+    very_easy = 1
+    easy = 2
+    medium = 3
+    hard = 4
+    very_hard = 5
+    no_hope = -1 # Actually, this leads to the full exploration of the game tree (may take a huge amount of time)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def default_difficulty(cls):
+        return cls.easy
+
+    @classmethod
+    def str2int(cls, s):
+        ls = s.lower()
+        if ls == 'veryeasy':
+            return cls.very_easy
+        if ls == 'easy':
+            return cls.easy
+        if ls == 'medium':
+            return cls.medium
+        if ls == 'hard':
+            return cls.hard
+        if ls == 'veryhard':
+            return cls.very_hard
+        if ls == 'nohope':
+            return cls.no_hope
+        if s.isdigit():
+            return int(s)
+        return cls.default_difficulty()
+
+
+class AgentFactory:
+    ids = ['alphabeta', 'custom', 'engine', 'expectimax', 'firstfitleft', 'human', 'maxn', 'minimax', 'paranoid', 'random', 'starexpectimax']
+    # Agents that take a list of "key=value" arguments
+    ids_with_args = ['custom', 'engine']
+
+    def make_agent(self, agent_id, agent_index, args):
+        #if agent_id not in self.ids:
+        #    raise Exception('Unknown agent identifier "' + agent_id + '"')
+        if agent_id == 'alphabeta':
+            return upo.connect4.agents.AlphaBetaMinimaxComputerAgent(agent_index, args['depth'])
+        if agent_id == 'custom':
+            klass = upo.utils.import_lib(args['class'])
+            if len(inspect.signature(klass.__init__).parameters) <= 2:
+                return klass(agent_index)
+            return klass(agent_index, **args)
+        if agent_id == 'engine':
+            plies = int(args['plies']) if 'plies' in args else None
+            movetime = int(args['movetime']) if 'movetime' in args else None
+            return upo.connect4.engine.EngineAgent(agent_index, shlex.split(args['command']), plies, movetime, float(args.get('timeout', 0)))
+        if agent_id == 'firstfitleft':
+            return upo.connect4.agents.FirstFitLeftComputerAgent(agent_index)
+        if agent_id == 'expectimax':
+            return upo.connect4.agents.ExpectimaxComputerAgent(agent_index, args['depth'])
+        if agent_id == 'human':
+            return upo.connect4.agents.HumanAgent(agent_index)
+        if agent_id == 'maxn':
+            return upo.connect4.agents.MaxNComputerAgent(agent_index, args['depth'])
+        if agent_id == 'minimax':
+            return upo.connect4.agents.MinimaxComputerAgent(agent_index, args['depth'])
+        if agent_id == 'paranoid':
+            return upo.connect4.agents.ParanoidComputerAgent(agent_index, args['depth'])
+        if agent_id == 'random':
+            return upo.connect4.agents.RandomComputerAgent(agent_index)
+        if agent_id == 'starexpectimax':
+            return upo.connect4.agents.StarExpectimaxComputerAgent(agent_index, args['depth'])
+
+    def make_agents(self, agent_ids, agent_args, difficulty, verbosity=0):
+        """
+        Creates the agents identified by the given list of identifiers.
+
+        Parameters
+        - agent_ids: the list of agent identifiers (see get_available_agents).
+        - agent_args: a list with a list of "key=value" strings for each
+          "custom" or "engine" agent, in the same order these agents appear in
+          agent_ids.
+        - difficulty: the level of difficulty as a string (see
+          GameDifficulty.str2int); the resulting depth is expressed in rounds,
+          that is it is multiplied by the number of agents.
+        - verbosity: the verbosity level of the created agents.
+        """
+        agent_args = list(agent_args)
+        agents = []
+        agent_idx = 0
+        for agent_id in agent_ids:
+            xargs = {}
+            xargs['depth'] = difficulty
+            if agent_id in self.ids_with_args:
+                for arg in agent_args.pop(0):
+                    (key, value) = arg.split('=', 1) # Retrieves the key and the value
+                    xargs[key.lower()] = value
+                if agent_id == 'custom' and 'class' not in xargs:
+                    raise Exception('Class name not specified for custom agent')
+                if agent_id == 'engine' and 'command' not in xargs:
+                    raise Exception('Command line not specified for engine agent')
+            xargs['depth'] = int(GameDifficulty.str2int(xargs['depth']))*len(agent_ids)
+            agent = self.make_agent(agent_id, agent_idx, xargs)
+            agent.set_verbosity_level(verbosity)
+            agents.append(agent)
+            agent_idx += 1
+        return agents
+
+    @classmethod
+    def get_available_agents(cls):
+        return cls.ids
+
+    @classmethod
+    def count_agent_args(cls, agent_ids):
+        """
+        Returns the number of lists of arguments needed by the given agents
+        (see make_agents).
+        """
+        return len([agent_id for agent_id in agent_ids if agent_id in cls.ids_with_args])
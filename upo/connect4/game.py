@@ -16,10 +16,26 @@
 
 
 import copy
+import json
+import random
 import time
+import upo.connect4.hashing
+import upo.connect4.lines
+import upo.connect4.notation
 import upo.containers
 
 
+class MoveTimeout(Exception):
+    """
+    Raised when an agent is not able to choose its move within the allowed
+    time.
+    """
+    pass
+
+
+################################################################################
+
+
 class GridBoard:
     """
     Represents a board for the Connect 4 game using a grid-like data structure.
@@ -45,7 +61,7 @@ class GridBoard:
         (0,5)         (6,5)
     """
 
-    INVALID_TOKEN = None
+    INVALID_TOKEN = -1 # the grid stores small integers
 
     def __init__(self, width, height):
         self.data = upo.containers.Grid(width, height, self.INVALID_TOKEN)
@@ -54,7 +70,7 @@ class GridBoard:
         """
         Creates an deep copy of this board.
         """
-        b = Board(self.w, self.h)
+        b = GridBoard.__new__(GridBoard)
         b.data = self.data.copy()
         return b
 
@@ -69,8 +85,8 @@ class GridBoard:
         """
         Creates a shallow (alias) copy of this board.
         """
-        b = Board(self.w, self.h)
-        b.data = self.data
+        b = GridBoard.__new__(GridBoard)
+        b.data = self.data.shallow_copy()
         return b
 
     def can_push_token(self, column):
@@ -97,8 +113,8 @@ class GridBoard:
         Returns the popped token (if present), or INVALID_TOKEN, otherwise.
         """
         token = self.INVALID_TOKEN
-        row = self.to_impl_row(self.get_column_empty_row(column))
-        if row != -1:
+        row = self.to_impl_row(self.get_column_empty_row(column))+1
+        if row < self.data.height():
             token = self.data[column][row]
             self.data[column][row] = self.INVALID_TOKEN
         return token
@@ -141,7 +157,7 @@ class GridBoard:
         """
         Get the number of tokens pushed in the given column.
         """
-        return self.data.height() - self.to_impl_row(self.get_column_empty_row(column)) + 1
+        return self.data.height() - self.to_impl_row(self.get_column_empty_row(column)) - 1
 
     def is_column_full(self, column):
         """
@@ -187,7 +203,7 @@ class GridBoard:
         w = -1
         for x in range(self.width()):
             for y in range(self.height()):
-                if self.data[x][y] != None:
+                if self.data[x][y] != self.INVALID_TOKEN:
                     w = max(w, len(str(self.data[x][y])))
                 else:
                     w = max(w, 4)
@@ -246,18 +262,27 @@ class StackBoard:
 
     INVALID_TOKEN = None
 
+    __slots__ = ('data', 'w', 'h', 'version')
+
     def __init__(self, width, height):
         #self.data = [[]]*width
         self.data = [[] for i in range(width)]
         self.w = width
         self.h = height
+        # Modification counter, incremented every time the board changes
+        self.version = 0
 
     def copy(self):
         """
         Creates an deep copy of this board.
         """
-        b = Board(self.w, self.h)
+        # Bypass __init__ to avoid building empty columns that would be
+        # immediately thrown away
+        b = self.__class__.__new__(self.__class__)
         b.data = [x[:] for x in self.data]
+        b.w = self.w
+        b.h = self.h
+        b.version = self.version
         return b
 
     def deep_copy(self):
@@ -271,10 +296,23 @@ class StackBoard:
         """
         Creates a shallow (alias) copy of this board.
         """
-        b = Board(self.w, self.h)
+        b = self.__class__.__new__(self.__class__)
         b.data = self.data
+        b.w = self.w
+        b.h = self.h
+        b.version = self.version
         return b
 
+    def copy_from(self, other):
+        """
+        Overwrites the content of this board with the one of the given board,
+        which must have the same layout.
+        The column lists of this board are reused.
+        """
+        for column, other_column in zip(self.data, other.data):
+            column[:] = other_column
+        self.version += 1
+
     def can_push_token(self, column):
         """
         Tells if a token can be pushed down to the given column.
@@ -293,6 +331,7 @@ class StackBoard:
         if row >= self.h:
             return -1
         self.data[column].append(token)
+        self.version += 1
         return self.to_user_row(row)
 
     def pop_token(self, column):
@@ -303,6 +342,7 @@ class StackBoard:
         """
         if len(self.data[column]) == 0:
             return self.INVALID_TOKEN
+        self.version += 1
         return self.data[column].pop()
 
     def get_token(self, column, row):
@@ -388,6 +428,7 @@ class StackBoard:
         """
         #self.data = [[]]*self.w
         self.data = [[] for i in range(self.w)]
+        self.version += 1
 
     def __str__(self):
         """
@@ -459,7 +500,8 @@ class Board(StackBoard):
         |-|-|-|-|-|-|-|
         (0,5)         (6,5)
     """
-    pass
+
+    __slots__ = ()
 
 
 ################################################################################
@@ -474,13 +516,64 @@ class GameState:
     game and can be used by agents to reason about the game.
 
     Much of the information in a GameState is stored in a GameStateData object.
+
+    Successor states are taken from a bounded per-layout free list, when
+    possible. Searches that are done with a successor can give it back by
+    means of the release method.
     """
 
-    def __init__(self, layout, num_agents):
+    # Maximum number of released states kept for reuse for each layout
+    FREE_LIST_SIZE = 256
+
+    # Released states, indexed by board layout, number of agents and K
+    _free_lists = {}
+
+    __slots__ = ('board', 'nagents', 'verbose', 'lines', 'zobrist', 'key', 'mirror_key', 'legal_actions_version', 'legal_actions')
+
+    def __init__(self, layout, num_agents, k=upo.connect4.lines.DEFAULT_K):
         self.board = Board(layout[0], layout[1])
         self.nagents = num_agents
         #self.cur_agent = None
         self.verbose = 0
+        # Line statistics, kept up to date by make_move and unmake_move
+        self.lines = upo.connect4.lines.make_line_counts(upo.connect4.lines.get_line_table(layout[0], layout[1], k), num_agents)
+        # Zobrist keys of this position and of its mirror image, kept up to
+        # date by make_move and unmake_move
+        self.zobrist = upo.connect4.hashing.get_zobrist_table(layout[0], layout[1], num_agents)
+        self.key = 0
+        self.mirror_key = 0
+        # Legal actions are cached along with the board version they have
+        # been computed for
+        self.legal_actions_version = -1
+        self.legal_actions = ()
+
+    def copy(self):
+        """
+        Creates a deep copy of this state.
+        """
+        # Bypass __init__ to avoid building a board that would be immediately
+        # thrown away
+        state = GameState.__new__(GameState)
+        state.board = self.board.deep_copy()
+        state.nagents = self.nagents
+        state.verbose = self.verbose
+        state.lines = self.lines.copy()
+        state.zobrist = self.zobrist
+        state.key = self.key
+        state.mirror_key = self.mirror_key
+        state.legal_actions_version = self.legal_actions_version
+        state.legal_actions = self.legal_actions
+        return state
+
+    def release(self):
+        """
+        Gives this state back to the free list so that it can be reused by
+        generate_successor.
+        The state must not be used anymore after this call.
+        """
+        free_list = GameState._free_lists.setdefault((self.board.w, self.board.h, self.nagents, self.lines.table.k), [])
+        if len(free_list) < GameState.FREE_LIST_SIZE:
+            free_list.append(self)
 
     def get_board(self):
         """
@@ -500,6 +593,12 @@ class GameState:
         """
         return self.nagents
 
+    def get_k(self):
+        """
+        Returns the number of tokens in a row needed to win.
+        """
+        return self.lines.table.k
+
     def is_legal_action(self, action):
         """
         Tells if in the current state it is valid to perform the given action.
@@ -510,14 +609,26 @@ class GameState:
         """
         Returns the legal actions for the current state.
         """
-        #if self.is_final():
-        #    return []
+        return list(self.iter_legal_actions())
 
-        actions = []
-        for x in range(self.board.width()):
-            if self.is_legal_action(x):
-                actions.append(x)
-        return actions
+    def iter_legal_actions(self):
+        """
+        Returns the legal actions for the current state as a tuple.
+
+        Unlike get_legal_actions, the tuple is cached until the board changes,
+        and the finality of the state is checked only once, so this is the
+        method of choice for searches.
+        The returned tuple must not be modified.
+        """
+        board = self.board
+        if self.legal_actions_version != board.version:
+            if self.is_final():
+                self.legal_actions = ()
+            else:
+                h = board.h
+                self.legal_actions = tuple([x for x in range(board.w) if len(board.data[x]) < h])
+            self.legal_actions_version = board.version
+        return self.legal_actions
 
     def generate_successor(self, agent_index, action):
         """
@@ -531,9 +642,22 @@ class GameState:
             raise Exception('Cannot generate a successor of a state from an illegal action.')
 
         #new_state = copy.deepcopy(self)
-        new_state = GameState(self.get_layout(), self.nagents)
-        new_state.board = self.board.deep_copy()
-        new_state.nagents = self.nagents
+        new_state = None
+        free_list = GameState._free_lists.get((self.board.w, self.board.h, self.nagents, self.lines.table.k))
+        if free_list:
+            try:
+                new_state = free_list.pop()
+            except IndexError:
+                # Emptied by another thread (e.g., a pondering agent)
+                pass
+        if new_state is not None:
+            new_state.board.copy_from(self.board)
+            new_state.lines.copy_from(self.lines)
+            new_state.key = self.key
+            new_state.mirror_key = self.mirror_key
+            new_state.verbose = self.verbose
+        else:
+            new_state = self.copy()
         new_state.make_move(agent_index, action)
 
         return new_state
@@ -542,144 +666,83 @@ class GameState:
         """
         Applies the given action in the current state.
         """
-        self.board.push_token(agent_index, action)
+        if self.board.push_token(agent_index, action) >= 0:
+            cell = action*self.board.h+len(self.board.data[action])-1
+            self.lines.push(agent_index, cell)
+            i = cell*self.nagents+agent_index
+            self.key ^= self.zobrist.keys[i]
+            self.mirror_key ^= self.zobrist.mirror_keys[i]
         #self.cur_agent = agent_index
 
     def unmake_move(self, action):
         """
         Undo the given action in the current state.
         """
-        self.board.pop_token(action)
+        token = self.board.pop_token(action)
+        if token != self.board.INVALID_TOKEN:
+            cell = action*self.board.h+len(self.board.data[action])
+            self.lines.pop(token, cell)
+            i = cell*self.nagents+token
+            self.key ^= self.zobrist.keys[i]
+            self.mirror_key ^= self.zobrist.mirror_keys[i]
 
     #def get_current_agent(self):
     #    return self.cur_agent
 
+    def to_notation(self):
+        """
+        Returns the board string of the current position (see
+        upo.connect4.notation).
+        """
+        return upo.connect4.notation.format_board(self)
+
+    @staticmethod
+    def from_notation(text, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+        """
+        Creates the state described by the given position string, either a
+        move sequence or a board string (see upo.connect4.notation).
+        """
+        return upo.connect4.notation.parse_position(text, layout, num_agents, k)
+
+    def get_key(self):
+        """
+        Returns the Zobrist key of the current position.
+        """
+        return self.key
+
+    def get_mirror_key(self):
+        """
+        Returns the Zobrist key of the mirror image of the current position
+        (with respect to the vertical axis of the board).
+        """
+        return self.mirror_key
+
+    def get_canonical_key(self):
+        """
+        Returns the pair (key, mirrored), where key is the same for the current
+        position and its mirror image, and mirrored tells if actions must be
+        mirrored to map them to the canonical form (see
+        upo.connect4.hashing.get_canonical_key).
+        """
+        return upo.connect4.hashing.get_canonical_key(self)
+
     def get_winner_positions(self):
         """
         Returns a list of (column,row) pairs representing the winning positions,
         if any; otherwise, returns an empty list
-        """
-        pos = []
-        for x in range(self.board.width()):
-            #for y in range(self.board.height()):
-            for y in range(self.board.get_column_empty_row(x)+1, self.board.height()):
-                #if not self.board.has_token(x, y):
-                #    continue
-                token = self.board.get_token(x, y)
-                if x < (self.board.width()-3):
-                    # check horizontal '-' pattern
-                    if (self.board.get_token(x+1, y) == token and
-                        self.board.get_token(x+2, y) == token and
-                        self.board.get_token(x+3, y) == token):
-                        pos = [(x,y), (x+1,y), (x+2,y), (x+3,y)]
-                        # check for more than 4 tokens
-                        for xx in range(x+4, self.board.width()):
-                            if self.board.get_token(xx, y) != token:
-                                break
-                            pos.append((xx,y))
-                        for xx in range(x-1, -1, -1):
-                            if self.board.get_token(xx, y) != token:
-                                break
-                            pos.append((xx,y))
-                        break;
-                    # check right diagonal '/' pattern
-                    if (y >= 3 and
-                        self.board.get_token(x+1, y-1) == token and
-                        self.board.get_token(x+2, y-2) == token and
-                        self.board.get_token(x+3, y-3) == token):
-                        pos = [(x,y), (x+1,y-1), (x+2,y-2), (x+3,y-3)]
-                        # check for more than 4 tokens
-                        k0 = 4
-                        k1 = min(self.board.width()-(x+4), (y-3)) + k0
-                        for k in range(k0, k1):
-                            (xx, yy) = (x+k, y-k)
-                            if self.board.get_token(xx, yy) != token:
-                                break
-                            pos.append((xx,yy))
-                        k0 = min(x, self.board.height()-y)-1
-                        k1 = -1
-                        for k in range(k0, k1, -1):
-                            (xx, yy) = (x-k, y+k)
-                            if self.board.get_token(xx, yy) != token:
-                                break
-                            pos.append((xx,yy))
-                        break;
-                    ## check left diagonal '\' pattern
-                    if (y < (self.board.height()-3) and
-                        self.board.get_token(x+1, y+1) == token and
-                        self.board.get_token(x+2, y+2) == token and
-                        self.board.get_token(x+3, y+3) == token):
-                        pos = [(x,y), (x+1,y+1), (x+2,y+2), (x+3,y+3)]
-                        # check for more than 4 tokens
-                        #nk = min(self.board.width()-(x+3), self.board.height()-(y+3))-1
-                        #for k in range(nk):
-                        #    (xx, yy) = (x+k, y+k)
-                        #    if self.board.get_token(xx, yy) != token:
-                        #        break
-                        #    pos.append((xx,yy))
-                        #nk = min(x, y)-1
-                        #for k in range(nk, -1, -1):
-                        #    (xx, yy) = (x-k, y-k)
-                        #    if self.board.get_token(xx, yy) != token:
-                        #        break
-                        #    pos.append((xx,yy))
-                        k0 = 4
-                        k1 = min(self.board.width()-(x+4), self.board.height()-(y+4)) + k0
-                        for k in range(k0, k1):
-                            (xx, yy) = (x+k, y+k)
-                            if self.board.get_token(xx, yy) != token:
-                                break
-                            pos.append((xx,yy))
-                        k0 = min(x, y)-1
-                        k1 = -1
-                        for k in range(k0, k1, -1):
-                            (xx, yy) = (x-k, y-k)
-                            if self.board.get_token(xx, yy) != token:
-                                break
-                            pos.append((xx,yy))
-                        break;
-                # check vertical pattern
-                if (y < (self.board.height()-3) and
-                    self.board.get_token(x, y+1) == token and
-                    self.board.get_token(x, y+2) == token and
-                    self.board.get_token(x, y+3) == token):
-                    pos = [(x,y), (x,y+1), (x,y+2), (x,y+3)]
-                    # check for more than 4 tokens
-                    for yy in range(y+4, self.board.height()):
-                        if self.board.get_token(x, yy) != token:
-                            break
-                        pos.append((x,yy))
-                    for yy in range(y-1, -1, -1):
-                        if self.board.get_token(x, yy) != token:
-                            break
-                        pos.append((x,yy))
-                    break;
-                # check right diagonal '/' pattern
-                if (x >= 3 and
-                    y < (self.board.height()-3) and
-                    self.board.get_token(x-1, y+1) == token and
-                    self.board.get_token(x-2, y+2) == token and
-                    self.board.get_token(x-3, y+3) == token):
-                    pos = [(x,y), (x-1,y+1), (x-2,y+2), (x-3,y+3)]
-                    # check for more than 4 tokens
-                    k0 = 4
-                    k1 = min((x-3), self.board.height()-(y+4)) + k0
-                    for k in range(k0, k1):
-                        (xx, yy) = (x-k, y+k)
-                        if self.board.get_token(xx, yy) != token:
-                            break
-                        pos.append((xx,yy))
-                    k0 = min(self.board.width()-x, y)-1
-                    k1 = -1
-                    for k in range(k0, k1, -1):
-                        (xx, yy) = (x+k, y-k)
-                        if self.board.get_token(xx, yy) != token:
-                            break
-                        pos.append((xx,yy))
-                    break;
-            if len(pos) > 0:
-                break
-        return pos
+        The positions are the cells of all the lines completed by the winner,
+        found among the lines with some token (see
+        upo.connect4.lines.LineCounts), so their cost does not depend on the
+        size of the board.
+        """
+        winner = self.lines.get_winner()
+        if winner is None:
+            return []
+        table = self.lines.table
+        cells = set()
+        for line in self.lines.get_complete_lines(winner):
+            cells.update(table.lines[line])
+        return [(x, self.board.to_user_row(row)) for (x, row) in sorted([table.from_cell(cell) for cell in cells])]
 
     def can_win(self):
         """
@@ -688,94 +751,14 @@ class GameState:
         Note, if current state represents a winning situation the method returns
         True as well.
         """
-        # Checks from the top of the board (and left-to-right) if there is
-        # enough space to form a pattern or at least 4 tokens of the same
-        # colors.
-        # Note, to do this check it is sufficient to start from the top of each
-        # column, pick the first available token in the column, and check for
-        # one of the possible token patterns.
-        for x in range(self.board.width()):
-            # Starts at the top of the column
-            y = 0
-            # Picks the first available token
-            ytok = min(self.board.get_column_empty_row(x)+1, self.board.height()-1)
-            token = self.board.get_token(x, ytok)
-            # Checks for token patterns
-            if x < (self.board.width()-3):
-                # check horizontal '-' pattern
-                if (self.board.get_token(x+1, y) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x+2, y) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x+3, y) in [token, self.board.INVALID_TOKEN]):
-                    return True
-                ## check right diagonal '/' pattern
-                #if (y >= 3 and
-                #    self.board.get_token(x+1, y-1) in [token, self.board.INVALID_TOKEN] and
-                #    self.board.get_token(x+2, y-2) in [token, self.board.INVALID_TOKEN] and
-                #    self.board.get_token(x+3, y-3) in [token, self.board.INVALID_TOKEN]):
-                #    return True
-                # check left diagonal '\' pattern
-                if (y < (self.board.height()-3) and
-                    self.board.get_token(x+1, y+1) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x+2, y+2) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x+3, y+3) in [token, self.board.INVALID_TOKEN]):
-                    return True
-            # check vertical pattern
-            if (y < (self.board.height()-3) and
-                self.board.get_token(x, y+1) in [token, self.board.INVALID_TOKEN] and
-                self.board.get_token(x, y+2) in [token, self.board.INVALID_TOKEN] and
-                self.board.get_token(x, y+3) in [token, self.board.INVALID_TOKEN]):
-                return True
-            # check right diagonal '/' pattern
-            if x >= 3 and y < (self.board.height()-3):
-                # check horizontal '-' pattern
-                if (self.board.get_token(x-1, y+1) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x-2, y+2) in [token, self.board.INVALID_TOKEN] and
-                    self.board.get_token(x-3, y+3) in [token, self.board.INVALID_TOKEN]):
-                    return True
-        return False
+        return not self.lines.is_dead()
 
     def is_win(self):
         """
         Tells if the current state is a winning situation.
         """
         #return len(self.get_winner_positions()) > 0
-        for x in range(self.board.width()):
-            #for y in range(self.board.height()):
-            for y in range(self.board.get_column_empty_row(x)+1, self.board.height()):
-                token = self.board.get_token(x, y)
-                if x < (self.board.width()-3):
-                    # check horizontal '-' pattern
-                    if (self.board.get_token(x+1, y) == token and
-                        self.board.get_token(x+2, y) == token and
-                        self.board.get_token(x+3, y) == token):
-                        return True
-                    ## check right diagonal '/' pattern
-                    #if (y >= 3 and
-                    #    self.board.get_token(x+1, y-1) == token and
-                    #    self.board.get_token(x+2, y-2) == token and
-                    #    self.board.get_token(x+3, y-3) == token):
-                    #    return True
-                    ## check left diagonal '\' pattern
-                    if (y < (self.board.height()-3) and
-                        self.board.get_token(x+1, y+1) == token and
-                        self.board.get_token(x+2, y+2) == token and
-                        self.board.get_token(x+3, y+3) == token):
-                        return True
-                # check vertical pattern
-                if (y < (self.board.height()-3) and
-                    self.board.get_token(x, y+1) == token and
-                    self.board.get_token(x, y+2) == token and
-                    self.board.get_token(x, y+3) == token):
-                    return True
-                # check left diagonal '\' pattern
-                if x >= 3:
-                    if (y < (self.board.height()-3) and
-                        self.board.get_token(x-1, y+1) == token and
-                        self.board.get_token(x-2, y+2) == token and
-                        self.board.get_token(x-3, y+3) == token):
-                        return True
-        return False
-
+        return self.lines.is_win()
 
     def is_tie(self):
         """
@@ -783,44 +766,40 @@ class GameState:
         winner).
         """
         #return self.is_final() and not self.is_win()
-        return not self.can_win()
+        return not self.lines.is_win() and self.lines.is_dead()
 
     def is_final(self):
         """
         Tells if the current game state is a final state, that is:
-        - if there are at least 4 consecutive tokens belonging to the same
+        - if there are at least K consecutive tokens belonging to the same
           player, or
         - if the board is full, or
         - if the space left cannot contain a winner combination.
         """
         #return self.board.is_full() or self.is_win() or not self.can_win()
-        return self.board.is_full() or self.is_win() or self.is_tie()
+        # Note, a full board without winner has no winnable line left
+        return self.lines.is_final()
+
+    def classify(self):
+        """
+        Returns the class of the current game state, that is one of
+        upo.connect4.lines.IN_PROGRESS, upo.connect4.lines.WIN and
+        upo.connect4.lines.DRAW.
+        """
+        return self.lines.classify()
 
     def is_winner(self, agent_index):
         """
         Tells if the given agent is the winner.
         """
-        win_pos = self.get_winner_positions()
-        # Make sure this is a winning situation
-        if len(win_pos) > 0:
-            # Check if the winning token belongs to the given agent
-            (x,y) = win_pos[0]
-            if self.board.get_token(x, y) == agent_index:
-                return True
-        return False
+        return self.lines.get_winner() == agent_index
 
     def get_winner(self):
         """
         Returns the identifier of the winner agent, if the current state
         represents a win situation; None, otherwise.
         """
-        win_pos = self.get_winner_positions()
-        # Make sure this is a winning situation
-        if len(win_pos) > 0:
-            # Check if the winning token belongs to the given agent
-            (x,y) = win_pos[0]
-            return self.board.get_token(x, y)
-        return None
+        return self.lines.get_winner()
 
     def set_verbosity_level(self, level):
         """
@@ -850,17 +829,27 @@ class GameStats:
     NUM_MOVES_KEY = 'nmoves'
     TIMINGS_KEY = 'timings'
     NUM_EXPANDED_STATES_KEY = 'nstates'
+    NUM_FORFEITS_KEY = 'nforfeits'
+    SEARCH_STATS_KEY = 'search'
 
     def __init__(self, num_agents):
         self.stats = []
         for i in range(num_agents):
-            self.stats.append({self.NUM_MOVES_KEY: 0, self.TIMINGS_KEY: [], self.NUM_EXPANDED_STATES_KEY: 0})
+            self.stats.append({self.NUM_MOVES_KEY: 0, self.TIMINGS_KEY: [], self.NUM_EXPANDED_STATES_KEY: 0, self.NUM_FORFEITS_KEY: 0, self.SEARCH_STATS_KEY: []})
 
     def collect(self, agent_index, action, elapsed, num_states = 0):
         self.stats[agent_index][self.NUM_MOVES_KEY] += 1
         self.stats[agent_index][self.TIMINGS_KEY].append(elapsed)
         self.stats[agent_index][self.NUM_EXPANDED_STATES_KEY] += num_states
 
+    def collect_forfeit(self, agent_index, elapsed):
+        """
+        Records that the given agent forfeited the game (e.g., because it ran
+        out of time) after thinking for the given number of seconds.
+        """
+        self.stats[agent_index][self.NUM_FORFEITS_KEY] += 1
+        self.stats[agent_index][self.TIMINGS_KEY].append(elapsed)
+
     def get_tot_num_moves(self, agent_index):
         return self.stats[agent_index][self.NUM_MOVES_KEY]
 
@@ -870,6 +859,57 @@ class GameStats:
     def get_tot_expanded_states(self, agent_index):
         return self.stats[agent_index][self.NUM_EXPANDED_STATES_KEY]
 
+    def collect_search_stats(self, agent_index, search_stats):
+        """
+        Records the search statistics (see upo.connect4.agents.SearchStats)
+        of the last move of the given agent.
+        """
+        self.stats[agent_index][self.SEARCH_STATS_KEY].append(search_stats)
+
+    def get_tot_forfeits(self, agent_index):
+        return self.stats[agent_index][self.NUM_FORFEITS_KEY]
+
+    def get_search_stats(self, agent_index):
+        """
+        Returns the list of search statistics collected for the given agent,
+        one for each move.
+        """
+        return self.stats[agent_index][self.SEARCH_STATS_KEY]
+
+    def get_tot_search_stats(self, agent_index):
+        """
+        Returns the search statistics of the given agent aggregated over all of
+        its moves, or None if the agent does not collect them.
+        """
+        search_stats = self.stats[agent_index][self.SEARCH_STATS_KEY]
+        if len(search_stats) == 0:
+            return None
+        tot = search_stats[0].copy()
+        for s in search_stats[1:]:
+            tot.merge(s)
+        return tot
+
+    def to_dict(self):
+        """
+        Returns the statistics of all agents as a list of dictionaries.
+        """
+        out = []
+        for agent_index in range(len(self.stats)):
+            tot_search_stats = self.get_tot_search_stats(agent_index)
+            out.append({self.NUM_MOVES_KEY: self.get_tot_num_moves(agent_index),
+                        self.TIMINGS_KEY: list(self.stats[agent_index][self.TIMINGS_KEY]),
+                        self.NUM_EXPANDED_STATES_KEY: self.get_tot_expanded_states(agent_index),
+                        self.NUM_FORFEITS_KEY: self.get_tot_forfeits(agent_index),
+                        self.SEARCH_STATS_KEY: [s.to_dict() for s in self.get_search_stats(agent_index)],
+                        'tot_search': tot_search_stats.to_dict() if tot_search_stats is not None else None})
+        return out
+
+    def export(self, fp):
+        """
+        Writes the statistics of all agents as JSON to the given file object.
+        """
+        json.dump(self.to_dict(), fp, indent=1)
+
 
 ################################################################################
 
@@ -881,27 +921,37 @@ class Game:
     Note, to play this game, the following requirements need to be satisfied:
     - the board layout must be 4x4 or larger (the standard game uses a 7x6 board
       layout),
+    - the number of tokens in a row needed to win (K, 4 in the standard game)
+      must be at least 2 and fit in the width or in the height of the board,
     - the number of agents must be 2 or greater.
     """
-    def __init__(self, agents, layout):
+    def __init__(self, agents, layout, k=upo.connect4.lines.DEFAULT_K):
         if layout[0] < 4 or layout[1] < 4:
             raise Exception('Board must be at least 4x4 large.')
+        if k < 2 or k > max(layout[0], layout[1]):
+            raise Exception('The number of tokens in a row needed to win must be at least 2 and at most the width or the height of the board.')
         if len(agents) < 2:
             raise Exception('The game needs at least two agents to play.')
         self.agents = agents
-        self.state = GameState(layout, len(agents))
+        self.state = GameState(layout, len(agents), k)
         self.start_agent_idx = agents[0].get_index()
         self.cur_agent_idx = self.start_agent_idx
         self.verbose = 0
         self.stats = GameStats(len(agents))
+        self.forfeit_agent_idx = None
+        self.pondering = False
+        self.moves = []
 
     def reset(self):
         """
         Resets the game to the initial state.
         """
-        self.state = GameState(self.get_layout(), self.num_agents())
+        self.stop_pondering()
+        self.state = GameState(self.get_layout(), self.num_agents(), self.get_k())
         self.cur_agent_idx = self.start_agent_idx
         self.stats = GameStats(self.num_agents())
+        self.forfeit_agent_idx = None
+        self.moves = []
 
     def get_state(self):
         """
@@ -915,6 +965,12 @@ class Game:
         """
         return self.state.get_layout()
 
+    def get_k(self):
+        """
+        Gets the number of tokens in a row needed to win.
+        """
+        return self.state.get_k()
+
     def get_starting_agent(self):
         """
         Gets the agent who starts playing.
@@ -950,21 +1006,42 @@ class Game:
         Advances the game by making the move for the current agent and passing
         the turn to the next agent.
         Returns the action.
+        If the agent raises MoveTimeout, the agent forfeits the game, the game
+        is over and None is returned.
 
         Note, if you call get_current_agent before and after a call to
         make_move, the returned agent is in general different because make_move
         passes the turn to the next agent.
         """
         agent = self.get_current_agent()
+        agent.stop_pondering()
         start_ts = time.time()
-        column = agent.get_action(self.state)
-        elapsed_time = time.time()-start_ts
+        try:
+            column = agent.get_action(self.state)
+        except MoveTimeout:
+            # The agent ran out of time and loses the game
+            self.forfeit(time.time()-start_ts)
+            return None
+        return self.commit_move(column, time.time()-start_ts)
+
+    def commit_move(self, column, elapsed_time):
+        """
+        Plays the given column on behalf of the current agent, who took the
+        given number of seconds to choose it, and passes the turn to the next
+        agent.
+        Returns the action.
+
+        This is the second half of make_move, for callers that get the action
+        from the agent on their own (e.g., in a background thread).
+        """
+        agent = self.get_current_agent()
         if column != None:
             if not self.state.is_legal_action(column):
                 raise Exception('Agent ', agent.get_index(), " played an illegal move")
             if self.get_verbosity_level() > 0:
                 print('Agent ', agent.get_index(), ' placed a token in column: ', column)
             self.state.make_move(agent.get_index(), column)
+            self.moves.append((agent.get_index(), column, elapsed_time))
         else:
             if len(self.state.get_legal_actions()) > 0:
                 raise Exception('Agent ', agent.get_index(), " didn't play any move but at least one action is available")
@@ -972,14 +1049,79 @@ class Game:
         if 'num_expanded_states' in dir(agent):
             num_states = agent.num_expanded_states()-self.stats.get_tot_expanded_states(agent.get_index())
         self.stats.collect(agent.get_index(), column, elapsed_time, num_states)
+        if 'get_search_stats' in dir(agent) and agent.get_search_stats() is not None:
+            self.stats.collect_search_stats(agent.get_index(), agent.get_search_stats())
         self.cur_agent_idx = (self.cur_agent_idx+1) % len(self.agents)
+        if self.is_over():
+            self.stop_pondering()
+        elif self.pondering:
+            # Lets the agents waiting for their turn think in the background
+            for other_agent in self.agents:
+                if other_agent.get_index() != self.cur_agent_idx:
+                    other_agent.start_pondering(self.state, self.cur_agent_idx)
         return column
 
+    def forfeit(self, elapsed_time):
+        """
+        Makes the current agent, who ran out of time after the given number of
+        seconds, forfeit the game.
+        """
+        agent = self.get_current_agent()
+        if self.get_verbosity_level() > 0:
+            print('Agent ', agent.get_index(), ' timed out and forfeits the game')
+        self.stats.collect_forfeit(agent.get_index(), elapsed_time)
+        self.forfeit_agent_idx = agent.get_index()
+        self.stop_pondering()
+
+    def play_opening(self, columns):
+        """
+        Plays the given sequence of columns on behalf of the agents, in turn,
+        without asking them for a move (e.g., to randomize the opening).
+        These moves are not accounted in game statistics.
+        """
+        for column in columns:
+            if not self.state.is_legal_action(column):
+                raise Exception('Opening move ', column, ' is illegal')
+            self.state.make_move(self.get_current_agent().get_index(), column)
+            self.moves.append((self.get_current_agent().get_index(), column, 0.0))
+            self.cur_agent_idx = (self.cur_agent_idx+1) % len(self.agents)
+
     def is_over(self):
         """
         Tells if the game is over.
         """
-        return self.state.is_final()
+        return self.forfeit_agent_idx is not None or self.state.is_final()
+
+    def set_pondering(self, enabled):
+        """
+        Enables or disables pondering, that is letting the agents think in the
+        background while waiting for their turn (see Agent.start_pondering).
+        Note that agents pondering in this process compete for the CPU (and
+        the interpreter lock) with the agent to move, so the timings collected
+        in games between computer agents are distorted.
+        """
+        self.pondering = enabled
+        if not enabled:
+            self.stop_pondering()
+
+    def is_pondering_enabled(self):
+        return self.pondering
+
+    def stop_pondering(self):
+        """
+        Tells all the agents to stop pondering.
+        """
+        for agent in self.agents:
+            agent.stop_pondering()
+
+    def get_forfeiting_agent(self):
+        """
+        Gets the agent who forfeited the game (e.g., because of a timeout), if
+        any; otherwise, returns None.
+        """
+        if self.forfeit_agent_idx is None:
+            return None
+        return self.agents[self.forfeit_agent_idx]
 
     def set_verbosity_level(self, level):
         """
@@ -998,3 +1140,36 @@ class Game:
 
     def get_stats(self):
         return self.stats
+
+    def get_moves(self):
+        """
+        Returns the list of the (agent index, column, elapsed time) triples of
+        the moves played so far, in order.
+        Opening moves (see play_opening) are included, with a zero elapsed
+        time.
+        """
+        return self.moves
+
+
+def make_random_opening(game, num_plies):
+    """
+    Picks a random sequence of (at most) num_plies legal moves for the given
+    game, without playing them (see Game.play_opening).
+    The sequence stops before any move that would end the game.
+    """
+    state = GameState(game.get_layout(), game.num_agents(), game.get_k())
+    agent_index = game.get_current_agent().get_index()
+    columns = []
+    for i in range(num_plies):
+        legals = state.get_legal_actions()
+        if len(legals) == 0:
+            break
+        column = random.choice(legals)
+        state.make_move(agent_index, column)
+        if state.is_final():
+            # Do not give away the game during the opening
+            state.unmake_move(column)
+            break
+        columns.append(column)
+        agent_index = (agent_index+1) % game.num_agents()
+    return columns
@@ -0,0 +1,263 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+
+# The seed of the random keys: keys must not change between runs (and
+# processes) so that they can be stored in opening books and similar files
+ZOBRIST_SEED = 20150101
+
+# Kinds of values stored in a transposition table
+EXACT_VALUE = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class ZobristTable:
+    """
+    Random 64-bit keys for Zobrist hashing of the positions of a WxH board
+    played by N agents.
+
+    The key of a position is the XOR of the keys of its (cell, agent) pairs,
+    where cells are indexed as x*H+row with row counted from the bottom of the
+    board (see upo.connect4.lines.LineTable).
+    Along with the keys of the cells, the table provides the keys of their
+    mirror cells (with respect to the vertical axis of the board), so that the
+    key of the mirror position can be maintained incrementally too.
+
+    Zobrist tables are immutable and can be shared: use get_zobrist_table to
+    obtain them.
+    """
+
+    def __init__(self, width, height, num_agents, seed=ZOBRIST_SEED):
+        self.w = width
+        self.h = height
+        self.nagents = num_agents
+        rng = random.Random(seed)
+        # keys[cell*nagents+agent]
+        self.keys = [rng.getrandbits(64) for i in range(width*height*num_agents)]
+        # mirror_keys[cell*nagents+agent] is the key of the mirror cell
+        self.mirror_keys = [0]*len(self.keys)
+        for x in range(width):
+            for y in range(height):
+                for a in range(num_agents):
+                    self.mirror_keys[(x*height+y)*num_agents+a] = self.keys[((width-x-1)*height+y)*num_agents+a]
+
+    def get_key(self, agent_index, cell):
+        """
+        Returns the key of a token of the given agent in the given cell.
+        """
+        return self.keys[cell*self.nagents+agent_index]
+
+    def get_mirror_key(self, agent_index, cell):
+        """
+        Returns the key of a token of the given agent in the mirror of the
+        given cell.
+        """
+        return self.mirror_keys[cell*self.nagents+agent_index]
+
+
+_zobrist_tables = {}
+
+
+def get_zobrist_table(width, height, num_agents):
+    """
+    Returns the (shared) Zobrist table for the given layout and number of
+    agents.
+    """
+    key = (width, height, num_agents)
+    table = _zobrist_tables.get(key)
+    if table is None:
+        table = ZobristTable(width, height, num_agents)
+        _zobrist_tables[key] = table
+    return table
+
+
+def get_canonical_key(game_state):
+    """
+    Returns the pair (key, mirrored) where key is the canonical key of the
+    given state, that is the smallest between its key and the key of its
+    mirror image, and mirrored tells if the canonical key is the one of the
+    mirror image.
+
+    Both mirror images of a position have the same canonical key; use
+    to_canonical_action and from_canonical_action to map actions between the
+    position and its canonical form.
+    """
+    key = game_state.get_key()
+    mirror_key = game_state.get_mirror_key()
+    if mirror_key < key:
+        return (mirror_key, True)
+    return (key, False)
+
+
+def mirror_action(action, width):
+    """
+    Returns the column that mirrors the given one on a board of the given
+    width.
+    """
+    return width-action-1
+
+
+def to_canonical_action(action, mirrored, width):
+    """
+    Maps an action of a position to the corresponding action of its canonical
+    form.
+    """
+    if mirrored and action is not None:
+        return width-action-1
+    return action
+
+
+def from_canonical_action(action, mirrored, width):
+    """
+    Maps an action of the canonical form of a position back to the
+    corresponding action of the position.
+    """
+    # Mirroring is an involution
+    return to_canonical_action(action, mirrored, width)
+
+
+################################################################################
+
+
+class CanonicalTable:
+    """
+    A table (e.g., a transposition table, an evaluation cache or an opening
+    book) that stores a single entry per symmetry class of positions.
+
+    Entries are (value, action) pairs keyed by canonical key: actions are
+    stored in canonical form and mapped back to the probing position on
+    lookup.
+    When the table is full, the oldest entries are replaced.
+
+    Note, the key of a position does not include the agent to move: use a
+    separate table per agent (or include the agent in the value) when this is
+    not implied by the position itself.
+    """
+
+    def __init__(self, max_size=float('+inf')):
+        self.max_size = max_size
+        self.entries = {}
+
+    def lookup(self, game_state):
+        """
+        Returns the (value, action) pair stored for the given state (or its
+        mirror image), if any; otherwise, returns None.
+        """
+        (key, mirrored) = get_canonical_key(game_state)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return (entry[0], from_canonical_action(entry[1], mirrored, game_state.board.w))
+
+    def store(self, game_state, value, action=None):
+        """
+        Stores the given value and action for the given state.
+        """
+        if self.max_size <= 0:
+            return
+        (key, mirrored) = get_canonical_key(game_state)
+        if key not in self.entries and len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+        self.entries[key] = (value, to_canonical_action(action, mirrored, game_state.board.w))
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, game_state):
+        return get_canonical_key(game_state)[0] in self.entries
+
+
+################################################################################
+
+
+class TranspositionTable:
+    """
+    A transposition table for games with any number of agents.
+
+    Entries are keyed by position and agent to move (in an n-player game the
+    same position can be reached with different agents to move) and store the
+    remaining search depth, the value (which can be a number or a vector of
+    numbers), the kind of the value (EXACT_VALUE, LOWER_BOUND or UPPER_BOUND)
+    and the best action.
+    Unless fold_mirrors is False, a position and its mirror image share the
+    same entry (see CanonicalTable).
+
+    An entry is replaced only by an entry with at least the same remaining
+    depth; when the table is full, the oldest entries are replaced.
+    """
+
+    def __init__(self, max_size=1000000, fold_mirrors=True):
+        self.max_size = max_size
+        self.fold_mirrors = fold_mirrors
+        self.entries = {}
+
+    def make_key(self, game_state, agent_index):
+        """
+        Returns the pair (key, mirrored) for the given state and agent to move.
+        """
+        if self.fold_mirrors:
+            (key, mirrored) = get_canonical_key(game_state)
+        else:
+            (key, mirrored) = (game_state.get_key(), False)
+        return ((key, agent_index), mirrored)
+
+    def probe(self, game_state, agent_index):
+        """
+        Returns the (depth, value, kind, action) tuple stored for the given
+        state and agent to move, if any; otherwise, returns None.
+        """
+        (key, mirrored) = self.make_key(game_state, agent_index)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if mirrored:
+            return (entry[0], entry[1], entry[2], from_canonical_action(entry[3], True, game_state.board.w))
+        return entry
+
+    def store(self, game_state, agent_index, depth, value, kind, action):
+        """
+        Stores the value of the given state (with the given agent to move)
+        searched to the given remaining depth.
+        """
+        if self.max_size <= 0:
+            return
+        (key, mirrored) = self.make_key(game_state, agent_index)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > depth:
+                return
+        elif len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+        self.entries[key] = (depth, value, kind, to_canonical_action(action, mirrored, game_state.board.w))
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
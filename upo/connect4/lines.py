@@ -0,0 +1,471 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Game state classes
+IN_PROGRESS = 0
+WIN = 1
+DRAW = 2
+
+CLASS_NAMES = {IN_PROGRESS: 'in-progress', WIN: 'win', DRAW: 'draw'}
+
+# Special line owners
+EMPTY_LINE = -1
+DEAD_LINE = -2
+
+# Number of tokens in a row needed to win in the standard game
+DEFAULT_K = 4
+
+
+class LineTable:
+    """
+    The table of all the lines of K cells (horizontal, vertical and diagonal)
+    of a WxH board.
+
+    Cells are identified by a single index computed from the column x and the
+    row counted from the bottom of the board (i.e., the stack position of the
+    token in the column), as x*H+row.
+
+    Line tables are immutable and can be shared: use get_line_table to obtain
+    them.
+    """
+
+    def __init__(self, width, height, k=DEFAULT_K):
+        self.w = width
+        self.h = height
+        self.k = k
+        # lines[i] is the tuple of cells of the i-th line
+        self.lines = []
+        for x in range(width):
+            for y in range(height):
+                # horizontal '-', vertical '|', diagonals '/' and '\'
+                for (dx, dy) in [(1, 0), (0, 1), (1, 1), (1, -1)]:
+                    (xx, yy) = (x+(k-1)*dx, y+(k-1)*dy)
+                    if 0 <= xx < width and 0 <= yy < height:
+                        self.lines.append(tuple([(x+i*dx)*height+(y+i*dy) for i in range(k)]))
+        # cell_lines[c] is the tuple of the lines passing through cell c
+        cell_lines = [[] for c in range(width*height)]
+        for (line, cells) in enumerate(self.lines):
+            for c in cells:
+                cell_lines[c].append(line)
+        self.cell_lines = [tuple(x) for x in cell_lines]
+
+    def width(self):
+        """
+        Returns the width of the board.
+        """
+        return self.w
+
+    def height(self):
+        """
+        Returns the height of the board.
+        """
+        return self.h
+
+    def line_length(self):
+        """
+        Returns the number of cells of each line.
+        """
+        return self.k
+
+    def num_lines(self):
+        """
+        Returns the number of lines.
+        """
+        return len(self.lines)
+
+    def to_cell(self, column, row):
+        """
+        Returns the index of the cell in the given column and stack row (i.e.,
+        row 0 is the bottom of the board).
+        """
+        return column*self.h+row
+
+    def from_cell(self, cell):
+        """
+        Returns the (column,row) pair of the given cell, where row is the stack
+        row (i.e., row 0 is the bottom of the board).
+        """
+        return divmod(cell, self.h)
+
+    def get_line_cells(self, line):
+        """
+        Returns the (column,row) pairs of the cells of the given line, where
+        row is the stack row.
+        """
+        return [divmod(c, self.h) for c in self.lines[line]]
+
+
+_line_tables = {}
+
+
+def get_line_table(width, height, k=DEFAULT_K):
+    """
+    Returns the (shared) line table for the given layout.
+    """
+    key = (width, height, k)
+    table = _line_tables.get(key)
+    if table is None:
+        table = LineTable(width, height, k)
+        _line_tables[key] = table
+    return table
+
+
+################################################################################
+
+
+class LineCounts:
+    """
+    Incrementally maintained line statistics of a game state.
+
+    For every line, the number of tokens of each player and the line owner are
+    kept, where the owner is EMPTY_LINE if the line has no token, the player
+    index if the line only contains tokens of that player, and DEAD_LINE if the
+    line contains tokens of more than one player (so nobody can complete it).
+    From these, for every player, the number of lines the player can still
+    complete, the number of lines the player has completed and the number of
+    open lines (i.e., lines owned by the player) by number of tokens are kept
+    as well.
+
+    This makes it possible to tell in constant time if the state is a win, a
+    draw (either because the board is full or because nobody can complete a
+    line anymore) or a state still in progress.
+    """
+
+    __slots__ = ('table', 'nagents', 'counts', 'owners', 'winnable', 'wins', 'nwins', 'ntokens', 'open_lines')
+
+    def __init__(self, table, num_agents):
+        self.table = table
+        self.nagents = num_agents
+        nlines = len(table.lines)
+        # counts[line*nagents+player] is the number of tokens of player in line
+        self.counts = [0]*(nlines*num_agents)
+        self.owners = [EMPTY_LINE]*nlines
+        self.winnable = [nlines]*num_agents
+        self.wins = [0]*num_agents
+        self.nwins = 0
+        self.ntokens = 0
+        # open_lines[player*(K+1)+c] is the number of lines owned by player
+        # with c tokens
+        self.open_lines = [0]*(num_agents*(table.k+1))
+
+    def copy(self):
+        """
+        Creates a copy of these counts.
+        """
+        lc = LineCounts.__new__(LineCounts)
+        lc.table = self.table
+        lc.nagents = self.nagents
+        lc.counts = self.counts[:]
+        lc.owners = self.owners[:]
+        lc.winnable = self.winnable[:]
+        lc.wins = self.wins[:]
+        lc.nwins = self.nwins
+        lc.ntokens = self.ntokens
+        lc.open_lines = self.open_lines[:]
+        return lc
+
+    def copy_from(self, other):
+        """
+        Overwrites these counts with the given ones, which must refer to the
+        same line table and number of agents.
+        """
+        self.counts[:] = other.counts
+        self.owners[:] = other.owners
+        self.winnable[:] = other.winnable
+        self.wins[:] = other.wins
+        self.nwins = other.nwins
+        self.ntokens = other.ntokens
+        self.open_lines[:] = other.open_lines
+
+    def push(self, player, cell):
+        """
+        Updates the counts after a token of the given player has been put in
+        the given cell.
+        """
+        n = self.nagents
+        k = self.table.k
+        counts = self.counts
+        owners = self.owners
+        winnable = self.winnable
+        open_lines = self.open_lines
+        base = player*(k+1)
+        for line in self.table.cell_lines[cell]:
+            i = line*n+player
+            c = counts[i]+1
+            counts[i] = c
+            owner = owners[line]
+            if owner == EMPTY_LINE:
+                owners[line] = player
+                for q in range(n):
+                    if q != player:
+                        winnable[q] -= 1
+            elif owner != player:
+                if owner != DEAD_LINE:
+                    owners[line] = DEAD_LINE
+                    winnable[owner] -= 1
+                    open_lines[owner*(k+1)+counts[line*n+owner]] -= 1
+                continue
+            else:
+                open_lines[base+c-1] -= 1
+            open_lines[base+c] += 1
+            if c == k:
+                self.wins[player] += 1
+                self.nwins += 1
+        self.ntokens += 1
+
+    def pop(self, player, cell):
+        """
+        Updates the counts after the token of the given player has been removed
+        from the given cell.
+        """
+        n = self.nagents
+        k = self.table.k
+        counts = self.counts
+        owners = self.owners
+        winnable = self.winnable
+        open_lines = self.open_lines
+        base = player*(k+1)
+        for line in self.table.cell_lines[cell]:
+            i = line*n+player
+            c = counts[i]
+            counts[i] = c-1
+            if owners[line] == player:
+                open_lines[base+c] -= 1
+                if c == k:
+                    self.wins[player] -= 1
+                    self.nwins -= 1
+                if c == 1:
+                    owners[line] = EMPTY_LINE
+                    for q in range(n):
+                        if q != player:
+                            winnable[q] += 1
+                else:
+                    open_lines[base+c-1] += 1
+            elif c == 1:
+                # The line is dead: it comes back to life if only one player
+                # is left in it
+                line_base = line*n
+                remaining = [q for q in range(n) if counts[line_base+q] > 0]
+                if len(remaining) == 1:
+                    owners[line] = remaining[0]
+                    winnable[remaining[0]] += 1
+                    open_lines[remaining[0]*(k+1)+counts[line_base+remaining[0]]] += 1
+        self.ntokens -= 1
+
+    def num_tokens(self):
+        """
+        Returns the number of tokens on the board.
+        """
+        return self.ntokens
+
+    def num_winnable_lines(self, player):
+        """
+        Returns the number of lines the given player can still complete
+        (including the ones already completed).
+        """
+        return self.winnable[player]
+
+    def num_complete_lines(self, player):
+        """
+        Returns the number of lines completed by the given player.
+        """
+        return self.wins[player]
+
+    def get_line_count(self, line, player):
+        """
+        Returns the number of tokens of the given player in the given line.
+        """
+        return self.counts[line*self.nagents+player]
+
+    def num_open_lines(self, player, num_tokens):
+        """
+        Returns the number of lines holding exactly the given number of tokens
+        (at least 1) of the given player and no token of the other players.
+        """
+        return self.open_lines[player*(self.table.k+1)+num_tokens]
+
+    def get_line_owner(self, line):
+        """
+        Returns the owner of the given line, that is EMPTY_LINE, DEAD_LINE or
+        the index of the only player with tokens in the line.
+        """
+        return self.owners[line]
+
+    def iter_owners(self):
+        """
+        Iterates over the (line, owner) pairs of (at least) all the lines with
+        some token; pairs of empty lines can be included too.
+        """
+        return enumerate(self.owners)
+
+    def get_complete_lines(self, player):
+        """
+        Returns the list of the lines completed by the given player.
+        """
+        if self.wins[player] == 0:
+            return []
+        n = self.nagents
+        k = self.table.k
+        counts = self.counts
+        return [line for (line, owner) in self.iter_owners() if owner == player and counts[line*n+player] == k]
+
+    def is_win(self):
+        """
+        Tells if some player has completed a line.
+        """
+        return self.nwins > 0
+
+    def is_dead(self):
+        """
+        Tells if no player can complete a line anymore.
+        """
+        return not any(self.winnable)
+
+    def is_full(self):
+        """
+        Tells if the board is full.
+        """
+        return self.ntokens == self.table.w*self.table.h
+
+    def is_final(self):
+        """
+        Tells if the game is over, that is if some player has completed a line
+        or nobody can complete a line anymore (which includes the full board).
+        """
+        return self.nwins > 0 or not any(self.winnable)
+
+    def get_winner(self):
+        """
+        Returns the index of the player that has completed a line, if any;
+        otherwise, returns None.
+        """
+        if self.nwins > 0:
+            for (player, w) in enumerate(self.wins):
+                if w > 0:
+                    return player
+        return None
+
+    def classify(self):
+        """
+        Returns the class of the state, that is one of IN_PROGRESS, WIN and
+        DRAW.
+        """
+        if self.nwins > 0:
+            return WIN
+        if not any(self.winnable):
+            return DRAW
+        return IN_PROGRESS
+
+
+################################################################################
+
+
+class _SparseMap(dict):
+    """
+    A dictionary whose missing keys have a default value (without being
+    added).
+    """
+
+    __slots__ = ('default',)
+
+    def __init__(self, default, items=()):
+        dict.__init__(self, items)
+        self.default = default
+
+    def __missing__(self, key):
+        return self.default
+
+    def copy(self):
+        return _SparseMap(self.default, self)
+
+
+class SparseLineCounts(LineCounts):
+    """
+    Line statistics that only store the lines with some token.
+
+    The counts and the owners of the lines are kept in dictionaries where
+    missing lines are empty, so copying the statistics (e.g., for every
+    successor state generated by a search) costs as much as the lines through
+    the tokens on the board, not as all the lines of the board.
+    This pays off on large boards (see make_line_counts).
+    """
+
+    __slots__ = ()
+
+    def __init__(self, table, num_agents):
+        self.table = table
+        self.nagents = num_agents
+        self.counts = _SparseMap(0)
+        self.owners = _SparseMap(EMPTY_LINE)
+        self.winnable = [len(table.lines)]*num_agents
+        self.wins = [0]*num_agents
+        self.nwins = 0
+        self.ntokens = 0
+        self.open_lines = [0]*(num_agents*(table.k+1))
+
+    def copy(self):
+        lc = SparseLineCounts.__new__(SparseLineCounts)
+        lc.table = self.table
+        lc.nagents = self.nagents
+        lc.counts = self.counts.copy()
+        lc.owners = self.owners.copy()
+        lc.winnable = self.winnable[:]
+        lc.wins = self.wins[:]
+        lc.nwins = self.nwins
+        lc.ntokens = self.ntokens
+        lc.open_lines = self.open_lines[:]
+        return lc
+
+    def copy_from(self, other):
+        self.counts = other.counts.copy()
+        self.owners = other.owners.copy()
+        self.winnable[:] = other.winnable
+        self.wins[:] = other.wins
+        self.nwins = other.nwins
+        self.ntokens = other.ntokens
+        self.open_lines[:] = other.open_lines
+
+    def pop(self, player, cell):
+        LineCounts.pop(self, player, cell)
+        # Forgets the lines that have been left empty
+        n = self.nagents
+        counts = self.counts
+        owners = self.owners
+        for line in self.table.cell_lines[cell]:
+            i = line*n+player
+            if i in counts and counts[i] == 0:
+                del counts[i]
+            if owners.get(line) == EMPTY_LINE:
+                del owners[line]
+
+    def iter_owners(self):
+        return self.owners.items()
+
+
+# Boards with at least this number of lines keep sparse line statistics
+SPARSE_MIN_LINES = 512
+
+
+def make_line_counts(table, num_agents):
+    """
+    Returns the line statistics of an empty board of the given line table:
+    dense ones (LineCounts) for small boards, and sparse ones
+    (SparseLineCounts) for large boards.
+    """
+    if table.num_lines() >= SPARSE_MIN_LINES:
+        return SparseLineCounts(table, num_agents)
+    return LineCounts(table, num_agents)
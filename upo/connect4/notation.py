@@ -0,0 +1,426 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact notation of positions.
+
+A position can be written in two forms:
+- move sequence: the columns played from the empty board, one symbol each
+  (0-9, then a-z for columns 10-35), the first move being made by agent 0
+  and the others following in turn; e.g., "3342" (the empty board is "");
+- board string: the columns of the board separated by "/", each one listing
+  its tokens from the bottom as agent indices (0-9); e.g., "/1//01//0/" is
+  the 7-columns board with a token of agent 1 in column 1, tokens of agents
+  0 and 1 in column 3 and a token of agent 0 in column 5.
+Strings containing "/" are board strings; other strings are move sequences.
+
+The height of the board and the number of agents are not part of the
+notation.
+In both forms, the agent to move is the number of tokens modulo the number of
+agents (i.e., agent 0 moves first).
+Positions that cannot occur in a game are rejected: moves made after the end
+of the game and, in board strings, agents with more or less tokens than the
+turn order gives them, or complete lines that do not all go through a top
+token of the agent who moved last.
+
+Files of positions have a position per line (in either form); empty lines and
+lines starting with "#" are skipped, and anything following the position on
+the same line (after a space or a tab) is ignored.
+Hence, in files the empty board must be written as a board string (e.g.,
+"//////" for a board with 7 columns).
+load_positions reads such files in bulk (with NumPy) into the bit-plane
+encoding of upo.connect4.dataset, without building a game state per position.
+"""
+
+
+import upo.connect4.game
+import upo.connect4.lines
+
+
+MOVES_FORM = 'moves'
+BOARD_FORM = 'board'
+FORMS = [MOVES_FORM, BOARD_FORM]
+
+COLUMN_SYMBOLS = '0123456789abcdefghijklmnopqrstuvwxyz'
+MAX_WIDTH = len(COLUMN_SYMBOLS)
+MAX_AGENTS = 10
+BOARD_SEPARATOR = '/'
+CHUNK_SIZE = 65536 # positions parsed at once by iter_position_chunks
+
+_column_numbers = dict([(symbol, x) for (x, symbol) in enumerate(COLUMN_SYMBOLS)])
+
+
+def get_form(text):
+    """
+    Returns the form (MOVES_FORM or BOARD_FORM) of the given position string.
+    """
+    return BOARD_FORM if BOARD_SEPARATOR in text else MOVES_FORM
+
+
+def parse_moves(text, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the state reached by playing the given move sequence from the
+    empty board.
+    """
+    state = upo.connect4.game.GameState(layout, num_agents, k)
+    width = layout[0]
+    for (ply, symbol) in enumerate(text):
+        column = _column_numbers.get(symbol, width)
+        if column >= width or not state.is_legal_action(column):
+            raise Exception('Move ' + str(ply+1) + ' ("' + symbol + '") of position "' + text + '" is illegal')
+        state.make_move(ply % num_agents, column)
+    return state
+
+
+def format_moves(columns):
+    """
+    Returns the move sequence of the given list of columns.
+    """
+    return ''.join([COLUMN_SYMBOLS[column] for column in columns])
+
+
+def parse_moves_columns(text):
+    """
+    Returns the list of the columns of the given move sequence.
+    """
+    try:
+        return [_column_numbers[symbol] for symbol in text]
+    except KeyError as e:
+        raise Exception('Invalid column symbol ' + str(e) + ' in position "' + text + '"')
+
+
+def parse_board(text, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the state described by the given board string.
+    """
+    columns = text.split(BOARD_SEPARATOR)
+    (width, height) = layout
+    if len(columns) != width:
+        raise Exception('Position "' + text + '" has ' + str(len(columns)) + ' columns instead of ' + str(width))
+    state = upo.connect4.game.GameState(layout, num_agents, k)
+    for (x, column) in enumerate(columns):
+        if len(column) > height:
+            raise Exception('Column ' + str(x) + ' of position "' + text + '" has more than ' + str(height) + ' tokens')
+        for token in column:
+            if not token.isdigit() or int(token) >= num_agents:
+                raise Exception('Invalid token "' + token + '" in column ' + str(x) + ' of position "' + text + '"')
+            state.make_move(int(token), x)
+    _check_board(text, state)
+    return state
+
+
+def _check_board(text, state):
+    """
+    Raises an exception if the given state, parsed from the given board
+    string, cannot occur in a game (see the module documentation).
+    """
+    board = state.get_board()
+    data = board.data
+    n = state.num_agents()
+    ntokens = state.lines.num_tokens()
+    counts = [0]*n
+    for column in data:
+        for token in column:
+            counts[token] += 1
+    for agent in range(n):
+        expected = ntokens//n + (1 if agent < ntokens % n else 0)
+        if counts[agent] != expected:
+            raise Exception('Position "' + text + '" has ' + str(counts[agent]) + ' tokens of agent ' + str(agent) + ' instead of ' + str(expected))
+    # The last move is a top token of the last agent that completes all the
+    # complete lines
+    h = board.height()
+    last_agent = (ntokens-1) % n
+    last_cells = set([x*h+len(column)-1 for (x, column) in enumerate(data) if len(column) > 0 and column[-1] == last_agent])
+    table = upo.connect4.lines.get_line_table(board.width(), h, state.get_k())
+    for cells in table.lines:
+        tokens = set()
+        for cell in cells:
+            (x, row) = divmod(cell, h)
+            tokens.add(data[x][row] if row < len(data[x]) else None)
+        if len(tokens) == 1 and None not in tokens:
+            last_cells.intersection_update(cells)
+            if len(last_cells) == 0:
+                raise Exception('Position "' + text + '" has tokens placed after the end of the game')
+
+
+def format_board(game_state):
+    """
+    Returns the board string of the given state.
+    """
+    data = game_state.get_board().data
+    return BOARD_SEPARATOR.join([''.join([str(token) for token in column]) for column in data])
+
+
+def parse_position(text, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the state described by the given position string, in either form.
+    """
+    text = text.strip()
+    if get_form(text) == BOARD_FORM:
+        return parse_board(text, layout, num_agents, k)
+    return parse_moves(text, layout, num_agents, k)
+
+
+def get_agent_to_move(game_state):
+    """
+    Returns the index of the agent to move in the given state, according to
+    the notation (i.e., agent 0 moves first).
+    """
+    return game_state.lines.num_tokens() % game_state.num_agents()
+
+
+################################################################################
+
+
+def iter_position_strings(path, chunk_size=CHUNK_SIZE):
+    """
+    Reads the given file line by line and yields the lists of its position
+    strings (as bytes), chunk_size strings each (but the last list), so that
+    at most a chunk of strings is held in memory.
+    """
+    positions = []
+    with open(path, 'rb') as f:
+        for line in f:
+            fields = line.split(None, 1)
+            if len(fields) > 0 and not fields[0].startswith(b'#'):
+                positions.append(fields[0])
+                if len(positions) == chunk_size:
+                    yield positions
+                    positions = []
+    if len(positions) > 0:
+        yield positions
+
+
+def _to_char_array(numpy, strings):
+    """
+    Returns the (n,L) array of the characters of the given byte strings,
+    padded with zeros.
+    """
+    length = max(max([len(s) for s in strings]), 1)
+    return numpy.array(strings, dtype='S' + str(length)).view(numpy.uint8).reshape(len(strings), length)
+
+
+def _encode_planes(numpy, cells, agents, valid, num_agents):
+    """
+    Returns the (n,num_agents) bit planes of the given (n,L) arrays of cells
+    and agents (where valid).
+    """
+    bits = numpy.left_shift(numpy.uint64(1), numpy.where(valid, cells, 0).astype(numpy.uint64))
+    planes = numpy.zeros((cells.shape[0], num_agents), dtype=numpy.uint64)
+    for agent in range(num_agents):
+        planes[:, agent] = numpy.bitwise_or.reduce(numpy.where(valid & (agents == agent), bits, numpy.uint64(0)), axis=1)
+    return planes
+
+
+def _check_ended(numpy, strings, planes, last_cells, layout, num_agents, k):
+    """
+    Raises an exception if a position has complete lines that do not all go
+    through one of the cells of the last move that are set in last_cells.
+    """
+    (width, height) = layout
+    table = upo.connect4.lines.get_line_table(width, height, k)
+    if len(planes) == 0 or table.num_lines() == 0:
+        return
+    masks = numpy.array([sum([1 << cell for cell in cells]) for cells in table.lines], dtype=numpy.uint64)
+    complete = numpy.zeros((len(planes), len(masks)), dtype=bool)
+    for agent in range(num_agents):
+        complete |= (planes[:, agent, None] & masks) == masks
+    for (line, mask) in enumerate(masks):
+        last_cells = numpy.where(complete[:, line], last_cells & mask, last_cells)
+    bad = complete.any(axis=1) & (last_cells == 0)
+    if bad.any():
+        _raise_invalid(strings, bad, 'has tokens placed after the end of the game')
+
+
+def _raise_invalid(strings, bad, reason):
+    i = int(bad.nonzero()[0][0])
+    raise Exception('Position "' + strings[i].decode('ascii', 'replace') + '" ' + reason)
+
+
+def encode_moves(strings, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the (n,num_agents) bit planes of the given move sequences (byte
+    strings), along with the number of tokens of each position.
+    """
+    import numpy
+    (width, height) = layout
+    chars = _to_char_array(numpy, strings)
+    lut = numpy.full(256, -1, dtype=numpy.int16)
+    for (x, symbol) in enumerate(COLUMN_SYMBOLS[:width]):
+        lut[ord(symbol)] = x
+    columns = lut[chars]
+    valid = chars != 0
+    bad = (valid & (columns < 0)).any(axis=1)
+    if bad.any():
+        _raise_invalid(strings, bad, 'has an invalid column')
+    # Row of each move: number of previous moves in the same column
+    rows = numpy.zeros(columns.shape, dtype=numpy.int16)
+    heights = numpy.zeros((columns.shape[0], width), dtype=numpy.int16)
+    index = numpy.arange(columns.shape[0])
+    for ply in range(columns.shape[1]):
+        column = columns[:, ply]
+        moved = valid[:, ply]
+        safe_column = numpy.where(moved, column, 0)
+        rows[:, ply] = heights[index, safe_column]
+        heights[index, safe_column] += moved
+    bad = (valid & (rows >= height)).any(axis=1)
+    if bad.any():
+        _raise_invalid(strings, bad, 'has a move in a full column')
+    agents = numpy.arange(columns.shape[1]) % num_agents
+    agents = numpy.broadcast_to(agents, columns.shape)
+    cells = columns.astype(numpy.int64)*height+rows
+    planes = _encode_planes(numpy, cells, agents, valid, num_agents)
+    ply = valid.sum(axis=1)
+    # The game ends with the last move at the latest
+    last_moves = numpy.maximum(ply-1, 0)
+    last_cells = numpy.left_shift(numpy.uint64(1), numpy.maximum(cells[index, last_moves], 0).astype(numpy.uint64))
+    _check_ended(numpy, strings, planes, last_cells, layout, num_agents, k)
+    return (planes, ply)
+
+
+def encode_boards(strings, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the (n,num_agents) bit planes of the given board strings (byte
+    strings), along with the number of tokens of each position.
+    """
+    import numpy
+    (width, height) = layout
+    chars = _to_char_array(numpy, strings)
+    separators = chars == ord(BOARD_SEPARATOR)
+    tokens = (chars >= ord('0')) & (chars < ord('0')+num_agents)
+    bad = ((chars != 0) & ~separators & ~tokens).any(axis=1)
+    if bad.any():
+        _raise_invalid(strings, bad, 'has an invalid token')
+    bad = separators.sum(axis=1) != width-1
+    if bad.any():
+        _raise_invalid(strings, bad, 'does not have ' + str(width) + ' columns')
+    # Column of each token: number of previous separators; row of each token:
+    # distance from the last previous separator
+    columns = numpy.cumsum(separators, axis=1)
+    positions = numpy.arange(chars.shape[1])
+    last_separators = numpy.maximum.accumulate(numpy.where(separators, positions, -1), axis=1)
+    rows = positions-last_separators-1
+    bad = (tokens & (rows >= height)).any(axis=1)
+    if bad.any():
+        _raise_invalid(strings, bad, 'has a column with more than ' + str(height) + ' tokens')
+    agents = chars.astype(numpy.int64)-ord('0')
+    ply = tokens.sum(axis=1)
+    for agent in range(num_agents):
+        expected = ply//num_agents + (agent < ply % num_agents)
+        bad = (tokens & (agents == agent)).sum(axis=1) != expected
+        if bad.any():
+            _raise_invalid(strings, bad, 'does not have the number of tokens of agent ' + str(agent) + ' given by the turn order')
+    planes = _encode_planes(numpy, columns.astype(numpy.int64)*height+rows, agents, tokens, num_agents)
+    # The last move is a top token of the last agent
+    occupied = numpy.bitwise_or.reduce(planes, axis=1)
+    below_top_row = numpy.uint64(sum([((1 << (height-1))-1) << (x*height) for x in range(width)]))
+    top = occupied & ~((occupied >> numpy.uint64(1)) & below_top_row)
+    last_cells = top & planes[numpy.arange(len(planes)), (ply-1) % num_agents]
+    _check_ended(numpy, strings, planes, last_cells, layout, num_agents, k)
+    return (planes, ply)
+
+
+def encode_positions(strings, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns a dictionary with the arrays planes, to_move and ply (see
+    upo.connect4.dataset) of the given position strings (as bytes), in
+    either form.
+    """
+    import numpy
+    if layout[0]*layout[1] > 64:
+        raise Exception('Boards with more than 64 cells cannot be encoded')
+    if layout[0] > MAX_WIDTH or num_agents > MAX_AGENTS:
+        raise Exception('Positions with more than ' + str(MAX_WIDTH) + ' columns or ' + str(MAX_AGENTS) + ' agents cannot be written in this notation')
+    n = len(strings)
+    planes = numpy.zeros((n, num_agents), dtype=numpy.uint64)
+    ply = numpy.zeros(n, dtype=numpy.int16)
+    is_board = numpy.array([BOARD_SEPARATOR.encode('ascii') in s for s in strings], dtype=bool)
+    for (form, mask, encode) in [(BOARD_FORM, is_board, encode_boards), (MOVES_FORM, ~is_board, encode_moves)]:
+        indices = mask.nonzero()[0]
+        if len(indices) == 0:
+            continue
+        (form_planes, form_ply) = encode([strings[i] for i in indices], layout, num_agents, k)
+        planes[indices] = form_planes
+        ply[indices] = form_ply
+    return {'planes': planes,
+            'to_move': (ply % num_agents).astype(numpy.int8),
+            'ply': ply}
+
+
+def iter_position_chunks(path, layout, num_agents=2, chunk_size=CHUNK_SIZE, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Reads the positions of the given file and yields them in chunks of (at
+    most) chunk_size positions, each one as returned by encode_positions.
+    The file is read lazily, one chunk at a time.
+    """
+    for strings in iter_position_strings(path, chunk_size):
+        yield encode_positions(strings, layout, num_agents, k)
+
+
+def load_positions(path, layout, num_agents=2, chunk_size=CHUNK_SIZE, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Loads all the positions of the given file, returning a dictionary with the
+    arrays planes, to_move and ply (see upo.connect4.dataset) and layout.
+
+    The file is parsed a chunk of chunk_size positions at a time (see
+    iter_position_chunks), so only the encoded arrays of the chunks are held
+    in memory, and they are concatenated at the end.
+    Boards can have at most 64 cells.
+    """
+    import numpy
+    chunks = {'planes': [], 'to_move': [], 'ply': []}
+    for chunk in iter_position_chunks(path, layout, num_agents, chunk_size, k):
+        for name in chunks:
+            chunks[name].append(chunk[name])
+    if len(chunks['ply']) == 0:
+        data = encode_positions([], layout, num_agents, k)
+    else:
+        data = {}
+        for name in chunks:
+            data[name] = numpy.concatenate(chunks[name])
+    data['layout'] = numpy.array(layout, dtype=numpy.int32)
+    return data
+
+
+def make_state(planes, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns the state encoded by the given bit planes (see
+    upo.connect4.dataset).
+    """
+    (width, height) = layout
+    planes = [int(plane) for plane in planes]
+    state = upo.connect4.game.GameState(layout, num_agents, k)
+    for x in range(width):
+        for row in range(height):
+            bit = 1 << (x*height+row)
+            tokens = [agent for agent in range(num_agents) if planes[agent] & bit]
+            if len(tokens) == 0:
+                break
+            state.make_move(tokens[0], x)
+    return state
+
+
+def iter_positions(path, layout, num_agents=2, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Yields the state of each position of the given file, parsed one at a time
+    (without NumPy).
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.split(None, 1)
+            if len(fields) == 0 or fields[0].startswith('#'):
+                continue
+            yield parse_position(fields[0], layout, num_agents, k)
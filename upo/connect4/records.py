@@ -0,0 +1,457 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact binary game records.
+
+A record file starts with a header that fixes the board layout, the number of
+tokens in a row needed to win, the number of agents and the size of agent
+names; then follow the records, one per game,
+all of the same size, so that the i-th record is at a known offset.
+
+File header (little endian):
+    magic       4s  b'C4GR'
+    version     B
+    width       B
+    height      B
+    num_agents  B
+    name_size   H   number of bytes of each agent name
+    move_bits   B   number of bits of each move (3 for boards up to 8 columns)
+    k           B   number of tokens in a row needed to win
+    padding     4x
+    record_size I
+    padding     12x
+
+Record (little endian):
+    game        I   game number
+    result      B   RESULT_TIE, RESULT_WIN or RESULT_FORFEIT
+    winner      b   index of the winning agent (-1 if none)
+    forfeit     b   index of the forfeiting agent (-1 if none)
+    start_agent B   index of the agent who played the first move
+    num_moves   H   number of moves
+    num_opening H   number of opening moves (see upo.connect4.game.Game.play_opening)
+    agents      num_agents names, name_size bytes each (UTF-8, zero padded)
+    moves       columns packed move_bits bits each, first move in the lowest bits
+    timings     f per move (seconds, zero for opening moves)
+
+Agents move in turn starting from start_agent, so the agent of each move is
+implied by its position in the sequence.
+
+Files of version 1 have no k field (it is padding) and are read as k=4 games.
+"""
+
+
+import mmap
+import os
+import struct
+import upo.connect4.lines
+
+
+MAGIC = b'C4GR'
+VERSION = 2
+DEFAULT_NAME_SIZE = 32
+
+# Game results
+RESULT_TIE = 0
+RESULT_WIN = 1
+RESULT_FORFEIT = 2
+
+RESULT_NAMES = {RESULT_TIE: 'tie', RESULT_WIN: 'win', RESULT_FORFEIT: 'forfeit'}
+
+_HEADER = struct.Struct('<4sBBBBHBB4xI12x')
+_RECORD_HEAD = struct.Struct('<IBbbBHH')
+
+
+def get_move_bits(width):
+    """
+    Returns the number of bits needed to store a column of a board of the
+    given width.
+    """
+    return max(1, (width-1).bit_length())
+
+
+def pack_moves(columns, move_bits):
+    """
+    Packs the given columns in a single integer, move_bits bits each.
+    """
+    packed = 0
+    shift = 0
+    for column in columns:
+        packed |= column << shift
+        shift += move_bits
+    return packed
+
+
+def unpack_moves(packed, num_moves, move_bits):
+    """
+    Unpacks num_moves columns, move_bits bits each, from the given integer.
+    """
+    mask = (1 << move_bits)-1
+    columns = []
+    for i in range(num_moves):
+        columns.append(packed & mask)
+        packed >>= move_bits
+    return columns
+
+
+class GameRecord:
+    """
+    The record of a single game.
+    """
+
+    def __init__(self, layout, agents, start_agent=0, columns=None, timings=None, num_opening=0, result=RESULT_TIE, winner=None, forfeit=None, game=0, k=upo.connect4.lines.DEFAULT_K):
+        self.layout = tuple(layout)
+        self.k = k
+        self.agents = list(agents) # names
+        self.start_agent = start_agent
+        self.columns = list(columns) if columns is not None else []
+        self.timings = list(timings) if timings is not None else [0.0]*len(self.columns)
+        self.num_opening = num_opening
+        self.result = result
+        self.winner = winner
+        self.forfeit = forfeit
+        self.game = game
+
+    @staticmethod
+    def from_game(game, game_number=0, num_opening=0):
+        """
+        Makes the record of the given (possibly still in progress) game,
+        whose first num_opening moves were opening moves.
+        """
+        moves = game.get_moves()
+        result = RESULT_TIE
+        winner = None
+        forfeit = None
+        if game.get_forfeiting_agent() is not None:
+            result = RESULT_FORFEIT
+            forfeit = game.get_forfeiting_agent().get_index()
+        elif game.get_state().is_win():
+            result = RESULT_WIN
+            winner = game.get_state().get_winner()
+        return GameRecord(game.get_layout(),
+                          [agent.get_name() for agent in game.get_agents()],
+                          game.get_starting_agent().get_index(),
+                          [column for (agent, column, elapsed) in moves],
+                          [elapsed for (agent, column, elapsed) in moves],
+                          num_opening,
+                          result,
+                          winner,
+                          forfeit,
+                          game_number,
+                          game.get_k())
+
+    @staticmethod
+    def from_dict(record):
+        """
+        Makes a record from a game record in the JSON format of batch.py.
+        """
+        opening = record.get('opening', [])
+        moves = [move for move in record.get('moves', []) if move['column'] is not None]
+        forfeit = None
+        if record['result'] == 'forfeit':
+            forfeit = record['moves'][-1]['agent']
+        return GameRecord(record['layout'],
+                          record['agents'],
+                          0,
+                          list(opening) + [move['column'] for move in moves],
+                          [0.0]*len(opening) + [move.get('time', 0.0) for move in moves],
+                          len(opening),
+                          {'tie': RESULT_TIE, 'win': RESULT_WIN, 'forfeit': RESULT_FORFEIT}[record['result']],
+                          record.get('winner'),
+                          forfeit,
+                          record.get('game', 0),
+                          record.get('k', upo.connect4.lines.DEFAULT_K))
+
+    def to_dict(self):
+        """
+        Returns this record in the JSON format of batch.py (without search
+        statistics).
+        """
+        num_agents = len(self.agents)
+        moves = []
+        for (i, column) in enumerate(self.columns[self.num_opening:]):
+            ply = self.num_opening+i
+            moves.append({'agent': (self.start_agent+ply) % num_agents,
+                          'column': column,
+                          'time': self.timings[ply]})
+        if self.result == RESULT_FORFEIT:
+            moves.append({'agent': self.forfeit, 'column': None, 'time': 0.0})
+        return {'game': self.game,
+                'layout': list(self.layout),
+                'k': self.k,
+                'agents': list(self.agents),
+                'opening': self.columns[:self.num_opening],
+                'moves': moves,
+                'result': RESULT_NAMES[self.result],
+                'winner': self.winner}
+
+    def get_moves(self):
+        """
+        Returns the list of the (agent index, column) pairs of the game.
+        """
+        num_agents = len(self.agents)
+        return [((self.start_agent+ply) % num_agents, column) for (ply, column) in enumerate(self.columns)]
+
+
+################################################################################
+
+
+class RecordFormat:
+    """
+    The layout of the records of a file (see the module documentation).
+    """
+
+    def __init__(self, width, height, num_agents, name_size=DEFAULT_NAME_SIZE, k=upo.connect4.lines.DEFAULT_K):
+        self.w = width
+        self.h = height
+        self.k = k
+        self.nagents = num_agents
+        self.name_size = name_size
+        self.max_moves = width*height
+        self.move_bits = get_move_bits(width)
+        self.moves_size = (self.max_moves*self.move_bits+7)//8
+        self.names_offset = _RECORD_HEAD.size
+        self.moves_offset = self.names_offset + num_agents*name_size
+        self.timings_offset = self.moves_offset + self.moves_size
+        self.timings = struct.Struct('<' + str(self.max_moves) + 'f')
+        self.record_size = self.timings_offset + self.timings.size
+
+    def pack_header(self):
+        return _HEADER.pack(MAGIC, VERSION, self.w, self.h, self.nagents, self.name_size, self.move_bits, self.k, self.record_size)
+
+    @staticmethod
+    def unpack_header(data):
+        """
+        Returns the record format described by the given file header.
+        """
+        if len(data) < _HEADER.size:
+            raise Exception('Not a game record file (header is truncated)')
+        (magic, version, width, height, num_agents, name_size, move_bits, k, record_size) = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise Exception('Not a game record file (bad magic number)')
+        if version == 1:
+            k = upo.connect4.lines.DEFAULT_K
+        elif version != VERSION:
+            raise Exception('Unsupported game record version ' + str(version))
+        fmt = RecordFormat(width, height, num_agents, name_size, k)
+        if fmt.move_bits != move_bits or fmt.record_size != record_size:
+            raise Exception('Inconsistent game record header')
+        return fmt
+
+    def pack(self, record):
+        """
+        Returns the bytes of the given record.
+        """
+        if tuple(record.layout) != (self.w, self.h) or record.k != self.k or len(record.agents) != self.nagents:
+            raise Exception('Record does not match the layout, k and the number of agents of the file')
+        num_moves = len(record.columns)
+        data = bytearray(self.record_size)
+        _RECORD_HEAD.pack_into(data, 0,
+                               record.game,
+                               record.result,
+                               -1 if record.winner is None else record.winner,
+                               -1 if record.forfeit is None else record.forfeit,
+                               record.start_agent,
+                               num_moves,
+                               record.num_opening)
+        for (i, name) in enumerate(record.agents):
+            name = name.encode('utf-8')[:self.name_size]
+            offset = self.names_offset + i*self.name_size
+            data[offset:offset+len(name)] = name
+        packed = pack_moves(record.columns, self.move_bits)
+        data[self.moves_offset:self.timings_offset] = packed.to_bytes(self.moves_size, 'little')
+        timings = list(record.timings) + [0.0]*(self.max_moves-num_moves)
+        self.timings.pack_into(data, self.timings_offset, *timings)
+        return bytes(data)
+
+    def unpack(self, data, offset=0):
+        """
+        Returns the record whose bytes start at the given offset of the given
+        buffer.
+        """
+        (game, result, winner, forfeit, start_agent, num_moves, num_opening) = _RECORD_HEAD.unpack_from(data, offset)
+        agents = []
+        for i in range(self.nagents):
+            start = offset + self.names_offset + i*self.name_size
+            agents.append(bytes(data[start:start+self.name_size]).rstrip(b'\0').decode('utf-8', 'replace'))
+        columns = self.unpack_columns(data, offset, num_moves)
+        timings = list(self.timings.unpack_from(data, offset + self.timings_offset)[:num_moves])
+        return GameRecord((self.w, self.h),
+                          agents,
+                          start_agent,
+                          columns,
+                          timings,
+                          num_opening,
+                          result,
+                          None if winner < 0 else winner,
+                          None if forfeit < 0 else forfeit,
+                          game,
+                          self.k)
+
+    def unpack_columns(self, data, offset, num_moves):
+        start = offset + self.moves_offset
+        packed = int.from_bytes(data[start:start+self.moves_size], 'little')
+        return unpack_moves(packed, num_moves, self.move_bits)
+
+
+################################################################################
+
+
+class GameRecordWriter:
+    """
+    Appends game records to a file.
+
+    If the file already exists, its header must match the given layout, number
+    of agents, name size and k.
+    """
+
+    def __init__(self, path, width, height, num_agents, name_size=DEFAULT_NAME_SIZE, k=upo.connect4.lines.DEFAULT_K):
+        self.format = RecordFormat(width, height, num_agents, name_size, k)
+        self.out = open(path, 'ab')
+        if self.out.tell() == 0:
+            self.out.write(self.format.pack_header())
+            self.out.flush()
+            self.nrecords = 0
+        else:
+            with open(path, 'rb') as inp:
+                fmt = RecordFormat.unpack_header(inp.read(_HEADER.size))
+            if fmt.pack_header() != self.format.pack_header():
+                self.out.close()
+                raise Exception('Game record file "' + path + '" has a different layout, number of agents, name size or k')
+            size = self.out.tell()-_HEADER.size
+            if size % self.format.record_size != 0:
+                # A partially written record (e.g., after a crash): drops it
+                self.out.truncate(_HEADER.size + (size//self.format.record_size)*self.format.record_size)
+                self.out.seek(0, os.SEEK_END)
+            self.nrecords = size//self.format.record_size
+
+    def write(self, record):
+        """
+        Appends the given record.
+        """
+        self.out.write(self.format.pack(record))
+        self.nrecords += 1
+
+    def num_records(self):
+        """
+        Returns the number of records in the file.
+        """
+        return self.nrecords
+
+    def flush(self):
+        self.out.flush()
+
+    def close(self):
+        self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class GameRecordReader:
+    """
+    Reads game records from a file through a read-only memory map.
+
+    Records can be accessed by index; besides full records, the methods named
+    get_* read single fields of a record without decoding the rest of it.
+    """
+
+    def __init__(self, path):
+        self.inp = open(path, 'rb')
+        header = self.inp.read(_HEADER.size)
+        self.format = RecordFormat.unpack_header(header)
+        size = os.fstat(self.inp.fileno()).st_size
+        # A partially written last record is ignored
+        self.nrecords = (size-_HEADER.size)//self.format.record_size
+        self.data = None
+        if self.nrecords > 0:
+            self.data = mmap.mmap(self.inp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_layout(self):
+        return (self.format.w, self.format.h)
+
+    def get_k(self):
+        return self.format.k
+
+    def num_agents(self):
+        return self.format.nagents
+
+    def offset(self, index):
+        if index < 0:
+            index += self.nrecords
+        if index < 0 or index >= self.nrecords:
+            raise IndexError('Game record index out of range')
+        return _HEADER.size + index*self.format.record_size
+
+    def get_result(self, index):
+        """
+        Returns the (result, winner, forfeit) triple of the given record, where
+        winner and forfeit are -1 if missing.
+        """
+        return _RECORD_HEAD.unpack_from(self.data, self.offset(index))[1:4]
+
+    def get_num_moves(self, index):
+        return _RECORD_HEAD.unpack_from(self.data, self.offset(index))[5]
+
+    def get_columns(self, index):
+        """
+        Returns the columns played in the given record.
+        """
+        offset = self.offset(index)
+        return self.format.unpack_columns(self.data, offset, _RECORD_HEAD.unpack_from(self.data, offset)[5])
+
+    def iter_results(self):
+        """
+        Iterates over the (game, result, winner, forfeit, num_moves) tuples of
+        all the records.
+        """
+        unpack_from = _RECORD_HEAD.unpack_from
+        data = self.data
+        for offset in range(_HEADER.size, _HEADER.size + self.nrecords*self.format.record_size, self.format.record_size):
+            (game, result, winner, forfeit, start_agent, num_moves, num_opening) = unpack_from(data, offset)
+            yield (game, result, winner, forfeit, num_moves)
+
+    def __len__(self):
+        return self.nrecords
+
+    def __getitem__(self, index):
+        return self.format.unpack(self.data, self.offset(index))
+
+    def __iter__(self):
+        for index in range(self.nrecords):
+            yield self.format.unpack(self.data, _HEADER.size + index*self.format.record_size)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.inp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def is_record_file(path):
+    """
+    Tells if the given file is a game record file.
+    """
+    with open(path, 'rb') as inp:
+        return inp.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,220 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offscreen rendering of recorded games.
+
+Positions are drawn with the same code as PyGameUI, but on an offscreen
+surface and as fast as possible (i.e., without waiting for the frame rate), so
+that games can be saved as a sequence of PNG images or as an animated GIF.
+"""
+
+
+import multiprocessing
+import os
+import pygame
+import upo.connect4.agents
+import upo.connect4.game
+import upo.connect4.lines
+import upo.connect4.ui
+
+
+FORMATS = ['gif', 'png']
+DEFAULT_FORMAT = 'gif'
+DEFAULT_GEOMETRY = (640, 480)
+DEFAULT_FRAME_DURATION = 500 # milliseconds each frame of a GIF is shown
+DEFAULT_FINAL_DURATION = 3000 # milliseconds the final frame of a GIF is shown
+
+
+def get_record_moves(record):
+    """
+    Returns the list of (agent, column) pairs played in the given game record,
+    as written by batch.py (i.e., opening moves followed by the moves of the
+    agents).
+
+    Forfeited moves (i.e., moves without a column) are skipped.
+    """
+    num_agents = len(record['agents'])
+    moves = []
+    for (ply, column) in enumerate(record.get('opening', [])):
+        moves.append((ply % num_agents, column))
+    for move in record.get('moves', []):
+        if move['column'] is not None:
+            moves.append((move['agent'], move['column']))
+    return moves
+
+
+class ReplayRenderer:
+    """
+    Renders the positions of recorded games on an offscreen surface, by means
+    of the drawing methods of PyGameUI.
+
+    Games are played on a board of the given layout, where k tokens in a row
+    are needed to win.
+    """
+
+    def __init__(self, layout, agent_names, geometry=DEFAULT_GEOMETRY, k=upo.connect4.lines.DEFAULT_K):
+        if not pygame.get_init():
+            # No window is ever opened: SDL must not need a display
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            pygame.init()
+        agents = []
+        for (index, name) in enumerate(agent_names):
+            agent = upo.connect4.agents.Agent(index)
+            agent.set_name(name)
+            agents.append(agent)
+        self.game = upo.connect4.game.Game(agents, layout, k)
+        self.ui = upo.connect4.ui.PyGameUI(self.game, geometry)
+        self.ui.display = pygame.Surface(geometry)
+        self.ui.legend_font = pygame.font.SysFont(pygame.font.get_default_font(), 16)
+
+    def get_surface(self):
+        """
+        Returns the surface frames are drawn on.
+        """
+        return self.ui.display
+
+    def draw_frame(self, caption, last_column=None):
+        """
+        Draws the current position, highlighting the column of the last move
+        (if given) and the winning tokens (if any).
+        """
+        ui = self.ui
+        state = self.game.get_state()
+        ui.display.fill(ui.bg_color)
+        ui.draw_board()
+        ui.draw_legend()
+        if last_column is not None:
+            ui.highlight_column(ui.board_to_screen_coords((last_column, 0)))
+        if state.is_win():
+            ui.blink_winning_tokens(state.get_winner_positions())
+        font_col = (255-ui.bg_color[0],255-ui.bg_color[1],255-ui.bg_color[2])
+        font_surf = ui.legend_font.render(caption, True, font_col)
+        ui.display.blit(font_surf, (ui.board_rect.right-font_surf.get_rect().width, ui.board_rect.bottom+4))
+
+    def iter_frames(self, moves):
+        """
+        Draws the initial position and then the position after each of the
+        given (agent, column) moves, yielding the surface after each drawing.
+
+        Note, the same surface is yielded every time: copy it if it must
+        outlive the next iteration.
+        """
+        self.game.reset()
+        state = self.game.get_state()
+        num_moves = len(moves)
+        self.draw_frame('Move 0/' + str(num_moves))
+        yield self.ui.display
+        for (ply, (agent, column)) in enumerate(moves):
+            if not state.is_legal_action(column):
+                raise Exception('Move ' + str(ply+1) + ' (column ' + str(column) + ') is illegal')
+            state.make_move(agent, column)
+            caption = 'Move ' + str(ply+1) + '/' + str(num_moves) + ': ' + self.game.get_agent(agent).get_name() + ' -> ' + str(column)
+            self.draw_frame(caption, column)
+            yield self.ui.display
+
+    def save_png_sequence(self, moves, path_pattern):
+        """
+        Saves a PNG image per frame, named after the given pattern (e.g.,
+        'game/frame_%03d.png') formatted with the frame number, and returns
+        the list of saved files.
+        """
+        paths = []
+        for (i, surface) in enumerate(self.iter_frames(moves)):
+            path = path_pattern % i
+            pygame.image.save(surface, path)
+            paths.append(path)
+        return paths
+
+    def save_gif(self, moves, path, frame_duration=DEFAULT_FRAME_DURATION, final_duration=DEFAULT_FINAL_DURATION):
+        """
+        Saves all the frames as an animated GIF (needs the Pillow library).
+        """
+        import PIL.Image
+        size = self.ui.display.get_size()
+        images = []
+        for surface in self.iter_frames(moves):
+            images.append(PIL.Image.frombytes('RGB', size, pygame.image.tostring(surface, 'RGB')))
+        durations = [frame_duration]*(len(images)-1) + [final_duration]
+        images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0)
+        return [path]
+
+
+_renderers = {}
+
+
+def get_renderer(layout, agent_names, geometry=DEFAULT_GEOMETRY, k=upo.connect4.lines.DEFAULT_K):
+    """
+    Returns a (per-process) renderer for the given layout, agents, window
+    geometry and number of tokens in a row needed to win.
+    """
+    key = (tuple(layout), tuple(agent_names), tuple(geometry), k)
+    renderer = _renderers.get(key)
+    if renderer is None:
+        renderer = ReplayRenderer(layout, agent_names, geometry, k)
+        _renderers[key] = renderer
+    return renderer
+
+
+def render_record(task):
+    """
+    Renders the game record of the given task (a dictionary with keys
+    'record', 'output_dir', 'format', 'geometry', 'frame_duration' and
+    'final_duration') and returns the list of the saved files.
+
+    Files are named after the 'game' field of the record: game_<N>.gif or
+    game_<N>/frame_<M>.png.
+    """
+    record = task['record']
+    # Records written before k was stored are k=4 games
+    renderer = get_renderer(record['layout'], record['agents'], task['geometry'], record.get('k', upo.connect4.lines.DEFAULT_K))
+    moves = get_record_moves(record)
+    name = 'game_{0:06}'.format(record.get('game', 0))
+    if task['format'] == 'png':
+        game_dir = os.path.join(task['output_dir'], name)
+        if not os.path.isdir(game_dir):
+            os.makedirs(game_dir)
+        return renderer.save_png_sequence(moves, os.path.join(game_dir, 'frame_%03d.png'))
+    if task['format'] == 'gif':
+        return renderer.save_gif(moves, os.path.join(task['output_dir'], name + '.gif'), task['frame_duration'], task['final_duration'])
+    raise Exception('Unknown replay format "' + str(task['format']) + '"')
+
+
+def render_records(records, output_dir, format=DEFAULT_FORMAT, geometry=DEFAULT_GEOMETRY, jobs=1, frame_duration=DEFAULT_FRAME_DURATION, final_duration=DEFAULT_FINAL_DURATION):
+    """
+    Renders the given game records (see render_record), possibly in parallel
+    on the given number of processes, and yields the list of saved files of
+    each record as soon as it is ready (not necessarily in input order).
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    tasks = ({'record': record,
+              'output_dir': output_dir,
+              'format': format,
+              'geometry': tuple(geometry),
+              'frame_duration': frame_duration,
+              'final_duration': final_duration} for record in records)
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for paths in pool.imap_unordered(render_record, tasks):
+                yield paths
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            yield render_record(task)
@@ -0,0 +1,233 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import multiprocessing
+import upo.connect4.agents
+import upo.connect4.game
+
+
+def _worker_loop(agent, conn):
+    """
+    Main loop of a worker process.
+
+    Waits for game states on the given connection, asks the hosted agent for
+    an action and sends back a (action, num_expanded_states, error) triple.
+    A None request (or a closed connection) terminates the loop.
+    """
+    while True:
+        try:
+            game_state = conn.recv()
+        except (EOFError, OSError):
+            break
+        if game_state is None:
+            break
+        try:
+            action = agent.get_action(game_state)
+            num_states = None
+            if 'num_expanded_states' in dir(agent):
+                num_states = agent.num_expanded_states()
+            search_stats = None
+            if 'get_search_stats' in dir(agent):
+                search_stats = agent.get_search_stats()
+            conn.send((action, num_states, search_stats, None))
+        except Exception as e:
+            conn.send((None, None, None, Exception('Agent ' + str(agent.get_index()) + ' raised ' + repr(e))))
+
+
+class AgentWorker:
+    """
+    A worker process hosting a private copy of an agent.
+
+    The process is kept alive between moves, so that the spawn cost (and any
+    state built by the agent, like caches) is paid only once.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.process = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        """
+        Spawns the worker process.
+        """
+        (parent_conn, child_conn) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_loop, args=(self.agent, child_conn))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def stop(self):
+        """
+        Stops the worker process, killing it if it does not exit by itself.
+        """
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(0.1)
+        self.kill()
+
+    def kill(self):
+        """
+        Kills the worker process immediately.
+        """
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def recycle(self):
+        """
+        Kills the worker process and spawns a fresh one in its place.
+        """
+        self.kill()
+        self.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def get_action(self, game_state, timeout):
+        """
+        Asks the hosted agent for an action, waiting at most timeout seconds
+        (a timeout of zero means waiting forever).
+
+        Returns the triple (action, num_expanded_states, search_stats); raises
+        upo.connect4.game.MoveTimeout if the deadline expires.
+        """
+        if not self.is_alive():
+            self.recycle()
+        self.conn.send(game_state)
+        if not self.conn.poll(timeout if timeout > 0 else None):
+            self.recycle()
+            raise upo.connect4.game.MoveTimeout('Agent ' + str(self.agent.get_index()) + ' did not move within ' + str(timeout) + ' seconds')
+        try:
+            (action, num_states, search_stats, error) = self.conn.recv()
+        except EOFError:
+            # The worker died while thinking
+            self.recycle()
+            raise Exception('Worker process of agent ' + str(self.agent.get_index()) + ' died unexpectedly')
+        if error is not None:
+            raise error
+        return (action, num_states, search_stats)
+
+
+class AgentWorkerPool:
+    """
+    Keeps one warm worker process per sandboxed agent.
+    """
+    def __init__(self):
+        self.workers = {}
+
+    def get_worker(self, agent):
+        """
+        Returns the worker hosting the given agent, spawning it if needed.
+        """
+        key = id(agent)
+        worker = self.workers.get(key)
+        if worker is None or worker.agent is not agent:
+            worker = AgentWorker(agent)
+            self.workers[key] = worker
+        return worker
+
+    def release(self, agent):
+        """
+        Stops the worker hosting the given agent and forgets it, so that the
+        pool does not grow with the number of games played.
+        """
+        worker = self.workers.get(id(agent))
+        if worker is not None and worker.agent is agent:
+            del self.workers[id(agent)]
+            worker.stop()
+
+    def close(self):
+        """
+        Stops all the worker processes of this pool.
+        """
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+
+
+default_pool = AgentWorkerPool()
+
+
+################################################################################
+
+
+class SandboxedAgent(upo.connect4.agents.ComputerAgent):
+    """
+    A proxy agent that runs the get_action method of a computer agent in an
+    isolated worker process with a hard deadline.
+
+    When the deadline expires, the worker is recycled and
+    upo.connect4.game.MoveTimeout is raised, so that the game can record a
+    forfeit for the agent instead of waiting for it forever.
+    """
+    def __init__(self, agent, timeout, pool=default_pool):
+        upo.connect4.agents.ComputerAgent.__init__(self, agent.get_index())
+        if agent.is_interactive():
+            raise Exception('Interactive agents cannot be sandboxed')
+        if timeout < 0:
+            raise Exception('Timeout value must be a nonnegative number')
+        self.agent = agent
+        self.timeout = timeout
+        self.pool = pool
+        self.name = agent.get_name()
+        self.verbose = agent.get_verbosity_level()
+        self.num_expanded_nodes = 0
+        self.search_stats = None
+        self.worker = self.pool.get_worker(self.agent)
+
+    def get_agent(self):
+        """
+        Returns the sandboxed agent.
+        """
+        return self.agent
+
+    def get_timeout(self):
+        return self.timeout
+
+    def get_action(self, game_state):
+        (action, num_states, self.search_stats) = self.worker.get_action(game_state, self.timeout)
+        if num_states is not None:
+            self.num_expanded_nodes = num_states
+        return action
+
+    def num_expanded_states(self):
+        return self.num_expanded_nodes
+
+    def get_search_stats(self):
+        """
+        Returns the search statistics of the last move, as reported by the
+        sandboxed agent (None if the agent does not collect them).
+        """
+        return self.search_stats
+
+    def close(self):
+        """
+        Stops the worker process of this agent and removes it from the pool.
+        """
+        self.pool.release(self.agent)
+        self.worker.stop()
@@ -0,0 +1,467 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Endgame tables for two-agent games.
+
+An endgame table stores the exact value of every (non-final) position with
+at most max_empty empty cells that can be reached from a set of root
+positions (the empty board by default, which solves the whole game of small
+layouts such as 4x4 or 5x4); for larger layouts, root positions (e.g., late
+positions of recorded games) limit the table to the endgames that matter.
+Positions are solved forward by a negamax search over bitboards
+(see TablebaseSolver).
+
+Positions are identified by exact keys on W*(H+1) bits (hence, boards with
+W*(H+1) <= 64): column x takes bits x*(H+1) to x*(H+1)+H, where the tokens of
+the agent to move are set bits and a further set bit marks the first empty
+cell of the column.
+A position and its mirror image have the same value, so only the smaller of
+their keys is stored.
+As in upo.connect4.notation, the agent to move is the number of tokens modulo
+2 (i.e., agent 0 moves first).
+
+The value of a position is a signed byte for the agent to move: 0 for a tie,
+d > 0 if the agent wins with the d-th ply from now, and -d if it loses with
+the d-th ply from now (with best play of both agents).
+
+File layout (little endian):
+    magic       4s  b'C4TB'
+    version     B
+    width       B
+    height      B
+    k           B   number of tokens in a row needed to win
+    max_empty   B
+    padding     3x
+    count       Q   number of positions
+    padding     12x
+    keys        count Q, sorted
+    values      count b, in the order of keys
+
+Tables are read through a read-only memory map, and positions are found by
+binary search over the keys, so opening a table costs nothing and its pages
+are shared by all the processes that use it.
+
+Search agents probe the table attached to them with set_tablebase (see
+upo.connect4.agents.SearchComputerAgent): covered positions are not searched
+further and get the value of a win, a loss or a tie, on the scale of the
+evaluation function of the agent.
+"""
+
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+import upo.connect4.lines
+
+
+MAGIC = b'C4TB'
+VERSION = 1
+DEFAULT_K = upo.connect4.lines.DEFAULT_K
+
+_HEADER = struct.Struct('<4sBBBBB3xQ12x')
+
+
+class Bitboards:
+    """
+    Bitboard encoding of the positions of a WxH board (see the module
+    documentation).
+    """
+
+    def __init__(self, width, height, k=DEFAULT_K):
+        if width*(height+1) > 64:
+            raise Exception('Boards with more than 64 bits (' + str(width) + 'x' + str(height+1) + ') are not supported')
+        self.w = width
+        self.h = height
+        self.k = k
+        stride = height+1
+        self.stride = stride
+        self.column_chunk = (1 << stride)-1
+        # bottom_bits has the bottom cell of every column set
+        self.bottom_bits = sum([1 << (x*stride) for x in range(width)])
+        self.column_bottoms = [1 << (x*stride) for x in range(width)]
+        self.column_masks = [((1 << height)-1) << (x*stride) for x in range(width)]
+        self.column_tops = [1 << (x*stride+height-1) for x in range(width)]
+        # Shifts between adjacent cells: vertical, horizontal and diagonals
+        self.shifts = [1, stride, stride-1, stride+1]
+        # Central columns first, for earlier wins
+        center = (width-1)/2.0
+        self.column_order = sorted(range(width), key=lambda x: abs(x-center))
+
+    def make_key(self, current, mask):
+        """
+        Returns the key of the position where the agent to move has the given
+        tokens and the board holds the tokens of mask.
+        """
+        return current + mask + self.bottom_bits
+
+    def mirror_key(self, key):
+        """
+        Returns the key of the mirror image of the position with the given key.
+        """
+        stride = self.stride
+        chunk = self.column_chunk
+        last = self.w-1
+        mirror = 0
+        for x in range(self.w):
+            mirror |= ((key >> (x*stride)) & chunk) << ((last-x)*stride)
+        return mirror
+
+    def canonical_key(self, key):
+        """
+        Returns the key stored for the position with the given key.
+        """
+        mirror = self.mirror_key(key)
+        return mirror if mirror < key else key
+
+    def get_key(self, game_state):
+        """
+        Returns the (canonical) key of the given two-agent state.
+        """
+        data = game_state.get_board().data
+        mover = game_state.lines.num_tokens() % 2
+        stride = self.stride
+        key = 0
+        for x in range(self.w):
+            column = data[x]
+            bits = 1 << len(column)
+            for (row, token) in enumerate(column):
+                if token == mover:
+                    bits |= 1 << row
+            key |= bits << (x*stride)
+        return self.canonical_key(key)
+
+    def get_bitboards(self, game_state):
+        """
+        Returns the (current, mask) bitboards of the given two-agent state,
+        where current holds the tokens of the agent to move.
+        """
+        data = game_state.get_board().data
+        mover = game_state.lines.num_tokens() % 2
+        current = 0
+        mask = 0
+        for x in range(self.w):
+            for (row, token) in enumerate(data[x]):
+                bit = 1 << (x*self.stride+row)
+                mask |= bit
+                if token == mover:
+                    current |= bit
+        return (current, mask)
+
+    def is_win(self, tokens):
+        """
+        Tells if the given tokens of an agent make k in a row.
+        """
+        k = self.k
+        for shift in self.shifts:
+            m = tokens
+            for i in range(1, k):
+                m &= tokens >> (i*shift)
+                if not m:
+                    break
+            if m:
+                return True
+        return False
+
+
+def _rank(value):
+    """
+    Returns a number that orders values from the best one (for the agent to
+    move) to the worst one: quicker wins first, slower losses last.
+    """
+    if value > 0:
+        return 1000-value
+    if value < 0:
+        return -1000-value
+    return 0
+
+
+class TablebaseSolver:
+    """
+    Solves the positions with at most max_empty empty cells reachable from
+    given root positions.
+    """
+
+    def __init__(self, width, height, max_empty, k=DEFAULT_K):
+        self.bitboards = Bitboards(width, height, k)
+        self.max_empty = min(max_empty, width*height)
+        self.values = {}
+        self.num_solved_roots = 0
+
+    def add_root(self, game_state):
+        """
+        Solves the positions with at most max_empty empty cells reachable from
+        the given two-agent state.
+        """
+        if game_state.num_agents() != 2:
+            raise Exception('Endgame tables only support games with 2 agents')
+        board = game_state.get_board()
+        if (board.width(), board.height(), game_state.get_k()) != (self.bitboards.w, self.bitboards.h, self.bitboards.k):
+            raise Exception('Root position has not the layout of the table')
+        if game_state.is_final():
+            return
+        (current, mask) = self.bitboards.get_bitboards(game_state)
+        empty = board.width()*board.height()-game_state.lines.num_tokens()
+        if empty <= self.max_empty:
+            self.solve(current, mask, empty)
+        else:
+            for (current, mask) in self.iter_frontier(current, mask, empty):
+                self.solve(current, mask, self.max_empty)
+        self.num_solved_roots += 1
+
+    def iter_frontier(self, current, mask, empty):
+        """
+        Yields the (current, mask) bitboards of the distinct non-final
+        positions with max_empty empty cells that can be reached from the
+        given one.
+        """
+        bb = self.bitboards
+        frontier = {bb.canonical_key(bb.make_key(current, mask)): (current, mask)}
+        while empty > self.max_empty:
+            next_frontier = {}
+            for (current, mask) in frontier.values():
+                for x in bb.column_order:
+                    if mask & bb.column_tops[x]:
+                        continue
+                    move = (mask + bb.column_bottoms[x]) & bb.column_masks[x]
+                    if bb.is_win(current | move):
+                        continue
+                    (next_current, next_mask) = (mask ^ current, mask | move)
+                    next_frontier[bb.canonical_key(bb.make_key(next_current, next_mask))] = (next_current, next_mask)
+            frontier = next_frontier
+            empty -= 1
+        return frontier.values()
+
+    def solve(self, current, mask, empty):
+        """
+        Returns the value of the given non-final position for the agent to
+        move, storing the values of all the positions searched.
+        """
+        bb = self.bitboards
+        key = bb.canonical_key(bb.make_key(current, mask))
+        value = self.values.get(key)
+        if value is not None:
+            return value
+        best_value = None
+        best_rank = None
+        opponent = mask ^ current
+        for x in bb.column_order:
+            if mask & bb.column_tops[x]:
+                continue
+            move = (mask + bb.column_bottoms[x]) & bb.column_masks[x]
+            if bb.is_win(current | move):
+                value = 1
+            elif empty == 1:
+                value = 0
+            else:
+                successor_value = self.solve(opponent, mask | move, empty-1)
+                if successor_value > 0:
+                    value = -successor_value-1
+                elif successor_value < 0:
+                    value = -successor_value+1
+                else:
+                    value = 0
+            rank = _rank(value)
+            if best_rank is None or rank > best_rank:
+                best_rank = rank
+                best_value = value
+        self.values[key] = best_value
+        return best_value
+
+    def __len__(self):
+        return len(self.values)
+
+    def write(self, path):
+        """
+        Writes the table of the solved positions to the given file.
+        """
+        bb = self.bitboards
+        keys = array.array('Q', sorted(self.values))
+        values = array.array('b', [self.values[key] for key in keys])
+        if sys.byteorder != 'little':
+            keys.byteswap()
+        with open(path, 'wb') as out:
+            out.write(_HEADER.pack(MAGIC, VERSION, bb.w, bb.h, bb.k, self.max_empty, len(keys)))
+            out.write(keys.tobytes())
+            out.write(values.tobytes())
+
+
+def build_tablebase(path, layout, max_empty=None, roots=None, k=DEFAULT_K):
+    """
+    Solves the positions with at most max_empty empty cells (all the cells by
+    default) reachable from the given root states (the empty board by
+    default), writes their table to the given file and returns the number of
+    positions.
+    """
+    import upo.connect4.game
+    (width, height) = layout
+    if max_empty is None:
+        max_empty = width*height
+    if roots is None:
+        roots = [upo.connect4.game.GameState(layout, 2, k)]
+    solver = TablebaseSolver(width, height, max_empty, k)
+    for game_state in roots:
+        solver.add_root(game_state)
+    solver.write(path)
+    return len(solver)
+
+
+################################################################################
+
+
+class _KeyArray:
+    """
+    Sequence of the little-endian keys of a table, for big-endian machines.
+    """
+
+    def __init__(self, data, offset, count):
+        self.data = data
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return struct.unpack_from('<Q', self.data, self.offset+8*index)[0]
+
+
+class Tablebase:
+    """
+    Reads an endgame table from a file through a read-only memory map.
+
+    Tables can be pickled (e.g., along with the agents using them), in which
+    case the file is opened again when unpickled.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.inp = open(path, 'rb')
+        (magic, version, width, height, k, max_empty, count) = _HEADER.unpack(self.inp.read(_HEADER.size))
+        if magic != MAGIC:
+            raise Exception('File "' + str(path) + '" is not an endgame table')
+        if version != VERSION:
+            raise Exception('Unsupported endgame table version ' + str(version))
+        if os.fstat(self.inp.fileno()).st_size < _HEADER.size+9*count:
+            raise Exception('Endgame table "' + str(path) + '" is truncated')
+        self.bitboards = Bitboards(width, height, k)
+        self.max_empty = max_empty
+        self.count = count
+        self.data = None
+        self.keys = []
+        self.values_offset = _HEADER.size+8*count
+        if count > 0:
+            self.data = mmap.mmap(self.inp.fileno(), 0, access=mmap.ACCESS_READ)
+            if sys.byteorder == 'little':
+                self.keys = memoryview(self.data)[_HEADER.size:self.values_offset].cast('Q')
+            else:
+                self.keys = _KeyArray(self.data, _HEADER.size, count)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def get_layout(self):
+        return (self.bitboards.w, self.bitboards.h)
+
+    def get_k(self):
+        return self.bitboards.k
+
+    def get_max_empty(self):
+        return self.max_empty
+
+    def covers(self, game_state):
+        """
+        Tells if the given state has the layout, the number of agents and the
+        K of this table and at most max_empty empty cells (i.e., if it can be
+        found in this table).
+        """
+        board = game_state.get_board()
+        return (game_state.num_agents() == 2
+                and board.width() == self.bitboards.w
+                and board.height() == self.bitboards.h
+                and game_state.get_k() == self.bitboards.k
+                and board.width()*board.height()-game_state.lines.num_tokens() <= self.max_empty)
+
+    def probe(self, game_state):
+        """
+        Returns the value of the given state for the agent to move (see the
+        module documentation), or None if the state is not in this table.
+        """
+        if self.count == 0 or not self.covers(game_state):
+            return None
+        key = self.bitboards.get_key(game_state)
+        i = bisect.bisect_left(self.keys, key)
+        if i == self.count or self.keys[i] != key:
+            return None
+        return struct.unpack_from('b', self.data, self.values_offset+i)[0]
+
+    def get_value(self, game_state, agent_index, win_value=1.0):
+        """
+        Returns win_value, -win_value or 0 if the given agent wins, loses or
+        ties from the given state with best play, or None if the state is not
+        in this table.
+        """
+        value = self.probe(game_state)
+        if value is None:
+            return None
+        if value == 0:
+            return 0.0
+        if agent_index != game_state.lines.num_tokens() % 2:
+            value = -value
+        return win_value if value > 0 else -win_value
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if isinstance(self.keys, memoryview):
+            self.keys.release()
+        self.keys = []
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.inp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach_tablebase(agents, tablebase, win_value=None):
+    """
+    Lets the search agents among the given ones probe the given table, where
+    won positions are worth win_value (see
+    upo.connect4.agents.SearchComputerAgent.set_tablebase).
+    """
+    for agent in agents:
+        if hasattr(agent, 'set_tablebase'):
+            agent.set_tablebase(tablebase, win_value)
+
+
+def is_tablebase_file(path):
+    """
+    Tells if the given file is an endgame table.
+    """
+    with open(path, 'rb') as inp:
+        return inp.read(len(MAGIC)) == MAGIC
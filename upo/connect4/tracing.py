@@ -0,0 +1,193 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import struct
+
+
+# Node types
+MAX_NODE = 0
+MIN_NODE = 1
+CHANCE_NODE = 2
+
+NODE_NAMES = {MAX_NODE: 'MAX', MIN_NODE: 'MIN', CHANCE_NODE: 'EXP'}
+
+# Event types
+BEGIN_EVENT = 0
+ENTER_EVENT = 1
+CHILD_EVENT = 2
+CUTOFF_EVENT = 3
+PRUNE_EVENT = 4
+EXIT_EVENT = 5
+END_EVENT = 6
+
+EVENT_NAMES = {BEGIN_EVENT: 'begin', ENTER_EVENT: 'enter', CHILD_EVENT: 'child', CUTOFF_EVENT: 'cutoff', PRUNE_EVENT: 'prune', EXIT_EVENT: 'exit', END_EVENT: 'end'}
+
+
+class SearchTracer:
+    """
+    Base class for search tracers.
+
+    A search agent with an attached tracer notifies it of the structure of the
+    game tree it explores.
+    Depths are those used by the search agent; alpha and beta are None for
+    algorithms that do not use them; actions are None when undefined.
+
+    All methods do nothing; a derived class overrides the ones it needs.
+    """
+    def begin(self, agent_index, game_state):
+        """
+        Called when an agent starts searching from the given state.
+        """
+        pass
+
+    def enter(self, node_type, agent_index, depth, alpha, beta):
+        """
+        Called when a node is entered.
+        """
+        pass
+
+    def child(self, node_type, agent_index, depth, action):
+        """
+        Called before the successor resulting from the given action is
+        searched.
+        """
+        pass
+
+    def cutoff(self, node_type, agent_index, depth, value):
+        """
+        Called when a node is evaluated by the evaluation function, because
+        the depth limit has been reached or the node is terminal.
+        """
+        pass
+
+    def prune(self, node_type, agent_index, depth, value):
+        """
+        Called when the remaining successors of a node are pruned.
+        """
+        pass
+
+    def exit(self, node_type, agent_index, depth, value, action):
+        """
+        Called when a node is left with the given value and best action.
+        """
+        pass
+
+    def end(self, agent_index, value, action):
+        """
+        Called when an agent ends searching with the chosen action.
+        """
+        pass
+
+
+################################################################################
+
+
+class PrintTracer(SearchTracer):
+    """
+    A tracer that prints a human readable log of the search on the standard
+    output.
+    """
+    def enter(self, node_type, agent_index, depth, alpha, beta):
+        if alpha is None:
+            print('  '*(depth+1) + 'Making ' + NODE_NAMES[node_type] + '-DECISION(agent=',agent_index,',depth=',depth,') ')
+        else:
+            print('  '*(depth+1) + 'Making ' + NODE_NAMES[node_type] + '-DECISION(agent=',agent_index,',depth=',depth,',alpha=',alpha,',beta=',beta,') ')
+
+    def child(self, node_type, agent_index, depth, action):
+        print('  '*(depth+1) + NODE_NAMES[node_type] + '-DECISION Action: ', action)
+
+    def cutoff(self, node_type, agent_index, depth, value):
+        print('  '*(depth+1) + '[cutoff] Returning ' + NODE_NAMES[node_type] + '-VALUE(agent=',agent_index,',depth=',depth,'): ', value, ' (', None, ')')
+
+    def prune(self, node_type, agent_index, depth, value):
+        print('  '*(depth+1) + '[pruned] ' + NODE_NAMES[node_type] + '-VALUE(agent=',agent_index,',depth=',depth,'): ', value)
+
+    def exit(self, node_type, agent_index, depth, value, action):
+        print('  '*(depth+1) + 'Returning ' + NODE_NAMES[node_type] + '-VALUE(agent=',agent_index,',depth=',depth,'): ', value, ' (', action, ')')
+
+
+################################################################################
+
+
+class BinaryTreeTracer(SearchTracer):
+    """
+    A tracer that writes a compact binary dump of the searched game trees to
+    a file object opened in binary mode.
+
+    The dump starts with the MAGIC header followed by fixed-size records (see
+    RECORD) made of: event type, node type, depth, agent index, action (-1
+    when undefined), and two values whose meaning depends on the event:
+    - begin: the number of tokens on the board, unused;
+    - enter: alpha, beta (NaN when undefined);
+    - child, cutoff, prune, exit, end: the value (NaN when undefined), unused.
+    Use read_tree_dump to read it back.
+    """
+    MAGIC = b'C4TRACE1'
+    RECORD = struct.Struct('<BBBBbff')
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.fp.write(self.MAGIC)
+
+    def write(self, event, node_type, depth, agent_index, action, x, y):
+        self.fp.write(self.RECORD.pack(event, node_type, min(depth, 255), agent_index, -1 if action is None else action, float('nan') if x is None else x, float('nan') if y is None else y))
+
+    def begin(self, agent_index, game_state):
+        board = game_state.get_board()
+        num_tokens = sum(board.num_column_tokens(c) for c in range(board.width()))
+        self.write(BEGIN_EVENT, 0, 0, agent_index, None, num_tokens, None)
+
+    def enter(self, node_type, agent_index, depth, alpha, beta):
+        self.write(ENTER_EVENT, node_type, depth, agent_index, None, alpha, beta)
+
+    def child(self, node_type, agent_index, depth, action):
+        self.write(CHILD_EVENT, node_type, depth, agent_index, action, None, None)
+
+    def cutoff(self, node_type, agent_index, depth, value):
+        self.write(CUTOFF_EVENT, node_type, depth, agent_index, None, value, None)
+
+    def prune(self, node_type, agent_index, depth, value):
+        self.write(PRUNE_EVENT, node_type, depth, agent_index, None, value, None)
+
+    def exit(self, node_type, agent_index, depth, value, action):
+        self.write(EXIT_EVENT, node_type, depth, agent_index, action, value, None)
+
+    def end(self, agent_index, value, action):
+        self.write(END_EVENT, 0, 0, agent_index, action, value, None)
+        self.fp.flush()
+
+
+def read_tree_dump(fp):
+    """
+    Reads a dump written by BinaryTreeTracer from the given file object opened
+    in binary mode, and yields its events as dictionaries.
+    """
+    if fp.read(len(BinaryTreeTracer.MAGIC)) != BinaryTreeTracer.MAGIC:
+        raise Exception('Not a search tree dump')
+    size = BinaryTreeTracer.RECORD.size
+    while True:
+        data = fp.read(size)
+        if len(data) < size:
+            break
+        (event, node_type, depth, agent_index, action, x, y) = BinaryTreeTracer.RECORD.unpack(data)
+        yield {'event': EVENT_NAMES[event],
+               'node': NODE_NAMES.get(node_type) if event not in (BEGIN_EVENT, END_EVENT) else None,
+               'depth': depth,
+               'agent': agent_index,
+               'action': None if action < 0 else action,
+               'x': x,
+               'y': y}
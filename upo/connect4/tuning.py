@@ -0,0 +1,305 @@
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+#
+# Copyright 2015 Marco Guazzone (marco.guazzone@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tuning of the weights of a linear evaluation function on recorded positions
+(a.k.a. Texel tuning).
+
+The evaluation of a position for the agent to move is w.f, where f is the
+vector of the features returned by get_feature_names, that is the line and
+center features of upo.connect4.evalbuilder:
+- own_C (opp_C): number of lines holding exactly C tokens of the agent (of
+  one of the other agents) and no other token, for C=1,...,K-1 where K is the
+  number of tokens in a row needed to win,
+- own_center, opp_center: number of tokens of the agent and of the other
+  agents in the center column(s).
+Tuned weights are written as a specification of upo.connect4.evalbuilder
+(see write_evaluation_module), which evaluates the same features.
+
+Weights are fitted to game outcomes by minimizing the logistic loss between
+sigmoid(w.f) and the outcome of the game for the agent to move (1 for a win,
+0.5 for a tie and 0 for a loss), with (L2 regularized) mini-batch gradient
+descent.
+
+Positions come either from self-play shards (see upo.connect4.dataset) or from
+game record files (see upo.connect4.records), and use the bit-plane encoding
+of upo.connect4.dataset.
+"""
+
+
+import multiprocessing
+import upo.connect4.evalbuilder
+import upo.connect4.lines
+import upo.connect4.records
+
+
+CHUNK_SIZE = 65536 # positions processed at once by extract_features
+
+
+def get_feature_names(k=4):
+    """
+    Returns the names of the tuned features (see
+    upo.connect4.evalbuilder.get_feature_names) for lines of the given
+    length, in the order of the columns of extract_features.
+    """
+    return upo.connect4.evalbuilder.get_line_feature_names(k) + ['own_center', 'opp_center']
+
+
+def extract_features(planes, to_move, width, height, k=4):
+    """
+    Returns the (n, F) matrix of the features of the n positions encoded by
+    the given (n, N) bit planes, each one seen from the agent to move.
+    """
+    import numpy
+    table = upo.connect4.lines.get_line_table(width, height, k)
+    ncells = width*height
+    # incidence[c, l] is 1 if cell c belongs to line l
+    incidence = numpy.zeros((ncells, table.num_lines()), dtype=numpy.float32)
+    for (line, cells) in enumerate(table.lines):
+        incidence[list(cells), line] = 1
+    center = numpy.zeros(ncells, dtype=numpy.float32)
+    for x in upo.connect4.evalbuilder.get_center_columns(width):
+        center[x*height:(x+1)*height] = 1
+    shifts = numpy.arange(ncells, dtype=numpy.uint64)
+    planes = numpy.asarray(planes, dtype=numpy.uint64)
+    to_move = numpy.asarray(to_move, dtype=numpy.int64)
+    features = numpy.zeros((len(planes), 2*(k-1)+2), dtype=numpy.float32)
+    for start in range(0, len(planes), CHUNK_SIZE):
+        stop = min(start+CHUNK_SIZE, len(planes))
+        rows = numpy.arange(stop-start)
+        # cells[i, a, c] is 1 if agent a has a token in cell c in position i
+        cells = ((planes[start:stop, :, None] >> shifts) & numpy.uint64(1)).astype(numpy.float32)
+        own_cells = cells[rows, to_move[start:stop]]
+        opp_cells = cells.sum(axis=1)-own_cells
+        # counts[i, a, l] is the number of tokens of agent a in line l
+        counts = cells.dot(incidence)
+        # Tokens of a single agent: of the agent to move or of one opponent
+        single = counts == counts.sum(axis=1)[:, None, :]
+        for i in range(1, k):
+            lines = ((counts == i) & single).sum(axis=2)
+            own = lines[rows, to_move[start:stop]]
+            features[start:stop, i-1] = own
+            features[start:stop, k-1+i-1] = lines.sum(axis=1)-own
+        features[start:stop, 2*(k-1)] = own_cells.dot(center)
+        features[start:stop, 2*(k-1)+1] = opp_cells.dot(center)
+    return features
+
+
+def outcome_targets(outcome):
+    """
+    Maps outcomes (1, 0, -1) to target win probabilities (1, 0.5, 0).
+    """
+    import numpy
+    return (numpy.asarray(outcome, dtype=numpy.float32)+1)/2
+
+
+def load_record_positions(path, skip=0):
+    """
+    Returns the dictionary with the 'planes', 'to_move' and 'outcome' arrays
+    (see upo.connect4.dataset) of every position of the games stored in the
+    given record file, but the first skip positions of each game and the
+    final ones.
+    """
+    import numpy
+    planes = []
+    to_move = []
+    outcome = []
+    with upo.connect4.records.GameRecordReader(path) as reader:
+        (w, h) = reader.get_layout()
+        n = reader.num_agents()
+        for record in reader:
+            if record.result == upo.connect4.records.RESULT_FORFEIT:
+                continue
+            position = [0]*n
+            heights = [0]*w
+            for (ply, column) in enumerate(record.columns):
+                agent = (record.start_agent+ply) % n
+                if ply >= skip:
+                    planes.append(list(position))
+                    to_move.append(agent)
+                    if record.winner is None:
+                        outcome.append(0)
+                    else:
+                        outcome.append(1 if record.winner == agent else -1)
+                position[agent] |= 1 << (column*h+heights[column])
+                heights[column] += 1
+    return {'planes': numpy.array(planes, dtype=numpy.uint64).reshape((-1, n)),
+            'to_move': numpy.array(to_move, dtype=numpy.int8),
+            'outcome': numpy.array(outcome, dtype=numpy.int8),
+            'layout': numpy.array([w, h], dtype=numpy.int32),
+            'k': numpy.array(reader.get_k(), dtype=numpy.int32)}
+
+
+################################################################################
+
+
+def logistic_loss(weights, features, targets, l2=0.0):
+    """
+    Returns the mean logistic loss of the given weights on the given data,
+    plus the L2 penalty.
+    """
+    import numpy
+    z = features.dot(weights)
+    # log(1+exp(z)) - t*z, computed stably
+    loss = numpy.logaddexp(0, z) - targets*z
+    return float(loss.mean() + l2*weights.dot(weights))
+
+
+def logistic_gradient(weights, features, targets):
+    """
+    Returns the sum of the gradients of the logistic loss over the given data
+    (without the L2 penalty) and the number of samples.
+    """
+    import numpy
+    z = features.dot(weights)
+    p = 1/(1+numpy.exp(-z))
+    return (features.T.dot(p-targets), len(targets))
+
+
+# Data of the tuning worker processes (set by init_worker)
+_worker_features = None
+_worker_targets = None
+
+
+def init_worker(features, targets):
+    global _worker_features, _worker_targets
+    _worker_features = features
+    _worker_targets = targets
+
+
+def worker_gradient(task):
+    """
+    Returns the gradient of the logistic loss on the mini-batch (indices) of
+    the given (weights, indices) task, computed on the data of this worker.
+    """
+    (weights, indices) = task
+    return logistic_gradient(weights, _worker_features[indices], _worker_targets[indices])
+
+
+class TexelTuner:
+    """
+    Fits the weights of the features of the given positions to the given
+    targets by mini-batch gradient descent (with the Adam update rule).
+
+    With jobs greater than 1, every step splits the mini-batches among a pool
+    of processes (each one holding a copy of the data) and averages their
+    gradients.
+    """
+
+    def __init__(self, features, targets, batch_size=4096, learning_rate=0.01, l2=0.0, jobs=1, seed=5489):
+        import numpy
+        self.numpy = numpy
+        self.features = numpy.asarray(features, dtype=numpy.float64)
+        self.targets = numpy.asarray(targets, dtype=numpy.float64)
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.jobs = jobs
+        self.rng = numpy.random.RandomState(seed)
+        self.weights = numpy.zeros(self.features.shape[1])
+        self.pool = None
+        if jobs > 1:
+            self.pool = multiprocessing.Pool(jobs, init_worker, (self.features, self.targets))
+
+    def get_weights(self):
+        return self.weights
+
+    def loss(self):
+        return logistic_loss(self.weights, self.features, self.targets, self.l2)
+
+    def run_epoch(self, state):
+        """
+        Runs an epoch (one pass over the data), updating the weights and the
+        given optimizer state, and returns the loss at its end.
+        """
+        numpy = self.numpy
+        (m, v, t) = state
+        order = self.rng.permutation(len(self.targets))
+        # Mini-batches are processed by groups of jobs: one per worker
+        batches = [order[i:i+self.batch_size] for i in range(0, len(order), self.batch_size)]
+        group_size = max(self.jobs, 1)
+        beta1 = 0.9
+        beta2 = 0.999
+        for g in range(0, len(batches), group_size):
+            group = batches[g:g+group_size]
+            if self.pool is not None:
+                results = self.pool.map(worker_gradient, [(self.weights, indices) for indices in group])
+            else:
+                results = [logistic_gradient(self.weights, self.features[indices], self.targets[indices]) for indices in group]
+            grad = sum(r[0] for r in results)/sum(r[1] for r in results) + 2*self.l2*self.weights
+            t += 1
+            m = beta1*m + (1-beta1)*grad
+            v = beta2*v + (1-beta2)*grad*grad
+            m_hat = m/(1-beta1**t)
+            v_hat = v/(1-beta2**t)
+            self.weights = self.weights - self.learning_rate*m_hat/(numpy.sqrt(v_hat)+1e-8)
+        state[0] = m
+        state[1] = v
+        state[2] = t
+        return self.loss()
+
+    def fit(self, num_epochs, callback=None):
+        """
+        Runs the given number of epochs and returns the weights; callback (if
+        given) is called with the epoch number and the loss after each epoch.
+        """
+        numpy = self.numpy
+        state = [numpy.zeros_like(self.weights), numpy.zeros_like(self.weights), 0]
+        for epoch in range(num_epochs):
+            loss = self.run_epoch(state)
+            if callback is not None:
+                callback(epoch, loss)
+        return self.weights
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+################################################################################
+
+
+def make_spec(weights, k=4):
+    """
+    Returns the specification of upo.connect4.evalbuilder with the given
+    tuned weights.
+    """
+    return dict(zip(get_feature_names(k), [float(w) for w in weights]))
+
+
+def write_evaluation_module(path, weights, k=4, name='better_evaluation_function'):
+    """
+    Writes a Python module defining the evaluation function with the given
+    tuned weights (built by upo.connect4.evalbuilder, which squashes values as
+    tanh(w.f/2) = 2*sigmoid(w.f)-1), so that it can be used like the other
+    evaluation functions (e.g., through the "evalfunc" argument of custom
+    agents or by tournament.py).
+    """
+    spec = make_spec(weights, k)
+    with open(path, 'w') as out:
+        out.write('# Generated by tune.py: weights of the features\n')
+        out.write('\n')
+        out.write('import upo.connect4.evalbuilder\n')
+        out.write('\n')
+        out.write('\n')
+        out.write('SPEC = {\n')
+        for feature in get_feature_names(k):
+            out.write('    {0!r}: {1!r},\n'.format(feature, spec[feature]))
+        out.write('}\n')
+        out.write('\n')
+        out.write(name + ' = upo.connect4.evalbuilder.build_evaluation_function(SPEC, k=' + repr(k) + ')\n')
@@ -17,6 +17,8 @@
 
 import pygame
 import sys
+import threading
+import time
 import upo.connect4.game
 import upo.gfx_utils
 
@@ -35,6 +37,94 @@ class GameUI:
         upo.utils.raise_undefined_method()
 
 
+class MoveRunner:
+    """
+    Asks an agent for its action in a background thread, so that the caller
+    (e.g., a user interface) stays responsive while the agent thinks.
+
+    The agent works on a copy of the given game state.
+    """
+    def __init__(self, agent, game_state):
+        self.agent = agent
+        self.game_state = game_state.copy()
+        self.action = None
+        self.error = None
+        self.start_ts = None
+        self.elapsed_time = None
+        self.thread = None
+
+    def start(self):
+        """
+        Starts the background thread.
+        """
+        self.agent.stop_pondering()
+        if 'search_action' in dir(self.agent):
+            # Cleared here rather than by get_action in the background thread,
+            # so that a cancel following start is not lost
+            self.agent.stop_requested = False
+        self.start_ts = time.time()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            if 'search_action' in dir(self.agent):
+                self.action = self.agent.search_action(self.game_state)
+            else:
+                self.action = self.agent.get_action(self.game_state)
+        except Exception as e:
+            # E.g., MoveTimeout or SearchAborted: the caller decides what to do
+            self.error = e
+        self.elapsed_time = time.time()-self.start_ts
+
+    def is_done(self):
+        """
+        Tells if the agent has returned its action (or raised an exception).
+        """
+        return self.thread is not None and not self.thread.is_alive()
+
+    def get_action(self):
+        return self.action
+
+    def get_error(self):
+        """
+        Returns the exception raised by the agent, if any; otherwise, returns
+        None.
+        """
+        return self.error
+
+    def get_elapsed_time(self):
+        """
+        Returns the number of seconds the agent took to choose its action, or
+        the number of seconds elapsed so far if it is still thinking.
+        """
+        if self.elapsed_time is not None:
+            return self.elapsed_time
+        return time.time()-self.start_ts
+
+    def get_progress(self):
+        """
+        Returns the search progress of the agent (see
+        upo.connect4.agents.SearchComputerAgent.get_search_progress), or None
+        if the agent does not report it.
+        """
+        if 'get_search_progress' in dir(self.agent):
+            return self.agent.get_search_progress()
+        return None
+
+    def cancel(self, timeout=1.0):
+        """
+        Asks the agent to stop thinking, if it supports this, and waits at most
+        the given number of seconds for the background thread to finish.
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        if 'request_stop' in dir(self.agent):
+            self.agent.request_stop()
+        self.thread.join(timeout)
+
+
 class PyGameUI(GameUI):
     """
     User interface based on the PyGame library.
@@ -45,12 +135,21 @@ class PyGameUI(GameUI):
     DEFAULT_GEOMETRY = (800, 600) # window geometry (width, height)
     DEFAULT_LAYOUT = (7, 6) # board (width, height)
     DEFAULT_TIMEOUT = 0 # maximum number of second before a timeout is triggered for an agent
-
-    def __init__(self, game, geometry = DEFAULT_GEOMETRY, fps = DEFAULT_FPS, timeout = DEFAULT_TIMEOUT):
+    # Rendering modes:
+    # - 'full': redraws the whole window at every frame
+    # - 'dirty': redraws only the rectangles that changed since the previous
+    #   frame, using pre-rendered surfaces, and sleeps while nothing can change
+    RENDER_MODES = ['full', 'dirty']
+    DEFAULT_RENDER_MODE = 'full'
+
+    def __init__(self, game, geometry = DEFAULT_GEOMETRY, fps = DEFAULT_FPS, timeout = DEFAULT_TIMEOUT, render_mode = DEFAULT_RENDER_MODE):
         GameUI.__init__(self, game)
+        if render_mode not in self.RENDER_MODES:
+            raise Exception('Unknown rendering mode "' + str(render_mode) + '"')
         self.win_geometry = geometry
         self.fps = fps
         self.timeout = timeout
+        self.render_mode = render_mode
         self.display = None
         self.timer_font = None
         self.legend_font = None
@@ -78,6 +177,15 @@ class PyGameUI(GameUI):
         #self.board_rect = pygame.Rect(self.xoffs, self.yoffs+self.tile_size, self.board_dim, self.board_dim)
         self.board_rect = pygame.Rect(self.xoffs, self.yoffs, self.board_dim[0], self.board_dim[1])
         self.token_radius = self.tile_size//2 - 1
+        # Cached surfaces and bookkeeping of the 'dirty' rendering mode (see init_surfaces)
+        self.background = None
+        self.scene = None
+        self.scene_board = None
+        self.scene_board_version = None
+        self.scene_tokens = {}
+        self.token_surfs = []
+        self.overlay_rects = []
+        self.overlay_state = None
         #print('Window: ', self.win_geometry, ', Board: ', self.board_dim, ', Tile: ', self.tile_size, ', Offset: ', (self.xoffs, self.yoffs))
 
     def get_geometry(self):
@@ -97,13 +205,7 @@ class PyGameUI(GameUI):
 
         fps_clock = pygame.time.Clock();
 
-        self.display = pygame.display.set_mode(self.win_geometry)
-        pygame.display.set_caption('Connect 4')
-
-        # Preloads font to avoid delays during the execution
-        self.legend_font = pygame.font.SysFont(pygame.font.get_default_font(), 16)
-        if self.timeout > 0:
-            self.timer_font = pygame.font.Font('resources/timer_font.ttf', 24)
+        self.init_display()
 
         winning_cells = []
         game_over = False
@@ -114,6 +216,7 @@ class PyGameUI(GameUI):
         column_highlight_pos = ()
         timer_count = 0
         timer_value = 0
+        move_runner = None
         skip_logic = True
         while True:
             # This is the game loop
@@ -129,8 +232,13 @@ class PyGameUI(GameUI):
                     # Checks for a quit event
                     if (event.type == pygame.QUIT
                         or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE)):
+                        if move_runner is not None:
+                            move_runner.cancel()
+                        self.game.stop_pondering()
                         pygame.quit()
                         return
+                    if event.type == pygame.VIDEOEXPOSE and self.render_mode == 'dirty':
+                        self.draw_all()
                     # In case of interactive agent, there are more interesting things to check
                     if wait_interaction:
                         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -149,77 +257,231 @@ class PyGameUI(GameUI):
                             else:
                                 column_highlight = False
                 # Plays the game
-                move_timer_count = 0
-                timeout_agent = self.game.get_current_agent() # Save current agent to be used in case of timeout. This is needed since for computer agent a timeout can be discovered only after the move has been done; but at this time, the current agent is changed to the next agent
-                if not wait_interaction:
-                    if not game_over:
-                        agent_move_clock = None
-                        if not self.game.get_current_agent().is_interactive():
-                            agent_move_clock = pygame.time.Clock()
-                        self.game.make_move()
-                        if agent_move_clock:
-                            agent_move_clock.tick()
-                            move_timer_count = agent_move_clock.get_rawtime()//1000
-                        game_over = self.game.is_over()
-                        if game_over:
-                            if self.game.get_state().is_win():
-                                winning_cells = self.game.get_state().get_winner_positions()
-                                winning_agent = self.game.get_agent(self.game.get_state().get_winner())
-                                print("The winner is: " + winning_agent.get_name() + "!")
-                            elif self.game.get_state().is_tie():
-                                print("Tie!")
-                        if self.timeout > 0:
-                            timer_count = 0
+                move_done = False
+                if not game_over:
+                    if self.game.get_current_agent().is_interactive():
+                        if not wait_interaction:
+                            self.game.make_move()
+                            move_done = True
+                    elif move_runner is None:
+                        # Computer agents think in background, so that the
+                        # window keeps being drawn meanwhile
+                        move_runner = MoveRunner(self.game.get_current_agent(), self.game.get_state())
+                        move_runner.start()
+                    elif move_runner.is_done():
+                        if isinstance(move_runner.get_error(), upo.connect4.game.MoveTimeout):
+                            self.game.forfeit(move_runner.get_elapsed_time())
+                        elif move_runner.get_error() is not None:
+                            raise move_runner.get_error()
+                        else:
+                            self.game.commit_move(move_runner.get_action(), move_runner.get_elapsed_time())
+                        move_runner = None
+                        move_done = True
+                if move_done:
+                    game_over = self.game.is_over()
+                    if game_over:
+                        if self.game.get_forfeiting_agent() is not None:
+                            print("Timed out! " + self.game.get_forfeiting_agent().get_name() + " loses!")
+                        elif self.game.get_state().is_win():
+                            winning_cells = self.game.get_state().get_winner_positions()
+                            winning_agent = self.game.get_agent(self.game.get_state().get_winner())
+                            print("The winner is: " + winning_agent.get_name() + "!")
+                        elif self.game.get_state().is_tie():
+                            print("Tie!")
+                    if self.timeout > 0:
+                        timer_count = 0
                 # Updates the timer
                 if self.timeout > 0 and not game_over:
                     # Computes total seconds
-                    timer_value = self.timeout - timer_count//self.fps - move_timer_count
+                    timer_value = self.timeout - timer_count//self.fps
                     if timer_value < 0:
                         timer_value = 0
                     if timer_value == 0:
+                        if move_runner is not None:
+                            move_runner.cancel()
+                            move_runner = None
+                        self.game.forfeit(self.timeout)
                         game_over = True
-                        #print("Timed out! " + self.game.get_current_agent().get_name() + " loses!")
-                        print("Timed out! " + timeout_agent.get_name() + " loses!")
+                        print("Timed out! " + self.game.get_forfeiting_agent().get_name() + " loses!")
                     timer_count += 1
  
             ## BEGIN DRAWING
 
-            # Fills the display with the background color
-            self.display.fill(self.bg_color)
-
-            # Draws the game board
-            self.draw_board()
-
-            # Draws agents' legend
-            self.draw_legend()
-
-            # Highlights the board column under the mouse
-            if not game_over and column_highlight:
-                self.highlight_column(column_highlight_pos)
-
             # Blinks winning tokens
+            show_winning_cells = False
             if len(winning_cells) > 0:
                 if winning_blink_count/self.fps >= WIN_BLINK_DURATION:
                     winning_blink = not winning_blink
                     winning_blink_count = 0
-                if winning_blink:
-                    self.blink_winning_tokens(winning_cells)
+                show_winning_cells = winning_blink
                 winning_blink_count += 1
 
-            # Displays a countdown timer
-            if self.timeout > 0:
-                self.draw_timer(timer_value)
+            if self.render_mode == 'dirty':
+                self.draw_dirty(column_highlight_pos if not game_over and column_highlight else None,
+                                winning_cells if show_winning_cells else [],
+                                timer_value,
+                                move_runner)
+            else:
+                # Fills the display with the background color
+                self.display.fill(self.bg_color)
+
+                # Draws the game board
+                self.draw_board()
+
+                # Draws agents' legend
+                self.draw_legend()
+
+                # Highlights the board column under the mouse
+                if not game_over and column_highlight:
+                    self.highlight_column(column_highlight_pos)
+
+                if show_winning_cells:
+                    self.blink_winning_tokens(winning_cells)
+
+                # Displays a countdown timer
+                if self.timeout > 0:
+                    self.draw_timer(timer_value)
+
+                # Displays what the computer agent is doing
+                if move_runner is not None:
+                    self.draw_search_progress(move_runner)
 
-            pygame.display.flip();
+                pygame.display.flip();
 
             ## END DRAWING
 
+            if (self.render_mode == 'dirty'
+                and move_runner is None
+                and len(winning_cells) == 0
+                and (game_over or (self.timeout <= 0 and self.game.get_current_agent().is_interactive()))):
+                # Nothing can change until the next event arrives: sleeps
+                # until then (the event is put back for the next iteration)
+                pygame.event.post(pygame.event.wait())
             fps_clock.tick(self.fps)
 
-    def draw_board(self):
+    def init_display(self):
         """
-        Draws the game board.
+        Opens the window and loads the resources used for drawing (pygame must
+        have been initialized).
+        """
+        self.display = pygame.display.set_mode(self.win_geometry)
+        pygame.display.set_caption('Connect 4')
+
+        # Preloads font to avoid delays during the execution
+        self.legend_font = pygame.font.SysFont(pygame.font.get_default_font(), 16)
+        if self.timeout > 0:
+            self.timer_font = pygame.font.Font('resources/timer_font.ttf', 24)
+
+        if self.render_mode == 'dirty':
+            self.init_surfaces()
+            self.draw_all()
+
+    def init_surfaces(self):
+        """
+        Pre-renders the surfaces used by the 'dirty' rendering mode, that is
+        the background (with the empty board and the agents' legend) and the
+        tokens of the agents.
+        """
+        self.background = pygame.Surface(self.win_geometry)
+        self.background.fill(self.bg_color)
+        self.draw_board_grid(self.background)
+        self.draw_legend(self.background)
+        self.token_surfs = []
+        for color in self.player_colors:
+            # Tokens are drawn one pixel off the tile origin (see draw_token)
+            surf = pygame.Surface((self.tile_size+2, self.tile_size+2), pygame.SRCALPHA)
+            pygame.draw.circle(surf, color, (self.tile_size//2+1, self.tile_size//2+1), self.token_radius)
+            self.token_surfs.append(surf)
+        # The scene is the background with the tokens, without any overlay
+        # (highlighted column, timer, ...)
+        self.scene = self.background.copy()
+        self.scene_board = None
+        self.scene_board_version = None
+        self.scene_tokens = {}
+        self.update_scene()
+
+    def update_scene(self):
+        """
+        Brings the tokens of the scene up to date with the game board and
+        returns the list of the rectangles that changed.
+        """
+        game_board = self.game.get_state().get_board()
+        if game_board is self.scene_board and game_board.version == self.scene_board_version:
+            return []
+        rects = []
+        for c in range(game_board.width()):
+            for r in range(game_board.height()):
+                token = None
+                if game_board.has_token(c, r):
+                    token = game_board.get_token(c, r)
+                if self.scene_tokens.get((c, r)) != token:
+                    (x, y) = self.board_to_screen_coords((c, r))
+                    rect = pygame.Rect(x, y, self.tile_size+2, self.tile_size+2)
+                    self.scene.blit(self.background, rect, rect)
+                    if token is not None:
+                        self.scene.blit(self.token_surfs[token], rect)
+                    self.scene_tokens[(c, r)] = token
+                    rects.append(rect)
+        self.scene_board = game_board
+        self.scene_board_version = game_board.version
+        return rects
+
+    def draw_all(self):
+        """
+        Redraws the whole window from the scene ('dirty' rendering mode);
+        overlays are redrawn by the next call to draw_dirty.
+        """
+        self.update_scene()
+        self.display.blit(self.scene, (0, 0))
+        self.overlay_rects = []
+        self.overlay_state = None
+        pygame.display.flip()
+
+    def draw_dirty(self, column_highlight_pos, winning_cells, timer_value, move_runner):
         """
+        Redraws only the parts of the window that changed since the previous
+        call ('dirty' rendering mode), and returns the list of the rectangles
+        that have been updated (empty if nothing changed).
+
+        Overlays (i.e., the highlighted column, the blinking winning tokens,
+        the timer and the search progress) are drawn on top of the scene and
+        are all redrawn whenever any of them or the board changes.
+        """
+        rects = self.update_scene()
+        progress_text = None
+        if move_runner is not None:
+            progress_text = self.get_search_progress_text(move_runner)
+        column_highlight = None
+        if column_highlight_pos is not None:
+            column_highlight = self.screen_to_board_coords(column_highlight_pos)[0]
+        overlay_state = (column_highlight, tuple(winning_cells), timer_value, progress_text)
+        if len(rects) == 0 and overlay_state == self.overlay_state:
+            return []
+        # Removes the previous overlays
+        rects.extend(self.overlay_rects)
+        for rect in rects:
+            self.display.blit(self.scene, rect, rect)
+        # Draws the current ones
+        self.overlay_rects = []
+        if column_highlight_pos is not None:
+            self.overlay_rects.append(self.highlight_column(column_highlight_pos))
+        if len(winning_cells) > 0:
+            self.overlay_rects.extend(self.blink_winning_tokens(winning_cells))
+        if self.timeout > 0:
+            self.overlay_rects.append(self.draw_timer(timer_value))
+        if progress_text is not None:
+            self.overlay_rects.append(self.draw_search_progress(move_runner, progress_text))
+        self.overlay_state = overlay_state
+        rects.extend(self.overlay_rects)
+        pygame.display.update(rects)
+        return rects
+
+    def draw_board_grid(self, surface=None):
+        """
+        Draws the game board without tokens.
+        """
+        if surface is None:
+            surface = self.display
         game_board = self.game.get_state().get_board()
         board_rows = game_board.height()
         board_cols = game_board.width()
@@ -228,20 +490,30 @@ class PyGameUI(GameUI):
         ## draw top row 
         #pygame.draw.rect(self.display, self.top_row_color, [self.xoffs, self.yoffs, self.board_dim[0], self.tile_size])
         # draw board
-        pygame.draw.rect(self.display, self.board_color, self.board_rect)
+        pygame.draw.rect(surface, self.board_color, self.board_rect)
 
         # draw grid over board
         for r in range(1, board_rows):
             y = self.board_rect.top + r*self.tile_size
             start_pos = [self.board_rect.left, y]
             stop_pos = [self.board_rect.right, y]
-            pygame.draw.line(self.display, self.fg_color, start_pos, stop_pos, 2)
+            pygame.draw.line(surface, self.fg_color, start_pos, stop_pos, 2)
         for c in range(1, board_cols):
             x = self.board_rect.left + c*self.tile_size
             #start_pos = [x, self.yoffs]
             start_pos = [x, self.board_rect.top]
             stop_pos = [x, self.board_rect.bottom]
-            pygame.draw.line(self.display, self.fg_color, start_pos, stop_pos, 2)
+            pygame.draw.line(surface, self.fg_color, start_pos, stop_pos, 2)
+
+    def draw_board(self):
+        """
+        Draws the game board.
+        """
+        game_board = self.game.get_state().get_board()
+        board_rows = game_board.height()
+        board_cols = game_board.width()
+
+        self.draw_board_grid()
 
         ## draw tokens
         for c in range(board_cols):
@@ -261,17 +533,20 @@ class PyGameUI(GameUI):
 
     def highlight_column(self, pos):
         """
-        Highlight the board column corresponding to the given position.
+        Highlight the board column corresponding to the given position, and
+        returns the rectangle that has been drawn.
         """
         (c, r) = self.screen_to_board_coords(pos)
         (x, y) = self.board_to_screen_coords((c, r))
-        pygame.draw.rect(self.display, self.column_highlight_color, (x-1, self.board_rect.top-2, self.tile_size+2, self.board_rect.height+2), 2)
+        return pygame.draw.rect(self.display, self.column_highlight_color, (x-1, self.board_rect.top-2, self.tile_size+2, self.board_rect.height+2), 2)
 
     def blink_winning_tokens(self, winning_cells):
         """
-        Highlights winning tokens.
+        Highlights winning tokens, and returns the list of the rectangles that
+        have been drawn.
         """
         game_board = self.game.get_state().get_board()
+        rects = []
         for (x,y) in winning_cells:
             if game_board.has_token(x, y):
                 token = game_board.get_token(x, y)
@@ -282,12 +557,15 @@ class PyGameUI(GameUI):
                 #hcol[2] = 255-col[2]
                 xc = self.board_rect.left + x*self.tile_size + self.tile_size//2 + 1
                 yc = self.board_rect.top + y*self.tile_size + self.tile_size//2 + 1
-                pygame.draw.circle(self.display, hcol, (xc, yc), self.token_radius, 2)
+                rects.append(pygame.draw.circle(self.display, hcol, (xc, yc), self.token_radius, 2))
+        return rects
 
-    def draw_legend(self):
+    def draw_legend(self, surface=None):
         """
         Draws the agents' legend.
         """
+        if surface is None:
+            surface = self.display
         #font_col = (255-x for x in self.bg_color)
         font_col = (255-self.bg_color[0],255-self.bg_color[1],255-self.bg_color[2])
         radius = int(self.token_radius*0.20)
@@ -295,9 +573,9 @@ class PyGameUI(GameUI):
             idx = agent.get_index()
             xc = self.board_rect.right + 10
             yc = self.board_rect.top + radius + idx*radius*4
-            pygame.draw.circle(self.display, self.player_colors[idx], (xc, yc), radius)
+            pygame.draw.circle(surface, self.player_colors[idx], (xc, yc), radius)
             font_surf = self.legend_font.render(agent.get_name(), True, font_col)
-            self.display.blit(font_surf, (xc+6, yc-6))
+            surface.blit(font_surf, (xc+6, yc-6))
 
     def draw_timer(self, timer_value):
         # Gets total minutes and seconds
@@ -307,7 +585,31 @@ class PyGameUI(GameUI):
         font_timer = self.timer_font.render(timer_str, True, font_col)
         #rect = font_timer.get_rect()
         #self.display.blit(font_timer, (self.board_rect.left, self.board_rect.bottom+(self.win_geometry[1]-self.board_rect.bottom)//2))
-        self.display.blit(font_timer, (self.board_rect.left, self.board_rect.bottom+font_timer.get_rect().height//2))
+        return self.display.blit(font_timer, (self.board_rect.left, self.board_rect.bottom+font_timer.get_rect().height//2))
+
+    def get_search_progress_text(self, move_runner):
+        """
+        Returns the text describing the progress of the agent that is thinking.
+        """
+        progress = move_runner.get_progress()
+        if progress is not None:
+            text = 'Thinking... depth {}, {} nodes ({:.0f} nodes/s)'.format(progress['depth'], progress['nodes'], progress['nodes_per_sec'])
+            if progress['best_action'] is not None:
+                text += ', best move so far: {}'.format(progress['best_action'])
+        else:
+            text = 'Thinking... {:.1f}s'.format(move_runner.get_elapsed_time())
+        return text
+
+    def draw_search_progress(self, move_runner, text=None):
+        """
+        Draws the progress of the agent that is thinking, and returns the
+        rectangle that has been drawn.
+        """
+        if text is None:
+            text = self.get_search_progress_text(move_runner)
+        font_col = (255-self.bg_color[0],255-self.bg_color[1],255-self.bg_color[2])
+        font_surf = self.legend_font.render(text, True, font_col)
+        return self.display.blit(font_surf, (self.board_rect.right-font_surf.get_rect().width, self.board_rect.bottom+4))
 
     def board_to_screen_coords(self, pos):
         """
@@ -15,6 +15,9 @@
 # limitations under the License.
 
 
+import array
+
+
 class Stack:
     """
     A LIFO container data structure.
@@ -32,46 +35,169 @@ class Stack:
         return self.data[-1]
 
 
-class Matrix:
+def _cell_hash(index, value):
+    """
+    Returns the contribution of the given (cell index, value) pair to the
+    digest of a Grid or Matrix (empty cells, i.e. zeros, do not contribute).
+    """
+    if value == 0:
+        return 0
+    return hash((index, value))
+
+
+class _LineView:
+    """
+    A light view over a line (a column of a Grid or a row of a Matrix) of a
+    flat buffer, so that container[i][j] indexing keeps working.
+    """
+    __slots__ = ('owner', 'offset', 'length')
+
+    def __init__(self, owner, offset, length):
+        self.owner = owner
+        self.offset = offset
+        self.length = length
+
+    def _index(self, i):
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('index out of range')
+        return self.offset + i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.owner.data[self.offset+k] for k in range(*i.indices(self.length))]
+        return self.owner.data[self._index(i)]
+
+    def __setitem__(self, i, value):
+        self.owner.set_flat(self._index(i), value)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.owner.data[self.offset:self.offset+self.length])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __str__(self):
+        return str(list(self))
+
+    def count(self, value):
+        return self.owner.data[self.offset:self.offset+self.length].count(value)
+
+
+class _FlatContainer:
+    """
+    Base class for 2-dimensional arrays of small integers backed by a flat
+    array.array buffer.
+
+    A digest of the content is updated at every change, so that hashing takes
+    constant time.
+    The buffer can be exported without copies through get_buffer (or the
+    buffer protocol itself, on Python 3.12 or newer) and as_numpy.
+    """
+    __slots__ = ('data', 'digest')
+
+    def _init_data(self, size, value, typecode):
+        self.data = array.array(typecode, [value])*size
+        self.digest = [0] # shared among shallow copies
+        if value != 0:
+            for i in range(size):
+                self.digest[0] ^= _cell_hash(i, value)
+
+    def set_flat(self, index, value):
+        """
+        Stores the given value at the given position of the flat buffer.
+        """
+        old = self.data[index]
+        if old != value:
+            self.data[index] = value
+            self.digest[0] ^= _cell_hash(index, old) ^ _cell_hash(index, value)
+
+    def __eq__(self, other):
+        if other is None or type(other) is not type(self):
+            return False
+        return self.shape() == other.shape() and self.data == other.data
+
+    def __hash__(self):
+        return hash((self.shape(), self.digest[0]))
+
+    def __buffer__(self, flags):
+        return memoryview(self.data)
+
+    def get_buffer(self):
+        """
+        Returns a memoryview of the underlying flat buffer.
+        """
+        return memoryview(self.data)
+
+    def as_numpy(self):
+        """
+        Returns a read-only NumPy view (no copy is made) of this container,
+        shaped according to its indexing.
+        Requires the NumPy library.
+        """
+        import numpy
+        return numpy.frombuffer(memoryview(self.data).toreadonly(), dtype=self.data.typecode).reshape(self.shape())
+
+    def count(self, value):
+        return self.data.count(value)
+
+    def _copy_into(self, other, shallow):
+        if shallow:
+            other.data = self.data
+            other.digest = self.digest
+        else:
+            other.data = self.data[:]
+            other.digest = [self.digest[0]]
+        return other
+
+
+class Matrix(_FlatContainer):
     """
-    A 2-dimensional array of objects backed by a list of lists.
-    Data is accessed via matrix[x][y] where (r,c) denotes the rth row and cth
+    A 2-dimensional array of small integers backed by a flat buffer.
+    Data is accessed via matrix[r][c] where (r,c) denotes the rth row and cth
     column of the matrix.
     """
-    def __init__(self, nrows, ncols, value=None):
+    __slots__ = ('nr', 'nc')
+
+    def __init__(self, nrows, ncols, value=0, typecode='b'):
         """
         Constructs a (nrows x ncols) matrix filled by the given value.
+        The typecode (see the array module) tells the type of the elements.
         """
         self.nr = nrows
-        self.nc = nc
-        self.data = [[value for c in range(ncols)] for y in range(nrows)]
+        self.nc = ncols
+        self._init_data(nrows*ncols, value, typecode)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if i < 0:
+            i += self.nr
+        if i < 0 or i >= self.nr:
+            raise IndexError('row index out of range')
+        return _LineView(self, i*self.nc, self.nc)
 
     def __setitem__(self, r, x):
-        self.data[r] = x
+        row = self[r]
+        for c in range(self.nc):
+            row[c] = x[c]
+
+    def __iter__(self):
+        for r in range(self.nr):
+            yield self[r]
 
     def __str__(self):
-        out = [[str(self.data[r][c])[0] for c in range(self.nc)] for r in range(self.nr)]
+        out = [[str(self.data[r*self.nc+c])[0] for c in range(self.nc)] for r in range(self.nr)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
-    def __eq__(self, other):
-        if other == None:
-            return False
-        return self.data == other.data
-
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return _FlatContainer.__hash__(self)
+
+    def shape(self):
+        return (self.nr, self.nc)
 
     def num_rows(self):
         return self.nr
@@ -83,62 +209,68 @@ class Matrix:
         return self.nr*self.nc
 
     def copy(self):
-        m = Matrix(self.nr, self.nc)
-        m.data = [c[:] for c in self.data]
-        return m
+        m = Matrix.__new__(Matrix)
+        m.nr = self.nr
+        m.nc = self.nc
+        return self._copy_into(m, False)
 
     def deep_copy(self):
         return self.copy()
 
     def shallow_copy(self):
-        m = Matrix(self.nr, self.nc)
-        m.data = self.data
-        return m
-
-    def count(self, value):
-        return sum([x.count(value) for x in self.data])
+        m = Matrix.__new__(Matrix)
+        m.nr = self.nr
+        m.nc = self.nc
+        return self._copy_into(m, True)
 
 
-class Grid:
+class Grid(_FlatContainer):
     """
-    A 2-dimensional array of objects backed by a list of lists.
+    A 2-dimensional array of small integers backed by a flat buffer.
     Data is accessed via grid[x][y] where (x,y) are positions on the game board
     with x horizontal, y vertical and the origin (0,0) in the bottom left
     corner.
+    Columns are contiguous in the buffer.
 
     The __str__ method constructs an output that is oriented like a game board.
     """
-    def __init__(self, width, height, init_value):
+    __slots__ = ('w', 'h')
+
+    def __init__(self, width, height, init_value=0, typecode='b'):
+        """
+        Constructs a (width x height) grid filled by the given value.
+        The typecode (see the array module) tells the type of the elements.
+        """
         self.w = width
         self.h = height
-        self.data = [[init_value for y in range(height)] for x in range(width)]
+        self._init_data(width*height, init_value, typecode)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if i < 0:
+            i += self.w
+        if i < 0 or i >= self.w:
+            raise IndexError('column index out of range')
+        return _LineView(self, i*self.h, self.h)
 
     def __setitem__(self, key, value):
-        self.data[key] = value
+        column = self[key]
+        for y in range(self.h):
+            column[y] = value[y]
+
+    def __iter__(self):
+        for x in range(self.w):
+            yield self[x]
 
     def __str__(self):
-        out = [[str(self.data[x][y]) for y in range(self.height())] for x in range(self.width())]
+        out = [[str(self.data[x*self.h+y]) for y in range(self.height())] for x in range(self.width())]
         #out.reverse()
         return '\n'.join([' '.join(x) for x in out])
 
-    def __eq__(self, other):
-        if other == None:
-            return False
-        return self.data == other.data
-
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return _FlatContainer.__hash__(self)
+
+    def shape(self):
+        return (self.w, self.h)
 
     def height(self):
         return self.h
@@ -150,20 +282,19 @@ class Grid:
         return self.w*self.h
 
     def copy(self):
-        g = Grid(self.w, self.h)
-        g.data = [x[:] for x in self.data]
-        return g
+        g = Grid.__new__(Grid)
+        g.w = self.w
+        g.h = self.h
+        return self._copy_into(g, False)
 
     def deep_copy(self):
         return self.copy()
 
     def shallow_copy(self):
-        g = Grid(self.w, self.h)
-        g.data = self.data
-        return g
-
-    def count(self, value):
-        return sum([x.count(value) for x in self.data])
+        g = Grid.__new__(Grid)
+        g.w = self.w
+        g.h = self.h
+        return self._copy_into(g, True)
 
     def get_cells(self, value):
         """
@@ -172,6 +303,6 @@ class Grid:
         lst = []
         for x in range(self.w):
             for y in range(self.h):
-                if self[x][y] == value:
+                if self.data[x*self.h+y] == value:
                     lst.append((x,y))
         return lst